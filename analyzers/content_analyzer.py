@@ -1,8 +1,17 @@
 import os
 import json
-import re
-from openai import OpenAI
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from . import model_clients
+from . import llm_stream
+from . import llm_cache
+from . import figure_progress
+from . import metrics
+from . import token_budget
+from . import section_index
 import config
+import structured_store
 from prompts import prompts
 
 # 定义一个可选的、推荐的分析框架。这不再是强制性的，而是作为指导。
@@ -10,6 +19,12 @@ DEFAULT_ANALYSIS_SCHEMA = {
     "研究背景": ["研究问题", "研究难点", "相关工作"]
 }
 
+# 超长章节分片生成框架时，合并后最多保留的分析要点数
+MAX_MERGED_ANALYSIS_POINTS = 6
+
+# 各部分分析使用的Prompt模板，与模型名称、原文和相关图表分析一起决定该部分的结果是否仍然有效
+SECTION_PROMPTS = ("SMART_ANALYZE_SECTION_PROMPT", "DEEP_ANALYZE_PROMPT", "MERGE_SECTION_ANALYSIS_PROMPT")
+
 def load_json(file_path, file_description):
     """通用JSON加载函数，文件不存在时返回空字典而不是None。"""
     try:
@@ -24,152 +39,284 @@ def load_json(file_path, file_description):
         print(f"加载{file_description}文件时发生未知错误: {e}")
         return {}
 
-def get_section_content(section_titles, all_sections_data):
-    """
-    根据标题列表，从结构化数据中递归地提取并合并所有相关章节的原文和图片ID。
-    这个版本支持深入子章节进行查找。
-    """
-    content = ""
-    figure_ids = []
-    
-    # 将所有目标标题转换为小写并去除首尾空格，便于匹配
-    target_titles_set = {t.strip().lower() for t in section_titles}
-
-    def recurse_extract(sections):
-        """递归函数，用于遍历所有章节和子章节。"""
-        nonlocal content
-        for section in sections:
-            # 检查当前章节（或子章节）的标题是否在我们的目标列表中
-            current_title_normalized = section.get('title', '').strip().lower()
-            
-            # 使用更宽容的 `in` 匹配，检查目标标题集合中是否有任何一个标题是当前章节标题的子串
-            # 或当前章节标题是目标标题的子串。这提供了双向的灵活性。
-            should_extract = False
-            for target_title in target_titles_set:
-                if target_title in current_title_normalized or current_title_normalized in target_title:
-                    should_extract = True
-                    break
-
-            if should_extract:
-                # 提取文本
-                content += section.get('content', '') + "\n\n"
-                # 提取图片ID
-                if section.get('images'):
-                    for img in section['images']:
-                        figure_ids.append(img.get('id'))
-            
-            # 无论当前章节是否匹配，都必须继续深入其子章节
-            if 'subsections' in section and section['subsections']:
-                recurse_extract(section['subsections'])
-
-    # 从顶层章节开始递归
-    recurse_extract(all_sections_data)
-    
-    return content.strip(), list(set(figure_ids)) # 对图片ID去重
-
-def get_figure_analysis_from_report(figure_ids, report_path):
-    """从完整的图片分析报告中，根据图片ID提取相关的分析内容。"""
-    if not figure_ids:
-        return "本部分不包含图表。"
+def save_json_atomic(data, file_path, file_description):
+    """原子地写入JSON文件：先写临时文件再整体替换，避免中断时留下半截文件。"""
+    tmp_path = f"{file_path}.tmp"
     try:
-        with open(report_path, 'r', encoding='utf-8') as f:
-            full_report = f.read()
-        
-        relevant_analyses = []
-        for fig_id in figure_ids:
-            match = re.search(rf"## {re.escape(fig_id)}\n(.*?)\n---", full_report, re.DOTALL | re.IGNORECASE)
-            if match:
-                relevant_analyses.append(match.group(1).strip())
-        
-        return "\n\n".join(relevant_analyses) if relevant_analyses else "未能从报告中找到指定图表的分析。"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, file_path)
+        return True
+    except (IOError, OSError) as e:
+        print(f"错误: 无法写入{file_description}文件: {e}")
+        return False
+
+def load_figure_index(index_path):
+    """加载图片分析阶段生成的图表索引 {图片ID: {"analysis", "caption", "path"}}，不存在时返回空索引。"""
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
     except FileNotFoundError:
-        return f"警告: 找不到图片分析报告: {report_path}"
-    except Exception as e:
-        return f"读取图片分析报告时出错: {e}"
+        print(f"警告: 找不到图表索引: {index_path}，将不使用图片分析结果。")
+        return {}
+    except json.JSONDecodeError:
+        print(f"警告: 解析图表索引失败: {index_path}，将不使用图片分析结果。")
+        return {}
+
+def get_figure_analysis(figure_ids, figure_index):
+    """根据图片ID从图表索引中取出相关的分析内容。"""
+    if not figure_ids:
+        return "本部分不包含图表。"
+
+    relevant_analyses = []
+    for fig_id in figure_ids:
+        entry = figure_index.get(fig_id)
+        if entry:
+            relevant_analyses.append(
+                f"**{fig_id}**\n\n**原始图注:** {entry.get('caption') or '无'}\n\n"
+                f"### **模型分析结果:**\n\n{entry['analysis']}"
+            )
+
+    return "\n\n".join(relevant_analyses) if relevant_analyses else "未能从报告中找到指定图表的分析。"
+
+def section_input_digest(section_content, figures_analysis):
+    """计算一个部分的分析输入摘要：原文、相关图表分析、Prompt模板与模型名称，任一项变化都需要重新分析。"""
+    parts = [section_content, figures_analysis, config.LLM_MODEL_NAME] + [getattr(prompts, name) for name in SECTION_PROMPTS]
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+# 内容分析同时进行中的模型请求数上限。章节调度线程与其中的分片线程都经由 llm_call 发出请求，
+# 共用这一个额度，避免每个章节各自的分片线程池使请求数成倍增加
+_llm_slots = threading.BoundedSemaphore(max(1, config.LLM_MAX_CONCURRENCY))
 
 def llm_call(client, prompt, response_format={"type": "json_object"}):
-    """封装LLM调用。"""
+    """封装LLM调用（流式接收，避免长回答在生成完成前长时间占用空闲连接）。"""
+    request_kwargs = {
+        "model": config.LLM_MODEL_NAME,
+        "messages": [{"role": "user", "content": prompt}],
+        "response_format": response_format,
+    }
     try:
-        response = client.chat.completions.create(
-            model=config.LLM_MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
-            response_format=response_format
-        )
-        return json.loads(response.choices[0].message.content)
+        with _llm_slots:
+            response_text = llm_stream.stream_completion(client, **request_kwargs)
+        return json.loads(response_text)
+    except json.JSONDecodeError as e:
+        # 无法解析的回答不能留在缓存中，否则重新运行时会一直命中同一条坏回答
+        llm_cache.discard(request_kwargs)
+        print(f"LLM调用失败: 回答不是合法的JSON: {e}")
+        return None
     except Exception as e:
         print(f"LLM调用失败: {e}")
         return None
 
-def analyze_single_section_dynamically(section_name, section_content, figures_analysis, client, log_path):
-    """动态两步式分析单个部分，包含图文信息，并记录IO。"""
-    
-    def log_interaction(step_name, prompt, response):
-        """将单次LLM交互写入日志文件的辅助函数。"""
-        with open(log_path, 'a', encoding='utf-8') as f:
-            f.write(f"--- START: {step_name} for '{section_name}' ---\n")
-            f.write("--- PROMPT SENT TO LLM: ---\n")
-            f.write(prompt)
-            f.write("\n\n--- RESPONSE FROM LLM: ---\n")
-            # 确保即使响应不是合法的JSON也能被记录
-            if isinstance(response, dict) or isinstance(response, list):
-                f.write(json.dumps(response, indent=2, ensure_ascii=False))
-            elif response:
-                f.write(str(response))
-            else:
-                f.write("NO RESPONSE OR ERROR")
-            f.write(f"\n--- END: {step_name} for '{section_name}' ---\n\n\n")
+# 多个章节并发分析时共用同一个日志文件，写入需要串行化
+_log_lock = threading.Lock()
 
+def log_interaction(log_path, section_name, step_name, prompt, response):
+    """将单次LLM交互写入日志文件的辅助函数。"""
+    with _log_lock, open(log_path, 'a', encoding='utf-8') as f:
+        f.write(f"--- START: {step_name} for '{section_name}' ---\n")
+        f.write("--- PROMPT SENT TO LLM: ---\n")
+        f.write(prompt)
+        f.write("\n\n--- RESPONSE FROM LLM: ---\n")
+        # 确保即使响应不是合法的JSON也能被记录
+        if isinstance(response, dict) or isinstance(response, list):
+            f.write(json.dumps(response, indent=2, ensure_ascii=False))
+        elif response:
+            f.write(str(response))
+        else:
+            f.write("NO RESPONSE OR ERROR")
+        f.write(f"\n--- END: {step_name} for '{section_name}' ---\n\n\n")
+
+def map_chunks(func, chunks):
+    """并发地对每个片段执行 func(序号, 片段)，按片段顺序返回结果；实际的请求并发数由 llm_call 的共享额度限制。"""
+    if len(chunks) == 1:
+        return [func(0, chunks[0])]
+    with ThreadPoolExecutor(max_workers=max(1, min(len(chunks), config.LLM_MAX_CONCURRENCY))) as executor:
+        futures = [metrics.submit(executor, func, i, chunk) for i, chunk in enumerate(chunks)]
+        return [future.result() for future in futures]
+
+def merge_analysis_points(points_per_chunk, limit=MAX_MERGED_ANALYSIS_POINTS):
+    """按轮转顺序合并各片段的分析要点并去重，使每个片段都有机会贡献要点。"""
+    merged = []
+    for rank in range(max((len(points) for points in points_per_chunk), default=0)):
+        for points in points_per_chunk:
+            if rank < len(points) and points[rank] not in merged:
+                merged.append(points[rank])
+    return merged[:limit]
+
+def generate_analysis_framework(section_name, section_content, figures_analysis, client, log_path):
+    """
+    步骤1：为单个部分生成分析框架（分析要点列表），失败时返回None。
+    原文超出Prompt预算时，按子章节/段落切分后并发地为每个片段生成要点，再合并。
+    """
     analysis_points = DEFAULT_ANALYSIS_SCHEMA.get(section_name)
 
     # 智能分流：如果存在预设框架，则跳过第一步
     if analysis_points:
         print(f"--- 检测到 '{section_name}' 的预设分析框架，跳过动态生成步骤。 ---")
-    else:
-        # --- 步骤1：生成分析框架 ---
-        print(f"--- 步骤1: 为 '{section_name}' 生成动态分析框架... ---")
-        
+        return analysis_points
+
+    print(f"--- 步骤1: 为 '{section_name}' 生成动态分析框架... ---")
+    chunks = token_budget.plan_prompt_chunks(
+        prompts.SMART_ANALYZE_SECTION_PROMPT, "section_content", section_content,
+        section_name=section_name,
+        related_figures_analysis=figures_analysis
+    )
+    if len(chunks) > 1:
+        print(f"--- '{section_name}' 原文过长，切分为 {len(chunks)} 个片段分别生成分析框架 ---")
+
+    def request_points(i, chunk):
         prompt_step1 = prompts.SMART_ANALYZE_SECTION_PROMPT.format(
             section_name=section_name,
             related_figures_analysis=figures_analysis,
-            section_content=section_content
+            section_content=chunk
         )
         framework_response = llm_call(client, prompt_step1)
-        log_interaction("Step 1: Generate Framework", prompt_step1, framework_response) # 记录交互
+        step_name = "Step 1: Generate Framework" + (f" (chunk {i + 1}/{len(chunks)})" if len(chunks) > 1 else "")
+        log_interaction(log_path, section_name, step_name, prompt_step1, framework_response) # 记录交互
+        if not framework_response or not framework_response.get("analysis_points"):
+            return []
+        return framework_response["analysis_points"]
 
-        if not framework_response or "analysis_points" not in framework_response or not framework_response["analysis_points"]:
-            print(f"警告: 未能为 '{section_name}' 生成有效的分析框架。跳过此部分。")
-            return None
-        
-        analysis_points = framework_response["analysis_points"]
+    points_per_chunk = map_chunks(request_points, chunks)
+    analysis_points = points_per_chunk[0] if len(chunks) == 1 else merge_analysis_points(points_per_chunk)
 
-    print(f"--- '{section_name}' 的分析要点: {analysis_points} ---")
+    if not analysis_points:
+        print(f"警告: 未能为 '{section_name}' 生成有效的分析框架。跳过此部分。")
+        return None
 
-    # --- 步骤2：进行深入分析 ---
+    return analysis_points
+
+def reduce_partial_analyses(section_name, analysis_points, partial_details, client, log_path):
+    """
+    归约步骤：将各片段的分析结果合并为一份 analysis_details。
+    合并Prompt本身超出预算时，先两两分组归约，再归约分组结果；模型调用失败时退回到按要点拼接。
+    """
+    if len(partial_details) == 1:
+        return partial_details[0]
+
+    analysis_points_str = "\n".join([f"- {p}" for p in analysis_points])
+    partial_str = json.dumps(partial_details, indent=2, ensure_ascii=False)
+    prompt = prompts.MERGE_SECTION_ANALYSIS_PROMPT.format(
+        section_name=section_name,
+        analysis_points_str=analysis_points_str,
+        partial_analyses=partial_str
+    )
+    if token_budget.estimate_tokens(prompt) > config.LLM_MAX_PROMPT_TOKENS and len(partial_details) > 2:
+        middle = len(partial_details) // 2
+        halves = map_chunks(
+            lambda i, group: reduce_partial_analyses(section_name, analysis_points, group, client, log_path),
+            [partial_details[:middle], partial_details[middle:]]
+        )
+        return reduce_partial_analyses(section_name, analysis_points, halves, client, log_path)
+
+    response = llm_call(client, prompt)
+    log_interaction(log_path, section_name, f"Step 2: Merge {len(partial_details)} Partial Analyses", prompt, response) # 记录交互
+    if response and isinstance(response.get("analysis_details"), dict):
+        return response["analysis_details"]
+
+    print(f"警告: 合并 '{section_name}' 的分片分析失败，改为按要点拼接。")
+    merged = {}
+    for details in partial_details:
+        for point, detail in details.items():
+            merged[point] = f"{merged[point]}\n\n{detail}" if point in merged else detail
+    return merged
+
+def deep_analyze_section(section_name, section_content, figures_analysis, analysis_points, client, log_path):
+    """
+    步骤2：按分析要点对单个部分进行深入分析，返回 {section_name: analysis_details} 或None。
+    原文超出Prompt预算时，对各片段并发地进行深入分析（map），再由模型合并结果（reduce）。
+    """
+    print(f"--- '{section_name}' 的分析要点: {analysis_points} ---")
     print(f"--- 步骤2: 为 '{section_name}' 进行深入内容分析... ---")
-    prompt_step2 = prompts.DEEP_ANALYZE_PROMPT.format(
+    analysis_points_str = "\n".join([f"- {p}" for p in analysis_points])
+    chunks = token_budget.plan_prompt_chunks(
+        prompts.DEEP_ANALYZE_PROMPT, "section_content", section_content,
         section_name=section_name,
-        analysis_points_str="\n".join([f"- {p}" for p in analysis_points]),
-        related_figures_analysis=figures_analysis,
-        section_content=section_content
+        analysis_points_str=analysis_points_str,
+        related_figures_analysis=figures_analysis
     )
-    deep_analysis_response = llm_call(client, prompt_step2)
-    log_interaction("Step 2: Deep Analysis", prompt_step2, deep_analysis_response) # 记录交互
+    if len(chunks) > 1:
+        print(f"--- '{section_name}' 原文过长，切分为 {len(chunks)} 个片段并行分析后合并 ---")
+
+    def request_details(i, chunk):
+        prompt_step2 = prompts.DEEP_ANALYZE_PROMPT.format(
+            section_name=section_name,
+            analysis_points_str=analysis_points_str,
+            related_figures_analysis=figures_analysis,
+            section_content=chunk
+        )
+        deep_analysis_response = llm_call(client, prompt_step2)
+        step_name = "Step 2: Deep Analysis" + (f" (chunk {i + 1}/{len(chunks)})" if len(chunks) > 1 else "")
+        log_interaction(log_path, section_name, step_name, prompt_step2, deep_analysis_response) # 记录交互
+        if not deep_analysis_response or not isinstance(deep_analysis_response.get("analysis_details"), dict):
+            return None
+        return deep_analysis_response["analysis_details"]
 
-    if not deep_analysis_response or "analysis_details" not in deep_analysis_response:
+    partial_details = [details for details in map_chunks(request_details, chunks) if details is not None]
+    if not partial_details:
         print(f"警告: 未能对 '{section_name}' 进行深入分析。")
         return None
 
+    analysis_details = reduce_partial_analyses(section_name, analysis_points, partial_details, client, log_path)
     print(f"--- '{section_name}' 分析完成 ---")
-    return {section_name: deep_analysis_response["analysis_details"]}
-    
+    return {section_name: analysis_details}
+
+def analyze_single_section_dynamically(section_name, section_content, figures_analysis, client, log_path):
+    """动态两步式分析单个部分，包含图文信息，并记录IO。"""
+    analysis_points = generate_analysis_framework(section_name, section_content, figures_analysis, client, log_path)
+    if not analysis_points:
+        return None
+    return deep_analyze_section(section_name, section_content, figures_analysis, analysis_points, client, log_path)
+
+def run_section_scheduler(section_jobs, client, log_path, on_section_done, max_workers=None, is_current=None):
+    """
+    并发调度所有章节的两步式分析。
+    section_jobs 中每一项为 (章节名, 原文, 图片ID列表, figures_future)，figures_future 在该章节所需图片的
+    分析结果就绪时完成，结果为 {图片ID: 索引条目}；就绪后立即提交该章节的步骤1，步骤1完成后立即提交步骤2，
+    所有章节共享同一个并发额度。is_current(章节名, 原文, 图表分析) 返回 True 的章节已有有效结果，不再分析。
+    on_section_done(章节名, 结果, 原文, 图表分析) 只在调度线程中被调用，因此结果保存天然是串行的。
+    """
+    max_workers = max(1, max_workers or config.LLM_MAX_CONCURRENCY)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        for section_name, section_content, figure_ids, figures_future in section_jobs:
+            pending[figures_future] = ("figures", section_name, section_content, figure_ids)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                step, section_name, section_content, payload = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"错误: 分析 '{section_name}' 时发生异常: {e}")
+                    continue
+
+                if step == "figures":
+                    figures_analysis = get_figure_analysis(payload, result)
+                    # 图表分析在每个分片的Prompt中都会重复出现，限制其最多占用三分之一的预算
+                    figures_analysis = token_budget.truncate_to_tokens(figures_analysis, config.LLM_MAX_PROMPT_TOKENS // 3)
+                    if is_current and is_current(section_name, section_content, figures_analysis):
+                        continue
+                    next_future = metrics.submit(executor, generate_analysis_framework, section_name, section_content, figures_analysis, client, log_path)
+                    pending[next_future] = ("framework", section_name, section_content, figures_analysis)
+                elif step == "framework":
+                    if result:
+                        next_future = metrics.submit(executor, deep_analyze_section, section_name, section_content, payload, result, client, log_path)
+                        pending[next_future] = ("deep", section_name, section_content, payload)
+                elif result:
+                    on_section_done(section_name, result, section_content, payload)
+
 def analyze_paper_content(paper_name):
-    """对论文进行分块内容分析的主流程，并实现分步保存。"""
+    """对论文进行分块内容分析的主流程，各章节并发分析并实现分步保存。"""
     print(f"--- 开始对论文 '{paper_name}' 进行智能图文内容分析 (支持断点续传) ---")
     output_dir = os.path.join('output', paper_name)
     mapping_path = os.path.join(output_dir, 'section_mapping.json')
     data_path = os.path.join(output_dir, 'structured_data.json')
-    image_report_path = os.path.join(output_dir, 'image_analysis.md')
+    figure_index_path = os.path.join(output_dir, 'figure_index.json')
     result_path = os.path.join(output_dir, 'content_analysis.json')
+    inputs_path = os.path.join(output_dir, 'content_analysis.inputs.json')
     log_path = os.path.join(output_dir, 'llm_io_log.txt')
 
     # 在分析开始时清空旧的日志文件，以便于本次运行的调试
@@ -179,44 +326,74 @@ def analyze_paper_content(paper_name):
 
     # 1. 加载所需文件
     section_mapping = load_json(mapping_path, "章节映射")
-    structured_data = load_json(data_path, "结构化数据")
+    structured_data = structured_store.load_structured_data(data_path)
     if not section_mapping or not structured_data:
         print("错误：无法加载章节映射或结构化数据，分析中止。")
         return
 
-    # 尝试加载已有的分析结果，实现断点续传
+    # 图片分析若正在本进程中并发进行，各部分在其所需图片完成后即可开始；否则图表索引只加载一次，各部分按图片ID直接查询
+    figure_index = None
+    figures_in_progress = figure_progress.is_running(paper_name)
+    if figures_in_progress:
+        print("--- 图片分析仍在进行，各部分将在其图片分析完成后立即开始 ---")
+
+    # 尝试加载已有的分析结果，实现断点续传；只有输入摘要与当前输入一致的部分才会被沿用，
+    # 因此图片分析结果、原文、Prompt或模型变化时只重做受影响的部分
     full_analysis = load_json(result_path, "内容分析结果")
+    section_digests = load_json(inputs_path, "内容分析输入摘要")
 
     # 2. 初始化客户端
-    client = OpenAI(api_key=config.LLM_API_KEY, base_url=config.LLM_BASE_URL)
+    client = model_clients.create_llm_client()
 
-    # 3. 逐部分进行分析
-    all_sections_data = structured_data.get('sections', [])
+    # 3. 收集所有待分析的部分
+    # 章节树只索引一次，各部分的原文按标题直接查找
+    sections_index = section_index.build_section_index(structured_data.get('sections', []))
+    section_jobs = []
     for section_name, section_titles in section_mapping.items():
-        # 如果已有分析结果，则跳过
-        if section_name in full_analysis:
-            print(f"--- 已检测到 '{section_name}' 的分析结果，跳过 ---")
-            continue
-
         if not section_titles:
             continue
         
-        section_content, figure_ids = get_section_content(section_titles, all_sections_data)
+        section_content, figure_ids = section_index.get_module_content(sections_index, section_mapping, section_name)
         if not section_content:
             continue
 
-        figures_analysis = get_figure_analysis_from_report(figure_ids, image_report_path)
-            
-        analysis_result = analyze_single_section_dynamically(section_name, section_content, figures_analysis, client, log_path)
-        
-        if analysis_result:
-            full_analysis.update(analysis_result)
-            # 每完成一部分，就立即保存一次
-            print(f"--- 已完成 '{section_name}' 的分析，立即保存进度... ---")
-            try:
-                with open(result_path, 'w', encoding='utf-8') as f:
-                    json.dump(full_analysis, f, indent=4, ensure_ascii=False)
-            except IOError as e:
-                print(f"错误: 无法写入分析文件: {e}")
-
-    print("--- 智能图文内容分析全部完成！ ---") 
\ No newline at end of file
+        figures_future = figure_progress.when_ready(paper_name, figure_ids) if figures_in_progress else None
+        if figures_future is None:
+            if figure_index is None:
+                figure_index = load_figure_index(figure_index_path)
+            figures_future = Future()
+            figures_future.set_result(figure_index)
+        section_jobs.append((section_name, section_content, figure_ids, figures_future))
+
+    # 4. 并发分析各部分（已有有效结果的部分跳过），每完成一部分就原子地保存一次进度
+    def is_current(section_name, section_content, figures_analysis):
+        if section_name in full_analysis and \
+                section_digests.get(section_name) == section_input_digest(section_content, figures_analysis):
+            print(f"--- 已检测到 '{section_name}' 的有效分析结果，跳过 ---")
+            return True
+        if section_name in full_analysis:
+            # 移除过时的结果，避免重新分析失败时下游读到基于旧输入的分析
+            print(f"--- '{section_name}' 的输入已变化，将重新分析 ---")
+            del full_analysis[section_name]
+            save_results()
+        return False
+
+    def save_results():
+        # 按章节映射的顺序写出，保证文件内容与运行时的完成顺序无关
+        ordered = {name: full_analysis[name] for name in section_mapping if name in full_analysis}
+        ordered.update({name: value for name, value in full_analysis.items() if name not in ordered})
+        return save_json_atomic(ordered, result_path, "分析")
+
+    def on_section_done(section_name, analysis_result, section_content, figures_analysis):
+        full_analysis.update(analysis_result)
+        print(f"--- 已完成 '{section_name}' 的分析，立即保存进度... ---")
+        # 先保存结果再登记摘要：两次写入之间中断时，该部分只会被重新分析而不会被误用
+        if save_results():
+            section_digests[section_name] = section_input_digest(section_content, figures_analysis)
+            save_json_atomic(section_digests, inputs_path, "内容分析输入摘要")
+
+    if section_jobs:
+        print(f"--- 共 {len(section_jobs)} 个部分待检查 (并发数: {config.LLM_MAX_CONCURRENCY}) ---")
+        run_section_scheduler(section_jobs, client, log_path, on_section_done, is_current=is_current)
+
+    print("--- 智能图文内容分析全部完成！ ---")
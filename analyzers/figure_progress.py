@@ -0,0 +1,66 @@
+import threading
+from concurrent.futures import Future
+
+# 进程内的逐图进度登记表：图片分析阶段每得到一张图片的最终结果就登记一次，
+# 与之并发运行的内容分析阶段据此在某个部分所需的图片全部完成后立即开始分析该部分。
+# {论文名称: {"done": {图片ID: 索引条目或None(失败)}, "waiters": [(尚未完成的图片ID集合, 图片ID列表, Future)]}}
+_papers = {}
+_lock = threading.Lock()
+
+def start(paper_name):
+    """登记某篇论文的图片分析开始；已在进行中时不做任何事。"""
+    with _lock:
+        _papers.setdefault(paper_name, {"done": {}, "waiters": []})
+
+def is_running(paper_name):
+    with _lock:
+        return paper_name in _papers
+
+def _resolve(state, figure_ids, future):
+    future.set_result({fig_id: state["done"][fig_id] for fig_id in figure_ids
+                       if state["done"].get(fig_id) is not None})
+
+def publish(paper_name, fig_id, entry):
+    """登记一张图片的最终结果（entry 为图表索引条目，失败时为None），并唤醒所需图片已全部完成的等待者。"""
+    ready = []
+    with _lock:
+        state = _papers.get(paper_name)
+        if state is None or fig_id is None or fig_id in state["done"]:
+            return
+        state["done"][fig_id] = entry
+        remaining_waiters = []
+        for missing, figure_ids, future in state["waiters"]:
+            missing.discard(fig_id)
+            if missing:
+                remaining_waiters.append((missing, figure_ids, future))
+            else:
+                ready.append((figure_ids, future))
+        state["waiters"] = remaining_waiters
+        for figure_ids, future in ready:
+            _resolve(state, figure_ids, future)
+
+def finish(paper_name):
+    """登记图片分析结束：唤醒全部剩余的等待者（未登记的图片视为失败），之后的查询改为读取 figure_index.json。"""
+    with _lock:
+        state = _papers.pop(paper_name, None)
+        if state is None:
+            return
+        for _, figure_ids, future in state["waiters"]:
+            _resolve(state, figure_ids, future)
+
+def when_ready(paper_name, figure_ids):
+    """
+    返回一个 Future，在 figure_ids 中的图片全部有最终结果时完成，其结果为 {图片ID: 索引条目}（不含失败的图片）。
+    该论文的图片分析未在本进程中进行时返回None，调用方应直接读取 figure_index.json。
+    """
+    with _lock:
+        state = _papers.get(paper_name)
+        if state is None:
+            return None
+        future = Future()
+        missing = {fig_id for fig_id in figure_ids if fig_id not in state["done"]}
+        if missing:
+            state["waiters"].append((missing, list(figure_ids), future))
+        else:
+            _resolve(state, figure_ids, future)
+        return future
@@ -1,33 +1,21 @@
 import os
 import json
-import base64
-from openai import OpenAI
+import re
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from . import model_clients
+from . import llm_stream
+from . import figure_progress
+from . import metrics
+from . import image_encoder
+from . import token_budget
 import config
+import structured_store
 from prompts import prompts
 
 def load_structured_data(json_path):
-    """从文件中加载结构化的论文数据。"""
-    try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print(f"错误: 找不到结构化数据文件: {json_path}")
-        return None
-    except json.JSONDecodeError:
-        print(f"错误: 解析JSON文件失败: {json_path}")
-        return None
-
-def encode_image_to_base64(image_path):
-    """将图片文件编码为Base64字符串。"""
-    try:
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
-    except FileNotFoundError:
-        print(f"错误: 找不到图片文件: {image_path}")
-        return None
-    except Exception as e:
-        print(f"编码图片时发生错误: {e}")
-        return None
+    """从文件中加载结构化的论文数据（优先读取同目录下的二进制格式，章节正文按需读取）。"""
+    return structured_store.load_structured_data(json_path)
 
 def get_all_images_from_data(structured_data):
     """从结构化数据中递归提取所有图片的信息。"""
@@ -44,20 +32,63 @@ def get_all_images_from_data(structured_data):
         recurse_sections(structured_data['sections'])
     return images
 
+def load_figure_store(store_path):
+    """加载逐图分析结果库，不存在或损坏时返回空库。"""
+    try:
+        with open(store_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError:
+        print(f"警告: 图片分析结果库已损坏，将重新分析全部图片: {store_path}")
+        return {}
+
+def save_json_file(data, file_path, file_description):
+    """原子地写入JSON文件，中断时不会留下半截文件。"""
+    tmp_path = f"{file_path}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, file_path)
+    except (IOError, OSError) as e:
+        print(f"错误: 无法写入{file_description}: {e}")
+
+def build_figure_prompt(image_info):
+    """生成单张图片的分析Prompt。"""
+    return prompts.ANALYZE_FIGURE_PROMPT.format(figure_caption=image_info.get('caption', '无图注'))
+
+def get_figure_key(image_info, image_dir):
+    """
+    逐图结果的键：由图片内容哈希、Prompt（含图注；批量模式下还包括批量分析的Prompt模板）与视觉模型名称共同决定，
+    任一变化都会使该图的已有结果失效。图片文件不存在时返回None。
+    """
+    image_path = os.path.join(image_dir, image_info['new_path'])
+    try:
+        with open(image_path, 'rb') as f:
+            image_hash = hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+    key_source = f"{image_hash}\n{config.VISION_MODEL_NAME}\n{build_figure_prompt(image_info)}"
+    if config.VISION_BATCH_SIZE > 1:
+        key_source += f"\n{prompts.ANALYZE_FIGURES_BATCH_PROMPT}"
+    return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
 def analyze_single_image(image_info, image_dir, llm_client):
-    """使用视觉模型分析单张图片。"""
+    """使用视觉模型分析单张图片，失败时返回None。"""
     image_path = os.path.join(image_dir, image_info['new_path'])
     
     print(f"--- 正在分析图片: {image_path} ---")
     
-    base64_image = encode_image_to_base64(image_path)
-    if not base64_image:
-        return f"无法加载图片: {image_path}"
+    # 缩放并按实际格式重新编码，MIME 类型与图片内容一致
+    image_data_url = image_encoder.encode_image_for_vision(image_path)
+    if not image_data_url:
+        return None
 
-    prompt = prompts.ANALYZE_FIGURE_PROMPT.format(figure_caption=image_info.get('caption', '无图注'))
+    prompt = build_figure_prompt(image_info)
 
     try:
-        completion = llm_client.chat.completions.create(
+        full_response = llm_stream.stream_completion(
+            llm_client,
             model=config.VISION_MODEL_NAME,
             messages=[
                 {
@@ -70,79 +101,270 @@ def analyze_single_image(image_info, image_dir, llm_client):
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
+                                "url": image_data_url
                             },
                         },
                         {"type": "text", "text": prompt},
                     ],
                 }
             ],
-            max_tokens=1024,
-            stream=True
+            max_tokens=1024
         )
-        
-        full_response = ""
-        for chunk in completion:
-            if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
-                full_response += chunk.choices[0].delta.content
-        return full_response
+        return full_response or None
 
     except Exception as e:
         print(f"调用视觉模型API时发生错误: {e}")
-        return f"分析图片时出错: {e}"
+        return None
+
+def plan_figure_batches(indices, all_images, image_dir):
+    """
+    将待分析的图片按原始顺序贪心地分组，每组不超过 VISION_BATCH_SIZE 张，
+    且图片与图注的估算token总数不超过 VISION_BATCH_MAX_TOKENS（单张超出预算的图片单独成组）。
+    """
+    batches, current, current_tokens = [], [], 0
+    for i in indices:
+        image_info = all_images[i]
+        tokens = (image_encoder.estimate_image_tokens(os.path.join(image_dir, image_info['new_path']))
+                  + token_budget.estimate_tokens(image_info.get('caption') or ''))
+        if current and (len(current) >= config.VISION_BATCH_SIZE
+                        or current_tokens + tokens > config.VISION_BATCH_MAX_TOKENS):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def parse_batch_response(text, count):
+    """解析批量分析的JSON回答（容忍 ```json 代码块包裹），返回按编号排列的分析文本列表，缺失的为None。"""
+    match = re.search(r'\{.*\}', text or '', re.DOTALL)
+    if not match:
+        return [None] * count
+    try:
+        figures = json.loads(match.group(0)).get('figures', [])
+    except (json.JSONDecodeError, AttributeError):
+        return [None] * count
+
+    results = [None] * count
+    for position, item in enumerate(figures if isinstance(figures, list) else []):
+        if not isinstance(item, dict) or not isinstance(item.get('analysis'), str) or not item['analysis'].strip():
+            continue
+        index = item.get('index', position + 1)
+        if isinstance(index, int) and 1 <= index <= count and results[index - 1] is None:
+            results[index - 1] = item['analysis'].strip()
+    return results
+
+def analyze_image_batch(image_infos, image_dir, llm_client):
+    """
+    在一次视觉请求中分析多张图片：每张图片前标注编号，图注集中放在Prompt中，要求模型按编号返回JSON。
+    返回与 image_infos 对应的分析文本列表，未能得到结果的图片为None（由调用方逐张重试）。
+    """
+    if len(image_infos) == 1:
+        return [analyze_single_image(image_infos[0], image_dir, llm_client)]
+
+    print(f"--- 正在批量分析 {len(image_infos)} 张图片: {', '.join(str(info.get('id')) for info in image_infos)} ---")
+    content = []
+    captions = []
+    for number, image_info in enumerate(image_infos, start=1):
+        image_data_url = image_encoder.encode_image_for_vision(os.path.join(image_dir, image_info['new_path']))
+        if not image_data_url:
+            return [None] * len(image_infos)
+        content.append({"type": "text", "text": f"[图表 {number}]"})
+        content.append({"type": "image_url", "image_url": {"url": image_data_url}})
+        captions.append(f"- [图表 {number}] {image_info.get('caption', '无图注')}")
+    content.append({"type": "text", "text": prompts.ANALYZE_FIGURES_BATCH_PROMPT.format(
+        figure_count=len(image_infos), figure_captions="\n".join(captions))})
+
+    try:
+        full_response = llm_stream.stream_completion(
+            llm_client,
+            model=config.VISION_MODEL_NAME,
+            messages=[
+                {
+                    "role": "system",
+                    "content": [{"type": "text", "text": "You are a helpful assistant."}]
+                },
+                {"role": "user", "content": content}
+            ],
+            max_tokens=1024 * len(image_infos)
+        )
+    except Exception as e:
+        print(f"调用视觉模型API时发生错误: {e}")
+        return [None] * len(image_infos)
+
+    results = parse_batch_response(full_response, len(image_infos))
+    missing = sum(1 for result in results if result is None)
+    if missing:
+        print(f"警告: 批量分析的回答中缺少 {missing} 张图片的结果，将逐张重试。")
+    return results
+
+def render_image_report(structured_data, all_images, analysis_results,
+                        missing_text="分析图片时出错，重新运行图片分析阶段将只重试失败的图片。"):
+    """按原始图片顺序渲染图片分析报告的 markdown 内容，尚无结果的图片显示 missing_text。"""
+    report_content = f"# 论文《{structured_data.get('paper_title', '未知标题')}》图表分析报告\n\n"
+    if not all_images:
+        report_content += "论文中未找到图片。\n"
+
+    for image_info, analysis_text in zip(all_images, analysis_results):
+        if analysis_text is None:
+            analysis_text = missing_text
+        report_content += f"## {image_info.get('id', '未命名图表')}\n\n"
+        report_content += f"**原始图注:** {image_info.get('caption', '无')}\n\n"
+        report_content += f"![{image_info.get('id')}]({image_info.get('new_path', '')})\n\n"
+        report_content += "### **模型分析结果:**\n\n"
+        report_content += f"{analysis_text}\n\n"
+        report_content += "---\n\n"
+    return report_content
+
+def make_index_entry(image_info, analysis_text):
+    """图表索引中单张图片的条目。"""
+    return {
+        "analysis": analysis_text,
+        "caption": image_info.get('caption'),
+        "path": image_info.get('new_path'),
+    }
+
+def build_figure_index(all_images, analysis_results):
+    """
+    生成供后续阶段按图片ID直接查询的图表索引：{图片ID: {"analysis", "caption", "path"}}。
+    分析失败的图片不进入索引；ID重复时保留第一个。
+    """
+    figure_index = {}
+    for image_info, analysis_text in zip(all_images, analysis_results):
+        fig_id = image_info.get('id')
+        if fig_id is None or analysis_text is None or fig_id in figure_index:
+            continue
+        figure_index[fig_id] = make_index_entry(image_info, analysis_text)
+    return figure_index
 
 def analyze_paper_images(paper_name):
     """
-    为一篇论文生成完整的图片分析报告。
+    为一篇论文生成完整的图片分析报告（见 _analyze_paper_images）。
+    分析期间每张图片的最终结果都会登记到 figure_progress，使并发运行的内容分析可以逐部分提前开始。
+    """
+    figure_progress.start(paper_name)
+    try:
+        return _analyze_paper_images(paper_name)
+    finally:
+        figure_progress.finish(paper_name)
+
+def publish_figure(paper_name, image_info, analysis_text):
+    """将单张图片的最终结果登记到逐图进度表。"""
+    figure_progress.publish(paper_name, image_info.get('id'),
+                            None if analysis_text is None else make_index_entry(image_info, analysis_text))
+
+def _analyze_paper_images(paper_name):
+    """
+    为一篇论文生成完整的图片分析报告，支持增量分析。
+    每张图片的分析结果在完成后立即写入 image_analysis.json（以图片内容哈希 + Prompt + 模型名称为键），
+    再次运行时只分析新增或发生变化的图片，中途崩溃只会丢失正在进行中的分析。
+    报告与供内容分析查询的图表索引 figure_index.json 均由结果库生成。存在分析失败的图片时返回 False，失败结果不会写入结果库。
     """
     print(f"--- 开始为论文 '{paper_name}' 生成图片分析报告 ---")
     output_dir = os.path.join('output', paper_name)
     structured_data_path = os.path.join(output_dir, 'structured_data.json')
     report_path = os.path.join(output_dir, 'image_analysis.md')
+    store_path = os.path.join(output_dir, 'image_analysis.json')
+    index_path = os.path.join(output_dir, 'figure_index.json')
     image_dir = os.path.join(output_dir) # 图片的相对路径从这里开始
 
     # 1. 加载数据
     structured_data = load_structured_data(structured_data_path)
     if not structured_data:
         print("分析中止，因为无法加载结构化数据。")
-        return
+        return False
 
     all_images = get_all_images_from_data(structured_data)
     if not all_images:
-        print("论文中未找到图片，无需生成报告。")
-        return
-
-    # 2. 初始化LLM客户端
-    if not config.VISION_API_KEY or "YOUR_" in config.VISION_API_KEY:
-        print("错误: VISION_API_KEY 未在 .env 文件中配置。")
-        return
-        
-    client = OpenAI(
-        api_key=config.VISION_API_KEY,
-        base_url=config.VISION_BASE_URL,
-    )
-
-    # 3. 分析所有图片并生成报告内容
-    report_content = f"# 论文《{structured_data.get('paper_title', '未知标题')}》图表分析报告\n\n"
-    
+        # 仍然生成（空的）报告与图表索引，后续阶段据此判断图片分析已完成
+        print("论文中未找到图片，将生成空的图片分析报告。")
+
+    # 2. 从结果库中取出已分析过的图片，只保留当前图片仍在使用的条目
+    old_store = load_figure_store(store_path)
+    figure_keys = [get_figure_key(image_info, image_dir) for image_info in all_images]
+    store = {key: old_store[key] for key in figure_keys if key in old_store}
+    analysis_results = [store[key]["analysis"] if key in store else None for key in figure_keys]
+    pending = [i for i, key in enumerate(figure_keys) if key not in store]
+    if len(store) != len(old_store):
+        save_json_file(store, store_path, "图片分析结果库")
+    for image_info, analysis_text in zip(all_images, analysis_results):
+        if analysis_text is not None:
+            publish_figure(paper_name, image_info, analysis_text)
+
     total_images = len(all_images)
-    print(f"--- 发现 {total_images} 张图片，开始逐一分析 ---")
+    # 分析期间的报告预览写入 image_analysis.partial.md，image_analysis.md 只在最后完整写入
+    live_report = llm_stream.LiveMarkdownFile(report_path)
+    if pending:
+        # 3. 初始化LLM客户端
+        if not config.VISION_API_KEY or "YOUR_" in config.VISION_API_KEY:
+            print("错误: VISION_API_KEY 未在 .env 文件中配置。")
+            return False
 
-    for i, image_info in enumerate(all_images):
-        print(f"--- 正在处理图片 {i+1}/{total_images} ---")
-        analysis_text = analyze_single_image(image_info, image_dir, client)
-        
-        report_content += f"## {image_info.get('id', '未命名图表')}\n\n"
-        report_content += f"**原始图注:** {image_info.get('caption', '无')}\n\n"
-        report_content += f"![{image_info.get('id')}]({image_info.get('new_path', '')})\n\n"
-        report_content += f"### **模型分析结果:**\n\n"
-        report_content += f"{analysis_text}\n\n"
-        report_content += "---\n\n"
+        client = model_clients.create_vision_client()
 
-    # 4. 保存报告
+        # 4. 并发分析尚无结果的图片（批量模式下多张图片共用一次请求），每完成一张就写入结果库
+        batches = plan_figure_batches(pending, all_images, image_dir) if config.VISION_BATCH_SIZE > 1 \
+            else [[i] for i in pending]
+        max_workers = max(1, min(config.VISION_MAX_CONCURRENCY, len(batches)))
+        print(f"--- 发现 {total_images} 张图片，其中 {total_images - len(pending)} 张已有分析结果，"
+              f"开始分析其余 {len(pending)} 张，共 {len(batches)} 个请求 (并发数: {max_workers}) ---")
+
+        def record_result(i, analysis_text):
+            analysis_results[i] = analysis_text
+            publish_figure(paper_name, all_images[i], analysis_text)
+            if analysis_text is not None and figure_keys[i] is not None:
+                image_info = all_images[i]
+                store[figure_keys[i]] = {
+                    "id": image_info.get('id'),
+                    "caption": image_info.get('caption'),
+                    "path": image_info.get('new_path'),
+                    "model": config.VISION_MODEL_NAME,
+                    "analysis": analysis_text,
+                }
+                save_json_file(store, store_path, "图片分析结果库")
+            # 每完成一张图片就刷新一次报告预览，无需等待全部图片分析完成
+            live_report.update(render_image_report(structured_data, all_images, analysis_results,
+                                                   missing_text="⏳ 正在分析中..."))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running = {
+                metrics.submit(executor, analyze_image_batch, [all_images[i] for i in batch], image_dir, client): batch
+                for batch in batches
+            }
+            completed = 0
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = running.pop(future)
+                    try:
+                        batch_results = future.result()
+                    except Exception as e:
+                        print(f"分析图片时出错: {e}")
+                        batch_results = [None] * len(batch)
+                    for i, analysis_text in zip(batch, batch_results):
+                        if analysis_text is None and len(batch) > 1:
+                            # 批量回答中缺失的图片单独重试一次
+                            running[metrics.submit(executor, analyze_image_batch, [all_images[i]], image_dir, client)] = [i]
+                            continue
+                        record_result(i, analysis_text)
+                        completed += 1
+                        print(f"--- 已完成图片 {completed}/{len(pending)}: {all_images[i].get('id', '未命名图表')} ---")
+    elif all_images:
+        print(f"--- 全部 {total_images} 张图片均已有分析结果，直接生成报告 ---")
+
+    # 5. 由结果库按原始顺序生成报告与图表索引并保存
+    save_json_file(build_figure_index(all_images, analysis_results), index_path, "图表索引")
+    report_content = render_image_report(structured_data, all_images, analysis_results)
     try:
-        with open(report_path, 'w', encoding='utf-8') as f:
-            f.write(report_content)
+        live_report.commit(report_content)
         print(f"--- 图片分析报告已生成: {report_path} ---")
     except IOError as e:
-        print(f"错误: 无法写入报告文件: {e}") 
\ No newline at end of file
+        print(f"错误: 无法写入报告文件: {e}")
+        return False
+
+    failed = sum(1 for result in analysis_results if result is None)
+    if failed:
+        print(f"警告: {failed} 张图片分析失败，重新运行时将只重试这些图片。")
+        return False
+    return True
@@ -0,0 +1,175 @@
+import io
+import os
+import base64
+import hashlib
+import mimetypes
+import config
+
+# Pillow 为可选依赖：未安装时按原文件上传，但仍会标注正确的 MIME 类型
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# 文件头魔数 -> MIME 类型
+_MAGIC_MIME_TYPES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+]
+
+_PIL_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+    'webp': ('WEBP', 'image/webp'),
+}
+
+# 视觉模型普遍支持、无需转换即可直接上传的格式
+_UPLOADABLE_MIME_TYPES = {'image/png', 'image/jpeg', 'image/webp', 'image/gif'}
+
+def sniff_mime_type(data, image_path=''):
+    """根据文件头判断图片的 MIME 类型，无法识别时按扩展名猜测。"""
+    for magic, mime_type in _MAGIC_MIME_TYPES:
+        if data.startswith(magic):
+            return mime_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return mimetypes.guess_type(image_path)[0] or 'image/jpeg'
+
+# auto 模式下，出现最多的 _DOMINANT_COLORS 种颜色覆盖了不少于 _DOMINANT_SHARE 的像素，即视为示意图/曲线图
+_DOMINANT_COLORS = 16
+_DOMINANT_SHARE = 0.8
+
+def _choose_format(image):
+    """
+    auto 模式：带透明通道或颜色很少的图（多为示意图、曲线图）用PNG调色板编码，线条与文字不会出现压缩噪点；
+    其余（照片、热力图等）用JPEG。需在缩放前判断，缩放的抗锯齿会引入大量过渡色。
+    """
+    if config.VISION_IMAGE_FORMAT in _PIL_FORMATS:
+        return config.VISION_IMAGE_FORMAT
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    if has_alpha:
+        return 'png'
+    # 在最近邻缩小的样本上统计颜色分布，不引入新的颜色
+    sample = image.convert('RGB').resize((min(image.width, 256), min(image.height, 256)), Image.NEAREST)
+    counts = sorted((count for count, _ in sample.getcolors(sample.width * sample.height)), reverse=True)
+    if sum(counts[:_DOMINANT_COLORS]) >= _DOMINANT_SHARE * sample.width * sample.height:
+        return 'png'
+    return 'jpeg'
+
+def _reencode(data, original_mime_type):
+    """缩放并重新编码图片，返回 (图片字节, MIME 类型)；重新编码没有收益时返回原文件。"""
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    target = _choose_format(image)
+    resized = False
+    if config.VISION_MAX_PIXELS > 0 and image.width * image.height > config.VISION_MAX_PIXELS:
+        scale = (config.VISION_MAX_PIXELS / (image.width * image.height)) ** 0.5
+        size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+        if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        image = image.resize(size, Image.LANCZOS)
+        resized = True
+
+    pil_format, mime_type = _PIL_FORMATS[target]
+    if target == 'jpeg':
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # JPEG 不支持透明通道，合成到白色背景上
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        save_kwargs = {'quality': config.VISION_JPEG_QUALITY, 'optimize': True}
+    elif target == 'png':
+        if image.mode in ('RGB', 'L'):
+            # 缩放引入的过渡色量化到256色调色板，体积通常只有真彩色PNG的几分之一
+            image = image.convert('RGB').convert('P', palette=Image.ADAPTIVE, colors=256)
+        save_kwargs = {'optimize': True}
+    else:
+        save_kwargs = {'quality': config.VISION_JPEG_QUALITY}
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=pil_format, **save_kwargs)
+    encoded = buffer.getvalue()
+    if not resized and len(encoded) >= len(data) and original_mime_type in _UPLOADABLE_MIME_TYPES:
+        return data, original_mime_type
+    return encoded, mime_type
+
+# 视觉模型大致按 28×28 像素的图块计算图片token
+_PIXELS_PER_TOKEN = 28 * 28
+
+def estimate_image_tokens(image_path):
+    """估算图片上传后占用的输入token数：按缩放后的像素数计算，无法读取尺寸时按像素上限估算。"""
+    max_pixels = config.VISION_MAX_PIXELS if config.VISION_MAX_PIXELS > 0 else 1024 * 1024
+    pixels = max_pixels
+    if Image is not None:
+        try:
+            with Image.open(image_path) as image:  # 只读取文件头
+                pixels = min(image.width * image.height, max_pixels) if config.VISION_MAX_PIXELS > 0 \
+                    else image.width * image.height
+        except Exception:
+            pass
+    return pixels // _PIXELS_PER_TOKEN + 1
+
+def estimate_data_url_tokens(data_url):
+    """估算以 data URL 上传的图片占用的输入token数（按实际上传的像素数），无法读取尺寸（如未安装 Pillow）时返回None。"""
+    if Image is None or not data_url.startswith('data:') or ',' not in data_url:
+        return None
+    try:
+        with Image.open(io.BytesIO(base64.b64decode(data_url.split(',', 1)[1]))) as image:
+            return image.width * image.height // _PIXELS_PER_TOKEN + 1
+    except Exception:
+        return None
+
+def _cache_path(data):
+    settings = f"{config.VISION_MAX_PIXELS}|{config.VISION_IMAGE_FORMAT}|{config.VISION_JPEG_QUALITY}"
+    key = hashlib.sha256(data + settings.encode('utf-8')).hexdigest()
+    return os.path.join(config.VISION_IMAGE_CACHE_DIR, key[:2], f"{key}.txt")
+
+def encode_image_for_vision(image_path):
+    """
+    读取图片并生成上传给视觉模型的 data URL：超过 VISION_MAX_PIXELS 时等比缩小，
+    按 VISION_IMAGE_FORMAT 重新编码并标注对应的 MIME 类型。
+    结果按图片内容与编码设置的哈希缓存在磁盘上。失败时返回None。
+    """
+    try:
+        with open(image_path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        print(f"错误: 找不到图片文件: {image_path}")
+        return None
+    except OSError as e:
+        print(f"读取图片时发生错误: {e}")
+        return None
+
+    original_mime_type = sniff_mime_type(data, image_path)
+    if Image is None or config.VISION_IMAGE_FORMAT == 'original':
+        return f"data:{original_mime_type};base64,{base64.b64encode(data).decode('utf-8')}"
+
+    cache_path = _cache_path(data)
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        pass
+
+    try:
+        encoded, mime_type = _reencode(data, original_mime_type)
+    except Exception as e:
+        print(f"警告: 无法重新编码图片 {image_path}，将上传原文件: {e}")
+        encoded, mime_type = data, original_mime_type
+    data_url = f"data:{mime_type};base64,{base64.b64encode(encoded).decode('utf-8')}"
+
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data_url)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"警告: 无法写入图片编码缓存: {e}")
+    return data_url
@@ -1,8 +1,11 @@
 import os
 import json
-from openai import OpenAI
 from . import content_analyzer # 复用内容分析器中的函数
+from . import model_clients
+from . import llm_stream
+from . import section_index
 import config
+import structured_store
 from prompts import prompts
 
 def analyze_paper_insight(paper_name):
@@ -33,7 +36,7 @@ def analyze_paper_insight(paper_name):
         print(f"警告: 找不到图片分析报告: {image_report_path}。分析将继续，但缺少图片信息。")
         image_analysis = "无图片分析报告。"
 
-    structured_data = content_analyzer.load_json(structured_data_path, "结构化数据")
+    structured_data = structured_store.load_structured_data(structured_data_path)
     section_mapping = content_analyzer.load_json(mapping_path, "章节映射")
     if not structured_data or not section_mapping:
         print("错误: 无法加载结构化数据或章节映射，无法提取引言和结论。")
@@ -41,13 +44,10 @@ def analyze_paper_insight(paper_name):
 
     # 2. 提取引言和结论的原文
     print("--- 正在提取引言和结论的原文... ---")
-    all_sections_data = structured_data.get('sections', [])
-    
-    intro_titles = section_mapping.get("研究背景", [])
-    conclusion_titles = section_mapping.get("总体结论", [])
+    sections_index = section_index.build_section_index(structured_data.get('sections', []))
 
-    introduction_text, _ = content_analyzer.get_section_content(intro_titles, all_sections_data)
-    conclusion_text, _ = content_analyzer.get_section_content(conclusion_titles, all_sections_data)
+    introduction_text, _ = section_index.get_module_content(sections_index, section_mapping, "研究背景")
+    conclusion_text, _ = section_index.get_module_content(sections_index, section_mapping, "总体结论")
 
     if not introduction_text:
         print("警告: 未能提取到引言部分的原文。")
@@ -64,27 +64,31 @@ def analyze_paper_insight(paper_name):
         conclusion_text=conclusion_text or "未能提取到结论。"
     )
 
-    # 4. 调用LLM
-    print("--- 正在调用大模型进行最终分析，请稍候... ---")
-    client = OpenAI(api_key=config.LLM_API_KEY, base_url=config.LLM_BASE_URL)
-    
+    # 4. 流式调用LLM，生成过程中实时写入预览文件，完成后再写入 insights.md
+    insights_path = result_path.replace('.json', '.md')
+    client = model_clients.create_llm_client()
+    live_file = llm_stream.LiveMarkdownFile(insights_path)
+    print(f"--- 正在调用大模型进行最终分析，生成内容会实时写入 {live_file.preview_path} ... ---")
+
     try:
-        response = client.chat.completions.create(
+        final_insights_content = llm_stream.stream_completion(
+            client,
+            on_update=live_file.update,
             model=config.LLM_MODEL_NAME,
             messages=[{"role": "user", "content": prompt}],
             # 注意：这个Prompt的输出是Markdown，所以不使用json_object模式
         )
-        final_insights_content = response.choices[0].message.content
     except Exception as e:
         print(f"LLM调用失败: {e}")
+        live_file.discard()
         return
 
     # 5. 保存结果
     print(f"--- 正在保存最终分析报告... ---")
-    # 直接保存Markdown文本
+    # 直接保存Markdown文本，并删除带"生成中"提示的预览
     try:
-        with open(result_path.replace('.json', '.md'), 'w', encoding='utf-8') as f:
-            f.write(final_insights_content)
-        print(f"--- 全局分析报告已生成: {result_path.replace('.json', '.md')} ---")
+        live_file.commit(final_insights_content)
+        print(f"--- 全局分析报告已生成: {insights_path} ---")
     except IOError as e:
-        print(f"错误: 无法写入最终分析报告: {e}") 
\ No newline at end of file
+        print(f"错误: 无法写入最终分析报告: {e}")
+        live_file.discard()
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+from types import SimpleNamespace
+import config
+from . import metrics
+
+# 缓存键只取决于真正影响模型输出的请求参数；stream 与 stream_options 只影响传输方式，不参与计算
+_NON_KEY_ARGS = {"stream", "stream_options", "timeout", "extra_headers"}
+
+def make_cache_key(request_kwargs):
+    """
+    根据请求参数计算内容寻址的缓存键。
+    消息中内嵌的 Base64 图片数据同样参与哈希，因此图片内容变化会自然导致缓存失效。
+    """
+    key_material = {k: v for k, v in request_kwargs.items() if k not in _NON_KEY_ARGS}
+    serialized = json.dumps(key_material, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+class LLMCache:
+    """
+    基于 SQLite 的持久化模型响应缓存，支持过期时间(TTL)与按总大小的LRU淘汰。
+    每次操作都使用独立连接，可同时被多个线程或进程安全地访问。
+    """
+
+    def __init__(self, cache_dir, ttl_seconds, max_bytes):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, 'llm_cache.sqlite')
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed_at ON responses(accessed_at)")
+
+    @contextmanager
+    def _connect(self):
+        """打开一个连接：代码块正常结束时提交、出错时回滚，最后总是关闭连接。"""
+        with closing(sqlite3.connect(self.db_path, timeout=30)) as conn:
+            with conn:
+                yield conn
+
+    def get(self, key):
+        """读取缓存，未命中或已过期时返回None。命中时刷新最近访问时间。"""
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if not row:
+                    return None
+                value, created_at = row
+                if self.ttl_seconds > 0 and now - created_at > self.ttl_seconds:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    return None
+                conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            return json.loads(value)
+        except (sqlite3.Error, json.JSONDecodeError) as e:
+            print(f"警告: 读取LLM缓存失败: {e}")
+            return None
+
+    def set(self, key, value):
+        """写入缓存，并按需清理过期条目与超出容量的最久未使用条目。"""
+        now = time.time()
+        serialized = json.dumps(value, ensure_ascii=False)
+        size = len(serialized.encode('utf-8'))
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, serialized, size, now, now)
+                )
+                if self.ttl_seconds > 0:
+                    conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+                self._evict(conn)
+        except sqlite3.Error as e:
+            print(f"警告: 写入LLM缓存失败: {e}")
+
+    def delete(self, key):
+        """删除一条缓存（例如回答被调用方判定为不可用时）。"""
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            print(f"警告: 删除LLM缓存失败: {e}")
+
+    def _evict(self, conn):
+        """按最近访问时间从旧到新删除条目，直到总大小不超过上限。"""
+        if self.max_bytes <= 0:
+            return
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale_keys = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC"):
+            if total <= self.max_bytes:
+                break
+            stale_keys.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+
+def _usage_to_dict(usage):
+    if usage is None:
+        return None
+    if hasattr(usage, 'model_dump'):
+        return usage.model_dump()
+    return dict(usage) if isinstance(usage, dict) else None
+
+def _make_completion(content, usage=None):
+    """构造与 OpenAI 非流式响应结构一致的对象。"""
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+        usage=SimpleNamespace(**usage) if usage else None,
+        cache_hit=True,
+    )
+
+def _make_stream(content):
+    """构造与 OpenAI 流式响应结构一致的迭代器（整段内容作为一个分块返回）。"""
+    yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason="stop")])
+
+class _CachedCompletions:
+    """包装 client.chat.completions，先查缓存，未命中时才真正调用模型并回写。"""
+
+    def __init__(self, completions, cache):
+        self._completions = completions
+        self._cache = cache
+
+    def create(self, **kwargs):
+        key = make_cache_key(kwargs)
+        cached = self._cache.get(key)
+        if cached is not None:
+            hit = metrics.CallMetrics(kwargs, cache_hit=True)
+            hit.output_parts.append(cached['content'])
+            hit.finish()
+            if kwargs.get('stream'):
+                return _make_stream(cached['content'])
+            return _make_completion(cached['content'], cached.get('usage'))
+
+        response = self._completions.create(**kwargs)
+        if kwargs.get('stream'):
+            return self._record_stream(key, response)
+
+        # 只缓存正常结束的回答；因 max_tokens 截断(length)或被过滤的回答不应在下次运行时被原样复用
+        choice = response.choices[0] if response.choices else None
+        content = choice.message.content if choice else None
+        if content and choice.finish_reason == "stop":
+            self._cache.set(key, {"content": content, "usage": _usage_to_dict(getattr(response, 'usage', None))})
+        return response
+
+    def _record_stream(self, key, stream):
+        """透传流式分块，并在流完整且正常结束(finish_reason 为 stop)后把拼接好的内容写入缓存。"""
+        parts = []
+        usage = None
+        finish_reason = None
+        for chunk in stream:
+            usage = getattr(chunk, 'usage', None) or usage
+            if chunk.choices:
+                finish_reason = getattr(chunk.choices[0], 'finish_reason', None) or finish_reason
+                if chunk.choices[0].delta and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+            yield chunk
+        if parts and finish_reason == "stop":
+            self._cache.set(key, {"content": "".join(parts), "usage": _usage_to_dict(usage)})
+
+class CachedClient:
+    """
+    OpenAI 客户端的透明包装：chat.completions.create 走缓存，其余属性原样转发。
+    """
+
+    def __init__(self, client, cache):
+        self._client = client
+        self.chat = SimpleNamespace(completions=_CachedCompletions(client.chat.completions, cache))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_shared_cache():
+    """返回进程内共享的缓存实例，未启用缓存时返回None。"""
+    global _shared_cache
+    if not config.LLM_CACHE_ENABLED:
+        return None
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = LLMCache(
+                config.LLM_CACHE_DIR,
+                ttl_seconds=config.LLM_CACHE_TTL_SECONDS,
+                max_bytes=config.LLM_CACHE_MAX_MB * 1024 * 1024,
+            )
+    return _shared_cache
+
+def discard(request_kwargs):
+    """
+    删除某次请求对应的缓存条目。调用方发现回答不可用（如无法解析为JSON）时调用，
+    以免下次运行直接命中这条坏回答；request_kwargs 与发起请求时传入的参数相同。
+    """
+    cache = get_shared_cache()
+    if cache is not None:
+        cache.delete(make_cache_key(request_kwargs))
+
+def wrap_client(client):
+    """为客户端加上响应缓存；缓存被禁用时原样返回。"""
+    cache = get_shared_cache()
+    if cache is None:
+        return client
+    return CachedClient(client, cache)
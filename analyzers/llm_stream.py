@@ -0,0 +1,71 @@
+import os
+import time
+import config
+
+# 实时预览写入的 markdown 文件末尾附带的提示，生成完成后的最终文件中不包含该提示
+PARTIAL_MARKER = "\n\n> ⏳ 内容生成中，本文件会随模型输出实时更新...\n"
+
+def iter_completion_text(client, **request_kwargs):
+    """
+    以流式方式调用 chat.completions.create，按到达顺序逐段产出模型生成的文本。
+    启用 LLM_STREAM_INCLUDE_USAGE 时要求服务端在末尾分块中返回 usage，供调用计量使用。
+    """
+    if config.LLM_STREAM_INCLUDE_USAGE:
+        request_kwargs.setdefault("stream_options", {"include_usage": True})
+    stream = client.chat.completions.create(stream=True, **request_kwargs)
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def stream_completion(client, on_update=None, **request_kwargs):
+    """
+    流式调用模型并返回完整文本。文本片段先收集在列表中，最后一次性拼接；
+    提供 on_update 时，每隔 LLM_STREAM_UPDATE_INTERVAL 秒以当前已生成的文本调用一次，用于实时预览。
+    调用出错时异常照常抛出，由调用方决定如何处理。
+    """
+    pieces = []
+    last_update = time.monotonic()
+    for piece in iter_completion_text(client, **request_kwargs):
+        pieces.append(piece)
+        if on_update and time.monotonic() - last_update >= config.LLM_STREAM_UPDATE_INTERVAL:
+            on_update("".join(pieces))
+            last_update = time.monotonic()
+    return "".join(pieces)
+
+def write_text_atomic(path, text):
+    """原子地写入文本文件：读者要么看到旧内容，要么看到完整的新内容。"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def partial_path_for(path):
+    """实时预览文件的路径：<产物>.partial.md，与产物位于同一目录。"""
+    return os.path.splitext(path)[0] + '.partial.md'
+
+class LiveMarkdownFile:
+    """
+    将生成中的内容实时写入预览文件 <产物>.partial.md（末尾附带"生成中"提示），便于在模型输出完成前就开始阅读。
+    产物本身只在生成完成后由 commit() 原子地写入，中途崩溃不会留下被当作产物的半成品；
+    生成失败时调用 discard() 删除预览。
+    """
+
+    def __init__(self, path, header=""):
+        self.path = path
+        self.preview_path = partial_path_for(path)
+        self.header = header
+
+    def update(self, partial_text):
+        try:
+            write_text_atomic(self.preview_path, self.header + partial_text + PARTIAL_MARKER)
+        except OSError as e:
+            print(f"警告: 无法写入实时预览 {self.preview_path}: {e}")
+
+    def commit(self, text):
+        """原子地写入最终产物并删除预览。写入失败时抛出 OSError，预览保留。"""
+        write_text_atomic(self.path, text)
+        self.discard()
+
+    def discard(self):
+        if os.path.exists(self.preview_path):
+            os.remove(self.preview_path)
@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+import config
+from . import token_budget
+from . import image_encoder
+
+# 当前所在的论文与阶段 (论文名称, 阶段名称, 阶段汇总, 汇总的锁)。asyncio.to_thread 会自动复制上下文，
+# 普通线程池中的任务需通过 submit() 提交，其模型调用才会记入所属的论文与阶段。
+_scope = contextvars.ContextVar("metrics_scope", default=None)
+_write_lock = threading.Lock()
+
+# 阶段汇总中逐次调用累加的字段
+_CALL_TOTAL_FIELDS = ("calls", "cache_hits", "retries", "errors", "prompt_tokens", "completion_tokens",
+                      "images_unestimated", "bytes_sent", "call_time", "call_queue_wait")
+
+def submit(executor, func, *args):
+    """向线程池提交任务，任务在调用方的 contextvars 上下文（所属论文与阶段）中运行。"""
+    return executor.submit(contextvars.copy_context().run, func, *args)
+
+def metrics_path(paper_name):
+    return os.path.join('output', paper_name, config.METRICS_FILE)
+
+def _append(paper_name, record):
+    if not config.METRICS_ENABLED or not paper_name:
+        return
+    path = metrics_path(paper_name)
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    try:
+        with _write_lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line)
+    except OSError as e:
+        print(f"警告: 无法写入性能记录 {path}: {e}")
+
+@contextmanager
+def stage_scope(paper_name, stage_name, queued_at=None):
+    """
+    计量一个阶段：期间发起的模型调用都记入该阶段，结束时向 output/<论文>/metrics.jsonl 写入一条阶段记录。
+    queued_at 为该阶段依赖就绪的时刻（time.monotonic()），到真正开始执行之间的时间记为排队等待。
+    产出的字典中可设置 status（fresh/success/incomplete/failed）。
+    """
+    started = time.monotonic()
+    totals = {field: 0 for field in _CALL_TOTAL_FIELDS}
+    totals_lock = threading.Lock()
+    record = {"type": "stage", "paper": paper_name, "stage": stage_name, "started_at": time.time(),
+              "status": "failed"}
+    token = _scope.set((paper_name, stage_name, totals, totals_lock))
+    try:
+        yield record
+    finally:
+        _scope.reset(token)
+        with totals_lock:
+            record.update(
+                wall_time=round(time.monotonic() - started, 3),
+                queue_wait=round(started - queued_at, 3) if queued_at is not None else 0.0,
+                **{field: round(value, 3) if isinstance(value, float) else value for field, value in totals.items()},
+            )
+        _append(paper_name, record)
+
+def _request_bytes(request_kwargs):
+    """请求体中消息部分的大小（字节），图片以 data URL 内嵌其中。"""
+    return len(json.dumps(request_kwargs.get("messages", []), ensure_ascii=False).encode('utf-8'))
+
+def _prompt_text(request_kwargs):
+    texts = []
+    for message in request_kwargs.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        else:
+            texts.extend(part.get("text", "") for part in content or [] if part.get("type") == "text")
+    return "\n".join(texts)
+
+def _image_urls(request_kwargs):
+    urls = []
+    for message in request_kwargs.get("messages", []):
+        content = message.get("content")
+        if not isinstance(content, str):
+            urls.extend((part.get("image_url") or {}).get("url", "")
+                        for part in content or [] if part.get("type") == "image_url")
+    return urls
+
+def _estimate_prompt_tokens(request_kwargs):
+    """估算输入token数：文本按分词估算，图片按上传的像素数估算。返回 (token数, 无法估算的图片数)。"""
+    tokens = token_budget.estimate_tokens(_prompt_text(request_kwargs))
+    missing = 0
+    for url in _image_urls(request_kwargs):
+        image_tokens = image_encoder.estimate_data_url_tokens(url)
+        if image_tokens is None:
+            missing += 1
+        else:
+            tokens += image_tokens
+    return tokens, missing
+
+class CallMetrics:
+    """
+    一次模型调用的计量：由 model_clients / llm_cache 在请求前创建，请求结束（流式响应读取完毕）时调用 finish()。
+    服务端返回 usage 时以其为准，否则按文本与图片像素数估算token数；无法估算的图片数记为 images_unestimated。
+    """
+
+    def __init__(self, request_kwargs, cache_hit=False):
+        self.scope = _scope.get()
+        self.request_kwargs = request_kwargs
+        self.cache_hit = cache_hit
+        self.started = time.monotonic()
+        self.queue_wait = 0.0
+        self.retries = 0
+        self.usage = None
+        self.output_parts = []
+        self.finished = False
+
+    def observe_response(self, response):
+        """记录非流式响应的 usage 与输出文本。"""
+        self.usage = getattr(response, 'usage', None) or self.usage
+        if getattr(response, 'choices', None):
+            self.output_parts.append(response.choices[0].message.content or "")
+
+    def observe_chunk(self, chunk):
+        """记录流式分块中的输出文本，以及（若服务端提供）末尾分块携带的 usage。"""
+        self.usage = getattr(chunk, 'usage', None) or self.usage
+        if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+            self.output_parts.append(chunk.choices[0].delta.content)
+
+    def finish(self, error=None):
+        if self.finished:
+            return
+        self.finished = True
+        paper_name, stage_name, totals, totals_lock = self.scope or (None, None, None, None)
+        usage = self.usage
+        prompt_tokens = getattr(usage, 'prompt_tokens', None)
+        completion_tokens = getattr(usage, 'completion_tokens', None)
+        estimated = prompt_tokens is None or completion_tokens is None
+        images_unestimated = 0
+        if prompt_tokens is None:
+            prompt_tokens, images_unestimated = _estimate_prompt_tokens(self.request_kwargs)
+        if completion_tokens is None:
+            completion_tokens = token_budget.estimate_tokens("".join(self.output_parts))
+        record = {
+            "type": "call", "paper": paper_name, "stage": stage_name, "model": self.request_kwargs.get("model"),
+            "started_at": time.time() - (time.monotonic() - self.started),
+            "wall_time": round(time.monotonic() - self.started, 3),
+            "queue_wait": round(self.queue_wait, 3),
+            "cache_hit": self.cache_hit,
+            "retries": self.retries,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "tokens_estimated": estimated,
+            "images_unestimated": images_unestimated,
+            "bytes_sent": 0 if self.cache_hit else _request_bytes(self.request_kwargs),
+            "error": type(error).__name__ if error else None,
+        }
+        if totals is not None:
+            with totals_lock:
+                totals["calls"] += 1
+                totals["cache_hits"] += int(self.cache_hit)
+                totals["retries"] += self.retries
+                totals["errors"] += int(error is not None)
+                totals["call_time"] += record["wall_time"]
+                totals["call_queue_wait"] += record["queue_wait"]
+                if not self.cache_hit:
+                    # 命中缓存的调用不产生费用，不计入token与上传量
+                    totals["prompt_tokens"] += prompt_tokens
+                    totals["completion_tokens"] += completion_tokens
+                    totals["images_unestimated"] += images_unestimated
+                    totals["bytes_sent"] += record["bytes_sent"]
+        _append(paper_name, record)
+
+def load_stage_records(paper_name, since=None):
+    """读取论文的阶段记录；给出 since（time.time()）时只保留此后开始的记录，同一阶段只保留最后一条。"""
+    latest = {}
+    try:
+        with open(metrics_path(paper_name), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("type") != "stage" or (since is not None and record.get("started_at", 0) < since):
+                    continue
+                latest[record["stage"]] = record
+    except OSError:
+        return []
+    return list(latest.values())
+
+_SUMMARY_COLUMNS = [
+    ("阶段", "stage", "{}"), ("状态", "status", "{}"), ("耗时(s)", "wall_time", "{:.1f}"),
+    ("排队(s)", "queue_wait", "{:.1f}"), ("调用", "calls", "{}"), ("缓存命中", "cache_hits", "{}"),
+    ("重试", "retries", "{}"), ("输入tokens", "prompt_tokens", "{}"), ("输出tokens", "completion_tokens", "{}"),
+    ("上传(KB)", "bytes_sent", "{:.0f}"),
+]
+
+def format_summary(records):
+    """把阶段记录整理成按列对齐的文本表格。"""
+    rows = [[header for header, _, _ in _SUMMARY_COLUMNS]]
+    for record in records:
+        values = dict(record, bytes_sent=record.get("bytes_sent", 0) / 1024)
+        rows.append([fmt.format(values.get(field, 0)) for _, field, fmt in _SUMMARY_COLUMNS])
+    totals = {field: sum(record.get(field, 0) for record in records) for _, field, _ in _SUMMARY_COLUMNS[2:]}
+    totals["bytes_sent"] /= 1024
+    rows.append(["合计", ""] + [fmt.format(totals[field]) for _, field, fmt in _SUMMARY_COLUMNS[2:]])
+    return format_table(rows)
+
+def _display_width(text):
+    # 中文字符按两个字符宽度对齐
+    return sum(2 if ord(ch) > 0x2E80 else 1 for ch in text)
+
+def format_table(rows):
+    """把二维字符串列表（第一行为表头）排成按列对齐的文本表格。"""
+    width = _display_width
+    col_widths = [max(width(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = ["  ".join(cell + " " * (col_widths[i] - width(cell)) for i, cell in enumerate(row)).rstrip()
+             for row in rows]
+    lines.insert(1, "-" * width(lines[0]))
+    return "\n".join(lines)
+
+def print_summary(paper_name, since=None):
+    """打印论文本次运行的各阶段性能汇总表。"""
+    if not config.METRICS_ENABLED:
+        return
+    records = load_stage_records(paper_name, since)
+    if records:
+        print(f"--- [{paper_name}] 性能汇总（详见 {metrics_path(paper_name)}） ---")
+        print(format_summary(records))
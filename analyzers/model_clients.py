@@ -0,0 +1,237 @@
+import time
+import random
+import threading
+import email.utils
+from types import SimpleNamespace
+
+import openai
+from openai import OpenAI, DefaultHttpxClient, DEFAULT_CONNECTION_LIMITS
+import config
+from . import llm_cache
+from . import metrics
+
+# openai SDK 所依赖的 httpx 中的连接池配置类。取自 SDK 的默认配置，而不是单独导入 httpx，
+# 从而始终与 SDK 实际使用的 httpx 版本一致，无需额外声明依赖
+_HttpLimits = type(DEFAULT_CONNECTION_LIMITS)
+
+# 值得重试的HTTP状态码：请求超时、冲突、限流以及服务端错误
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+# 按 (base_url, 模型名) 区分的全局并发信号量。批量处理多篇论文时，
+# 所有论文、所有阶段对同一模型端点的请求共享同一个并发上限。
+_endpoint_semaphores = {}
+_endpoint_semaphores_lock = threading.Lock()
+
+def get_endpoint_semaphore(base_url, model_name, limit):
+    """返回指定模型端点的进程级并发信号量。"""
+    key = (base_url or "", model_name)
+    with _endpoint_semaphores_lock:
+        if key not in _endpoint_semaphores:
+            _endpoint_semaphores[key] = threading.BoundedSemaphore(max(1, limit))
+        return _endpoint_semaphores[key]
+
+class TokenBucket:
+    """
+    令牌桶限速器：按 rate_per_minute 的速率补充令牌，每个请求消耗一个令牌，令牌耗尽时等待。
+    rate_per_minute 为 0 时不限速，但仍支持 pause()：收到 429 后整个端点暂停发送，而不只是出错的那个线程。
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1, rate_per_minute // 60)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self._paused_until > now:
+                    wait_time = self._paused_until - now
+                elif self.rate <= 0:
+                    return
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait_time = (1 - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+    def pause(self, seconds):
+        """在接下来的 seconds 秒内暂停发放令牌。"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+_endpoint_buckets = {}
+_endpoint_buckets_lock = threading.Lock()
+
+def get_endpoint_bucket(base_url, model_name, rate_per_minute):
+    """返回指定模型端点的进程级令牌桶。"""
+    key = (base_url or "", model_name)
+    with _endpoint_buckets_lock:
+        if key not in _endpoint_buckets:
+            _endpoint_buckets[key] = TokenBucket(rate_per_minute)
+        return _endpoint_buckets[key]
+
+def parse_retry_after(error):
+    """从错误响应的 retry-after-ms / retry-after 头中解析需要等待的秒数，没有时返回None。"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return max(0.0, float(headers['retry-after-ms']) / 1000)
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            # Retry-After 也可以是HTTP日期
+            retry_time = email.utils.parsedate_to_datetime(value)
+            return max(0.0, retry_time.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def get_retry_delay(error, attempt):
+    """
+    判断请求错误是否值得重试，是则返回重试前应等待的秒数，否则返回None。
+    服务端给出 Retry-After 时以其为准，否则使用带完全随机抖动的指数退避。
+    """
+    if isinstance(error, openai.APIStatusError):
+        if error.status_code not in RETRYABLE_STATUS_CODES and error.status_code < 500:
+            return None
+    elif not isinstance(error, openai.APIConnectionError):  # 连接错误与超时
+        return None
+
+    retry_after = parse_retry_after(error)
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(0, min(config.LLM_RETRY_MAX_DELAY, config.LLM_RETRY_BASE_DELAY * 2 ** attempt))
+
+class _LimitedCompletions:
+    """
+    在调用 chat.completions.create 前从端点令牌桶取令牌，调用期间占用端点并发额度；
+    流式响应在读取完毕后才释放。遇到限流、服务端错误或连接错误时按退避策略重试。
+    每次调用的排队时间、重试次数与token用量记入 metrics。
+    """
+
+    def __init__(self, completions, semaphore, bucket):
+        self._completions = completions
+        self._semaphore = semaphore
+        self._bucket = bucket
+
+    def create(self, **kwargs):
+        call = metrics.CallMetrics(kwargs)
+        attempt = 0
+        while True:
+            queued = time.monotonic()
+            self._bucket.acquire()
+            self._semaphore.acquire()
+            call.queue_wait += time.monotonic() - queued
+            try:
+                response = self._completions.create(**kwargs)
+            except Exception as e:
+                self._semaphore.release()
+                delay = get_retry_delay(e, attempt)
+                if delay is None or attempt >= config.LLM_MAX_RETRIES:
+                    call.finish(error=e)
+                    raise
+                attempt += 1
+                call.retries = attempt
+                if isinstance(e, openai.RateLimitError):
+                    # 限流是端点级的，让同一端点的其他请求也一起等待
+                    self._bucket.pause(delay)
+                print(f"警告: 模型请求失败 ({type(e).__name__})，{delay:.1f} 秒后进行第 {attempt} 次重试...")
+                time.sleep(delay)
+                continue
+            if kwargs.get('stream'):
+                return _StreamGuard(response, self._semaphore, call)
+            self._semaphore.release()
+            call.observe_response(response)
+            call.finish()
+            return response
+
+class _StreamGuard:
+    """包装流式响应：流读取结束、出错或对象被回收时释放一次并发额度，并结束该次调用的计量。"""
+
+    def __init__(self, stream, semaphore, call):
+        self._stream = iter(stream)
+        self._semaphore = semaphore
+        self._call = call
+        self._released = False
+
+    def _release(self, error=None):
+        if not self._released:
+            self._released = True
+            self._semaphore.release()
+            self._call.finish(error=error)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self._stream)
+        except StopIteration:
+            self._release()
+            raise
+        except BaseException as e:
+            self._release(error=e)
+            raise
+        self._call.observe_chunk(chunk)
+        return chunk
+
+    def __del__(self):
+        self._release()
+
+class LimitedClient:
+    """OpenAI 客户端的包装：对同一端点的请求施加全局并发上限、速率限制与重试，其余属性原样转发。"""
+
+    def __init__(self, client, semaphore, bucket):
+        self._client = client
+        self.chat = SimpleNamespace(completions=_LimitedCompletions(client.chat.completions, semaphore, bucket))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+# 按 (api_key, base_url) 共享的 OpenAI 客户端。OpenAI 客户端是线程安全的，
+# 共享后所有阶段、所有线程复用同一个HTTP连接池，避免每次分析都重新建立TLS连接。
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+def get_shared_openai_client(api_key, base_url):
+    """返回进程内共享的、带连接池的 OpenAI 客户端。重试由 LimitedClient 负责，因此关闭 SDK 自带的重试。"""
+    key = (api_key, base_url or "")
+    with _shared_clients_lock:
+        if key not in _shared_clients:
+            http_client = DefaultHttpxClient(limits=_HttpLimits(
+                max_connections=config.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=config.LLM_HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=config.LLM_HTTP_KEEPALIVE_SECONDS,
+            ))
+            _shared_clients[key] = OpenAI(api_key=api_key, base_url=base_url, max_retries=0, http_client=http_client)
+        return _shared_clients[key]
+
+def _create_client(api_key, base_url, model_name, endpoint_limit, requests_per_minute, use_cache):
+    client = get_shared_openai_client(api_key, base_url)
+    client = LimitedClient(client,
+                           get_endpoint_semaphore(base_url, model_name, endpoint_limit),
+                           get_endpoint_bucket(base_url, model_name, requests_per_minute))
+    # 缓存包在最外层，命中缓存的请求不占用端点并发额度与速率配额
+    return llm_cache.wrap_client(client) if use_cache else client
+
+def create_llm_client(use_cache=True):
+    """创建语言模型客户端（共享连接池，带端点并发限制、速率限制、重试与响应缓存）。"""
+    return _create_client(config.LLM_API_KEY, config.LLM_BASE_URL, config.LLM_MODEL_NAME,
+                          config.LLM_ENDPOINT_MAX_CONCURRENCY, config.LLM_REQUESTS_PER_MINUTE, use_cache)
+
+def create_vision_client(use_cache=True):
+    """创建视觉模型客户端（共享连接池，带端点并发限制、速率限制、重试与响应缓存）。"""
+    return _create_client(config.VISION_API_KEY, config.VISION_BASE_URL, config.VISION_MODEL_NAME,
+                          config.VISION_ENDPOINT_MAX_CONCURRENCY, config.VISION_REQUESTS_PER_MINUTE, use_cache)
@@ -1,5 +1,6 @@
 import os
 import json
+import structured_store
 
 def generate_final_report(paper_name):
     """
@@ -18,9 +19,11 @@ def generate_final_report(paper_name):
     
     # 2. 加载所有数据
     print("--- 正在加载所有分析产物... ---")
+    structured_data = structured_store.load_structured_data(paper_title_path)
+    if structured_data is None:
+        return
+    paper_title = structured_data.get('paper_title', '未知标题')
     try:
-        with open(paper_title_path, 'r', encoding='utf-8') as f:
-            paper_title = json.load(f).get('paper_title', '未知标题')
         with open(mapping_path, 'r', encoding='utf-8') as f:
             section_mapping = json.load(f)
         with open(content_analysis_path, 'r', encoding='utf-8') as f:
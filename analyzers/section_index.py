@@ -0,0 +1,129 @@
+import re
+from difflib import SequenceMatcher
+
+# 精确匹配失败时，模糊匹配所需的最低标题相似度
+SECTION_FUZZY_THRESHOLD = 0.85
+
+# 章节编号：阿拉伯数字编号后的分隔符可省略（"2.1 overview"）；单个字母或罗马数字编号必须带 "." 或 ")"，
+# 且罗马数字必须合法，避免把 "a survey"、"civil rights" 这类标题开头的单词当作编号去掉
+_ROMAN_NUMERAL = r'(?=[ivxlc])c{0,3}(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3})'
+_NUMBERING_PATTERN = re.compile(r'^(?:[0-9]+(?:\.[0-9]+)*[.)]?|(?:' + _ROMAN_NUMERAL + r'|[a-z])[.)])\s+')
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+def normalize_title(title):
+    """标题归一化：小写、合并空白、去掉首尾空白与末尾标点。"""
+    return _WHITESPACE_PATTERN.sub(' ', (title or '').lower()).strip().rstrip('.:：')
+
+def strip_numbering(normalized_title):
+    """去掉归一化标题开头的章节编号，如 '2.1 overview' -> 'overview'。"""
+    return _NUMBERING_PATTERN.sub('', normalized_title, count=1)
+
+def build_section_index(all_sections_data):
+    """
+    一次性为章节树建立索引：
+    - nodes: 按文档顺序（先序）展开的节点列表，每个节点记录标题、在树中的路径、
+      本节原文在 text 中的起止偏移、子树结束位置（其后代为 nodes[i+1:subtree_end]）以及本节的图片ID；
+    - text: 全部章节原文按先序以空行拼接而成，任意连续节点区间的原文都是它的一个切片；
+    - by_title / by_bare_title: 归一化标题（及去掉编号后的标题）到节点序号列表的映射。
+    """
+    nodes = []
+    parts = []
+    offset = 0
+
+    def recurse(sections, parent_path):
+        nonlocal offset
+        for position, section in enumerate(sections):
+            content = section.get('content', '')
+            node = {
+                'title': section.get('title', ''),
+                'path': parent_path + (position,),
+                'start': offset,
+                'end': offset + len(content),
+                'figure_ids': [img.get('id') for img in section.get('images') or []],
+            }
+            parts.append(content)
+            offset += len(content) + 2  # 节点之间以 "\n\n" 分隔
+            nodes.append(node)
+            recurse(section.get('subsections') or [], node['path'])
+            node['subtree_end'] = len(nodes)
+
+    recurse(all_sections_data, ())
+
+    by_title, by_bare_title = {}, {}
+    for i, node in enumerate(nodes):
+        normalized = normalize_title(node['title'])
+        by_title.setdefault(normalized, []).append(i)
+        by_bare_title.setdefault(strip_numbering(normalized), []).append(i)
+
+    return {'nodes': nodes, 'text': "\n\n".join(parts), 'by_title': by_title, 'by_bare_title': by_bare_title}
+
+def find_sections(section_index, title):
+    """
+    查找标题对应的节点序号列表：先按归一化标题精确匹配（同名节点全部返回），
+    再忽略章节编号匹配，最后才在全部标题中做模糊匹配（只返回最相似的一个）。
+    """
+    normalized = normalize_title(title)
+    if not normalized:
+        return []
+    if normalized in section_index['by_title']:
+        return section_index['by_title'][normalized]
+
+    bare = strip_numbering(normalized)
+    if bare in section_index['by_bare_title']:
+        return section_index['by_bare_title'][bare][:1]
+
+    best_index, best_ratio = None, SECTION_FUZZY_THRESHOLD
+    for candidate, indices in section_index['by_title'].items():
+        matcher = SequenceMatcher(None, normalized, candidate)
+        if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+            continue
+        ratio = matcher.ratio()
+        if ratio >= best_ratio:
+            best_index, best_ratio = indices[0], ratio
+    return [] if best_index is None else [best_index]
+
+def get_section_content(section_index, section_titles, exclude_titles=None):
+    """
+    根据标题列表提取并合并相关章节（含其子章节）的原文和图片ID。
+    - 祖先与后代同时命中时只取祖先的子树，避免重复；
+    - exclude_titles 中的章节（如被映射到其他分析模块的子章节）会从子树中剔除。
+    返回 (原文, 按文档顺序去重后的图片ID列表)。
+    """
+    nodes, text = section_index['nodes'], section_index['text']
+    matched = sorted({i for title in section_titles for i in find_sections(section_index, title)})
+    excluded = {i for title in (exclude_titles or []) for i in find_sections(section_index, title)} - set(matched)
+
+    # 先序排列下，被前一个已选子树覆盖的节点都是其后代
+    selected = []
+    for i in matched:
+        if selected and i < nodes[selected[-1]]['subtree_end']:
+            continue
+        selected.append(i)
+
+    pieces = []
+    figure_ids = []
+    for i in selected:
+        run_start = None
+        j = i
+        while j < nodes[i]['subtree_end']:
+            if j in excluded:
+                if run_start is not None:
+                    pieces.append(text[nodes[run_start]['start']:nodes[j - 1]['end']])
+                    run_start = None
+                j = nodes[j]['subtree_end']
+                continue
+            if run_start is None:
+                run_start = j
+            for fig_id in nodes[j]['figure_ids']:
+                if fig_id not in figure_ids:
+                    figure_ids.append(fig_id)
+            j += 1
+        if run_start is not None:
+            pieces.append(text[nodes[run_start]['start']:nodes[j - 1]['end']])
+
+    return "\n\n".join(piece.strip() for piece in pieces if piece.strip()), figure_ids
+
+def get_module_content(section_index, section_mapping, module_name):
+    """提取某个标准分析模块的原文与图片ID；映射到其他模块的子章节不会被重复计入。"""
+    other_titles = [title for name, titles in section_mapping.items() if name != module_name for title in titles or []]
+    return get_section_content(section_index, section_mapping.get(module_name) or [], exclude_titles=other_titles)
@@ -1,21 +1,16 @@
 import os
 import json
 import re
-from openai import OpenAI
+from . import model_clients
+from . import llm_stream
+from . import llm_cache
 import config
+import structured_store
 from prompts import prompts
 
 def load_structured_data(json_path):
-    """从文件中加载结构化的论文数据。"""
-    try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print(f"错误: 找不到结构化数据文件: {json_path}")
-        return None
-    except json.JSONDecodeError:
-        print(f"错误: 解析JSON文件失败: {json_path}")
-        return None
+    """从文件中加载结构化的论文数据（优先读取同目录下的二进制格式，章节正文按需读取）。"""
+    return structured_store.load_structured_data(json_path)
 
 def format_toc_for_prompt(sections, indent=0):
     """将层级目录格式化为简单的缩进文本，以便LLM理解。"""
@@ -49,19 +44,25 @@ def create_section_mapping(structured_data, llm_client):
         toc_string=toc_string
     )
 
+    request_kwargs = {
+        "model": config.LLM_MODEL_NAME,
+        "messages": [
+            {"role": "system", "content": "你是一位顶级的科研助理，擅长快速分析计算机科学领域的学术论文结构。请严格按照要求输出JSON。"},
+            {"role": "user", "content": prompt}
+        ],
+        "response_format": {"type": "json_object"},
+    }
+
     print("--- 正在调用LLM进行目录映射... ---")
     try:
-        response = llm_client.chat.completions.create(
-            model=config.LLM_MODEL_NAME,
-            messages=[
-                {"role": "system", "content": "你是一位顶级的科研助理，擅长快速分析计算机科学领域的学术论文结构。请严格按照要求输出JSON。"},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
-        )
-        mapping_json_str = response.choices[0].message.content
+        mapping_json_str = llm_stream.stream_completion(llm_client, **request_kwargs)
         print("--- LLM响应成功 ---")
         return json.loads(mapping_json_str)
+    except json.JSONDecodeError as e:
+        # 无法解析的回答不能留在缓存中，否则重新运行时会一直命中同一条坏回答
+        llm_cache.discard(request_kwargs)
+        print(f"LLM返回的目录映射不是合法的JSON: {e}")
+        return None
     except Exception as e:
         print(f"调用LLM API时发生错误: {e}")
         return None
@@ -87,10 +88,7 @@ def analyze_paper_structure(paper_name):
         print("错误: LLM_API_KEY 未在 .env 文件中配置。")
         return
     
-    client = OpenAI(
-        api_key=config.LLM_API_KEY,
-        base_url=config.LLM_BASE_URL,
-    )
+    client = model_clients.create_llm_client()
     
     # 3. 创建章节映射
     print("2. 创建章节与标准结构的映射...")
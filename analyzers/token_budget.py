@@ -0,0 +1,94 @@
+import re
+import config
+
+# 安装了 tiktoken 时使用其精确计数，否则退回到按字符估算
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+# 中日韩文字及全角标点大致每个字符对应一个token，其余文本约每4个字符一个token
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+_HEADING_SPLIT_PATTERN = re.compile(r'(?m)^(?=#+\s)')
+_PARAGRAPH_SPLIT_PATTERN = re.compile(r'\n\s*\n')
+
+# 切分后单个片段的最小token预算，避免模板本身过大时切出过碎的片段
+MIN_CHUNK_TOKENS = 1000
+
+def estimate_tokens(text):
+    """估算文本的token数。"""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+def truncate_to_tokens(text, max_tokens):
+    """将文本截断到不超过 max_tokens 个token，并注明已截断。"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    suffix = "\n...（内容过长，已截断）"
+    keep = len(text)
+    while keep > 0:
+        keep = int(keep * max_tokens / max(estimate_tokens(text[:keep]), 1) * 0.95)
+        if estimate_tokens(text[:keep]) <= max_tokens:
+            break
+    return text[:keep] + suffix
+
+def _hard_split(text, max_tokens):
+    """对单个超长段落按字符数硬切分。"""
+    pieces = []
+    step = max(1, int(len(text) * max_tokens / max(estimate_tokens(text), 1)))
+    for start in range(0, len(text), step):
+        pieces.append(text[start:start + step])
+    return pieces
+
+def split_text_by_tokens(content, max_tokens):
+    """
+    将文本切分为若干不超过 max_tokens 的片段。
+    优先在子章节标题处切分，子章节仍过长时按段落切分，单个段落仍过长时才按字符硬切分；
+    切分出的小块再按原文顺序贪心地合并，尽量填满每个片段。
+    """
+    pieces = []
+    for block in _HEADING_SPLIT_PATTERN.split(content):
+        if not block.strip():
+            continue
+        if estimate_tokens(block) <= max_tokens:
+            pieces.append(block.strip('\n'))
+            continue
+        for paragraph in _PARAGRAPH_SPLIT_PATTERN.split(block):
+            if not paragraph.strip():
+                continue
+            if estimate_tokens(paragraph) <= max_tokens:
+                pieces.append(paragraph.strip('\n'))
+            else:
+                pieces.extend(_hard_split(paragraph, max_tokens))
+
+    chunks = []
+    current, current_tokens = [], 0
+    for piece in pieces:
+        piece_tokens = estimate_tokens(piece)
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def plan_prompt_chunks(prompt_template, content_field, content, max_prompt_tokens=None, **fields):
+    """
+    发送前测量完整Prompt的大小：未超出预算时返回 [content]；
+    否则扣除模板与其他字段占用的token后，按剩余预算切分 content。
+    """
+    max_prompt_tokens = max_prompt_tokens or config.LLM_MAX_PROMPT_TOKENS
+    full_prompt = prompt_template.format(**{content_field: content}, **fields)
+    if estimate_tokens(full_prompt) <= max_prompt_tokens:
+        return [content]
+
+    overhead = estimate_tokens(prompt_template.format(**{content_field: ""}, **fields))
+    available = max(MIN_CHUNK_TOKENS, max_prompt_tokens - overhead)
+    return split_text_by_tokens(content, available)
@@ -0,0 +1,90 @@
+"""
+Markdown 章节解析的内存与耗时基准。
+
+生成一份合成的长文档（默认 500 页，每页若干段落、标题与代码块），对比旧的整体读入 + re.split 的解析方式
+与 parse_md_content 的流式解析方式的峰值内存（tracemalloc）与耗时，并校验两者在不含代码块的文档上结果一致。
+
+用法（在项目根目录下运行）:
+    python benchmarks/bench_md_parser.py [--pages 500] [--mmap]
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_preprocess.main_parser import parse_md_content
+
+def write_synthetic_document(path, pages, paragraphs_per_page=6, with_code=False):
+    """每页一个二级标题与若干段落，每10页一个一级标题；with_code 时每页附带一个含 # 注释的代码块。"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("Synthetic Book\n\nAuthor A, Author B\n\n")
+        for page in range(pages):
+            if page % 10 == 0:
+                f.write(f"# {page // 10 + 1} Chapter {page // 10 + 1}\n\n")
+            f.write(f"## {page // 10 + 1}.{page % 10 + 1} Section on page {page + 1}\n\n")
+            for p in range(paragraphs_per_page):
+                f.write(f"Paragraph {p} on page {page + 1}. " * 12 + "\n\n")
+            if with_code:
+                f.write("```python\n# not a heading\nx = 1\n```\n\n")
+
+def legacy_parse_md_content(md_path):
+    """旧实现：整体读入、在开头拼接换行符后按标题 re.split，再逐段 strip。"""
+    with open(md_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    parts = re.split(r'(?=\n#+\s)', '\n' + content)
+    preamble = parts[0].strip()
+    sections = []
+    for part in parts[1:]:
+        part = part.strip()
+        header_match = re.match(r'^(#+)\s+(.*)', part)
+        if part and header_match:
+            sections.append({'title': header_match.group(2).split('\n')[0].strip(),
+                             'level': len(header_match.group(1)), 'raw_content': part})
+    return preamble, sections
+
+def measure(parse, md_path):
+    """返回 (耗时, 峰值内存字节数, 结果)。"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = parse(md_path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--mmap", action="store_true", help="流式解析时使用内存映射读取")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        md_path = os.path.join(tmp, 'synthetic.md')
+        write_synthetic_document(md_path, args.pages)
+        file_size = os.path.getsize(md_path)
+
+        legacy_time, legacy_peak, legacy_result = measure(legacy_parse_md_content, md_path)
+        stream_time, stream_peak, stream_result = measure(
+            lambda path: parse_md_content(path, use_mmap=args.mmap), md_path)
+
+        code_path = os.path.join(tmp, 'synthetic_code.md')
+        write_synthetic_document(code_path, 10, with_code=True)
+        legacy_count = len(legacy_parse_md_content(code_path)[1])
+        stream_count = len(parse_md_content(code_path)[1])
+
+    print(f"文档大小: {file_size / 1024 / 1024:.1f} MB，章节数: {len(stream_result[1])}")
+    print(f"旧实现 (整体读入 + re.split): {legacy_time * 1000:8.1f} ms，峰值内存 {legacy_peak / 1024 / 1024:7.1f} MB")
+    print(f"新实现 (流式逐行解析{'+mmap' if args.mmap else ''}):  {stream_time * 1000:8.1f} ms，峰值内存 {stream_peak / 1024 / 1024:7.1f} MB")
+    print(f"峰值内存 / 文档大小: 旧 {legacy_peak / file_size:.1f}x，新 {stream_peak / file_size:.1f}x")
+    print(f"结果一致: {'是' if legacy_result == stream_result else '否'}")
+    print(f"含代码块的文档: 旧实现 {legacy_count} 个章节（代码中的 # 被误判为标题），新实现 {stream_count} 个章节")
+    if legacy_result != stream_result:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
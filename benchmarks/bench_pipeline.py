@@ -0,0 +1,198 @@
+"""
+完整分析流程的离线性能基准。
+
+在本地启动 OpenAI 兼容的模拟服务（见 mock_openai_server.py），然后在临时工作目录中，
+对若干篇夹具论文（structured_data.json 与 images/ 目录）以批量模式运行 main.py 使用的同一条流水线，
+最后报告各阶段耗时、达到的请求并发度以及发出的请求数。全程无需网络，延迟与错误序列可由随机种子复现。
+
+夹具论文默认按参数合成；也可通过 --fixtures 指定一个目录，其中每个子目录是一篇论文的
+output/<论文> 产物（至少包含 structured_data.json 与 images/）。
+
+用法（在项目根目录下运行）:
+    python benchmarks/bench_pipeline.py [--papers 4] [--sections 8] [--figures 6]
+        [--latency 0.5] [--jitter 0.2] [--error-rate 0.0] [--tokens-per-second 200]
+        [--papers-per-stage 2] [--json results.json]
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import shutil
+import struct
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import build_graph
+from pipeline import STAGES, run_batch
+from analyzers import metrics
+from benchmarks.mock_openai_server import start_mock_server, add_settings_arguments, settings_from_args
+
+_SECTION_NAMES = ["Introduction", "Related Work", "Method", "Experiments", "Results", "Ablation Study",
+                  "Discussion", "Conclusion"]
+
+def write_png(path, width, height, seed):
+    """不依赖 Pillow 写出一张带色块的RGB PNG图片。"""
+    rows = []
+    for y in range(height):
+        row = bytearray([0])  # 每行的过滤类型
+        for x in range(width):
+            block = (x // 16 + y // 16 + seed) % 4
+            row += bytes(((block * 60 + seed * 17) % 256, (x * 3) % 256, (y * 5 + seed) % 256))
+        rows.append(bytes(row))
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(b''.join(rows), 6)))
+        f.write(chunk(b'IEND', b''))
+
+def make_synthetic_paper(paper_dir, paper_index, num_sections, num_figures, paragraphs_per_section):
+    """在 paper_dir 下生成一篇合成论文的 structured_data.json 与图片，图片平均分布在各章节中。"""
+    image_dir = os.path.join(paper_dir, 'images')
+    os.makedirs(image_dir, exist_ok=True)
+    sections = []
+    for s in range(num_sections):
+        title = f"{s + 1} {_SECTION_NAMES[s % len(_SECTION_NAMES)]}"
+        body = "\n\n".join(f"Paragraph {p} of section {s + 1} in paper {paper_index}. " * 8
+                           for p in range(paragraphs_per_section))
+        sections.append({'title': title, 'level': 1, 'content': f"# {title}\n\n{body}",
+                         'images': [], 'tables': [], 'subsections': []})
+    for f in range(num_figures):
+        file_name = f"fig_{paper_index}_{f}.png"
+        write_png(os.path.join(image_dir, file_name), 320, 240, paper_index * 100 + f)
+        sections[f % num_sections]['images'].append({
+            'id': f"Figure {f + 1}", 'new_path': f"images/{file_name}",
+            'caption': f"Figure {f + 1}: Synthetic figure {f + 1} of paper {paper_index}.",
+        })
+    data = {'paper_title': f"Synthetic Paper {paper_index}",
+            'preamble': f"# Synthetic Paper {paper_index}\n\n# Abstract\nA synthetic paper for benchmarking.",
+            'sections': sections}
+    with open(os.path.join(paper_dir, 'structured_data.json'), 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+
+def prepare_papers(args):
+    """在当前（临时）工作目录的 output/ 下准备夹具论文，并把预处理阶段记为已完成。返回论文名称列表。"""
+    if args.fixtures:
+        paper_names = sorted(name for name in os.listdir(args.fixtures)
+                             if os.path.exists(os.path.join(args.fixtures, name, 'structured_data.json')))
+        for name in paper_names:
+            target = os.path.join('output', name)
+            os.makedirs(target, exist_ok=True)
+            shutil.copy2(os.path.join(args.fixtures, name, 'structured_data.json'), target)
+            if os.path.exists(os.path.join(args.fixtures, name, 'structured_data.bin')):
+                shutil.copy2(os.path.join(args.fixtures, name, 'structured_data.bin'), target)  # 在 JSON 之后复制，保持不旧于 JSON
+            if os.path.isdir(os.path.join(args.fixtures, name, 'images')):
+                shutil.copytree(os.path.join(args.fixtures, name, 'images'), os.path.join(target, 'images'))
+    else:
+        paper_names = [f"bench_{i}" for i in range(args.papers)]
+        for i, name in enumerate(paper_names):
+            make_synthetic_paper(os.path.join('output', name), i, args.sections, args.figures, args.paragraphs)
+
+    # 夹具没有对应的PDF，把预处理阶段登记为已完成，流水线会直接从结构分析开始
+    for name in paper_names:
+        _, fingerprint = build_graph.check_stage(name, STAGES[0])
+        build_graph.mark_stage_started(name, STAGES[0], fingerprint, discard_artifact=False)
+        build_graph.mark_stage_complete(name, STAGES[0])
+    return paper_names
+
+def configure_for_mock(base_url, workdir):
+    """让所有模型客户端指向模拟服务，并关闭会让重复运行失真的磁盘缓存。"""
+    config.LLM_BASE_URL = config.VISION_BASE_URL = base_url
+    config.LLM_API_KEY = config.VISION_API_KEY = "bench-key"
+    config.LLM_CACHE_ENABLED = False
+    config.VISION_IMAGE_CACHE_DIR = os.path.join(workdir, '.cache', 'images')
+    config.METRICS_ENABLED = True
+
+def summarize_stages(paper_names, since):
+    """按阶段汇总所有论文的阶段记录。"""
+    by_stage = {}
+    for name in paper_names:
+        for record in metrics.load_stage_records(name, since):
+            by_stage.setdefault(record["stage"], []).append(record)
+    summary = []
+    for stage in STAGES[1:]:
+        records = by_stage.get(stage["name"], [])
+        if not records:
+            continue
+        summary.append({
+            "stage": stage["name"],
+            "papers": len(records),
+            "ok": sum(1 for r in records if r["status"] in ("success", "fresh")),
+            "mean_wall_time": sum(r["wall_time"] for r in records) / len(records),
+            "max_wall_time": max(r["wall_time"] for r in records),
+            "mean_queue_wait": sum(r["queue_wait"] for r in records) / len(records),
+            "calls": sum(r["calls"] for r in records),
+            "retries": sum(r["retries"] for r in records),
+            "call_time": sum(r["call_time"] for r in records),
+        })
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--papers", type=int, default=4, help="合成论文的篇数")
+    parser.add_argument("--sections", type=int, default=8, help="每篇合成论文的章节数")
+    parser.add_argument("--figures", type=int, default=6, help="每篇合成论文的图片数")
+    parser.add_argument("--paragraphs", type=int, default=6, help="每个章节的段落数")
+    parser.add_argument("--fixtures", help="夹具论文目录，指定后忽略合成参数")
+    parser.add_argument("--papers-per-stage", type=int, default=config.BATCH_PAPERS_PER_STAGE)
+    parser.add_argument("--json", dest="json_path", help="把结果另存为JSON文件")
+    parser.add_argument("--keep-workdir", action="store_true", help="保留临时工作目录以便检查产物")
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+    if args.fixtures:
+        args.fixtures = os.path.abspath(args.fixtures)
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+
+    server = start_mock_server(settings_from_args(args))
+    original_cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="paper_agent_bench_")
+    try:
+        os.chdir(workdir)
+        configure_for_mock(server.base_url, workdir)
+        paper_names = prepare_papers(args)
+        if not paper_names:
+            print("错误: 没有可用的夹具论文。")
+            sys.exit(1)
+
+        print(f"=== 基准: {len(paper_names)} 篇论文，模拟服务 {server.base_url}，工作目录 {workdir} ===")
+        start_time = time.time()
+        started = time.monotonic()
+        results = run_batch(paper_names, papers_per_stage=args.papers_per_stage, preprocess_workers=1)
+        elapsed = time.monotonic() - started
+        stages = summarize_stages(paper_names, start_time)
+    finally:
+        os.chdir(original_cwd)
+        server.shutdown()
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    stats = server.stats.snapshot()
+    succeeded = sum(1 for r in results if r["status"] == "success")
+    rows = [["阶段", "成功/论文", "平均耗时(s)", "最长耗时(s)", "平均排队(s)", "调用", "重试"]]
+    for s in stages:
+        rows.append([s["stage"], f"{s['ok']}/{s['papers']}", f"{s['mean_wall_time']:.2f}", f"{s['max_wall_time']:.2f}",
+                     f"{s['mean_queue_wait']:.2f}", str(s["calls"]), str(s["retries"])])
+    print(metrics.format_table(rows))
+    print(f"总耗时: {elapsed:.2f} s，成功 {succeeded}/{len(results)} 篇，吞吐量 {succeeded / elapsed * 60:.1f} 篇/分钟")
+    print(f"请求数: {stats['requests']}（按状态码: {stats['by_status']}，按模型: {stats['by_model']}）")
+    print(f"并发度: 峰值 {stats['peak_in_flight']}，平均 {stats['busy_time'] / elapsed:.2f}")
+    if args.keep_workdir:
+        print(f"产物保留在: {workdir}")
+
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({"settings": {k: v for k, v in vars(args).items() if k != "json_path"},
+                       "elapsed": elapsed, "papers": results, "stages": stages, "server": stats},
+                      f, ensure_ascii=False, indent=2)
+    if succeeded != len(results):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+结构化数据加载的耗时与内存基准。
+
+生成一篇合成的长论文（默认 2000 个章节，每节约 4KB 正文），分别以 JSON 与二进制格式保存，
+对比只需要章节树骨架的阶段（如结构分析、图片分析）与需要全部正文的阶段（如内容分析）的加载耗时和峰值内存，
+并校验二进制格式读出的数据与 JSON 完全一致。
+
+用法（在项目根目录下运行）:
+    python benchmarks/bench_structured_data.py [--sections 2000] [--repeat 3]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import structured_store
+from analyzers.image_analyzer import get_all_images_from_data
+from analyzers.section_index import build_section_index
+
+def make_synthetic_data(num_sections, paragraphs=8):
+    sections = []
+    for s in range(num_sections):
+        chapter = {'title': f"{s + 1} Section {s + 1}", 'level': 1,
+                   'content': f"# {s + 1} Section {s + 1}\n\n" + "\n\n".join(
+                       f"Paragraph {p} of section {s + 1}. " * 16 for p in range(paragraphs)),
+                   'images': [{'id': f"Figure {s + 1}", 'new_path': f"images/Figure_{s + 1}.png",
+                               'original_path': f"images/{s}.png", 'caption': f"Figure {s + 1}: caption"}],
+                   'tables': [], 'subsections': []}
+        sections.append(chapter)
+    return {'paper_title': 'Synthetic Paper', 'preamble': '# Synthetic Paper\n\n# Abstract\nabstract', 'sections': sections}
+
+def measure(func, repeat):
+    """返回 (最短耗时, 峰值内存字节数)。"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    data = make_synthetic_data(args.sections)
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, 'structured_data.json')
+        bin_path = structured_store.binary_path_for(json_path)
+        config.STRUCTURED_DATA_BINARY = True
+        structured_store.save_structured_data(data, json_path)
+
+        def load_json():
+            with open(json_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        cases = [
+            ("JSON  骨架（图片列表）", lambda: get_all_images_from_data(load_json())),
+            ("二进制 骨架（图片列表）", lambda: get_all_images_from_data(structured_store.load_structured_data(json_path))),
+            ("JSON  全部正文（章节索引）", lambda: build_section_index(load_json()['sections'])),
+            ("二进制 全部正文（章节索引）",
+             lambda: build_section_index(structured_store.load_structured_data(json_path)['sections'])),
+        ]
+        print(f"章节数: {args.sections}，JSON {os.path.getsize(json_path) / 1024 / 1024:.1f} MB，"
+              f"二进制 {os.path.getsize(bin_path) / 1024 / 1024:.1f} MB")
+        for name, func in cases:
+            elapsed, peak = measure(func, args.repeat)
+            print(f"{name}: {elapsed * 1000:8.1f} ms，峰值内存 {peak / 1024 / 1024:7.1f} MB")
+
+        loaded = structured_store.load_structured_data(json_path)
+        same = dict(loaded, sections=[structured_store.to_plain(s) for s in loaded['sections']]) == load_json()
+    print(f"结果一致: {'是' if same else '否'}")
+    if not same:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
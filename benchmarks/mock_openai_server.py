@@ -0,0 +1,265 @@
+"""
+本地的 OpenAI 兼容模拟服务（/v1/chat/completions），供性能基准在无网络环境下运行完整流程。
+
+可配置首个token前的延迟与抖动、随机错误率（429 或 500）以及流式输出的token吞吐量。
+回答内容按Prompt类型生成合法的JSON（章节映射、分析要点、深入分析、批量图表分析），其余为填充文本，
+因此各分析阶段都能正常走完。服务会统计请求数、错误数与并发峰值。
+
+单独运行（在项目根目录下）:
+    python benchmarks/mock_openai_server.py --port 8765 --latency 0.5 --error-rate 0.05
+然后在 .env 中将 LLM_BASE_URL / VISION_BASE_URL 指向 http://127.0.0.1:8765/v1。
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analyzers.token_budget import estimate_tokens
+
+STANDARD_SECTIONS = ["研究背景", "研究方法", "实验设计", "结果与分析", "总体结论"]
+_SECTION_KEYWORDS = [
+    ("研究背景", ("introduction", "related", "background")),
+    ("研究方法", ("method", "model", "approach", "architecture")),
+    ("实验设计", ("experiment", "evaluation", "setup")),
+    ("结果与分析", ("result", "analysis", "ablation")),
+    ("总体结论", ("conclusion", "future")),
+]
+_FILLER = "该部分给出了论文的关键设计与实验结论，并讨论了其适用范围与局限。"
+
+class MockSettings:
+    """模拟服务的行为参数。"""
+
+    def __init__(self, latency=0.5, jitter=0.2, error_rate=0.0, tokens_per_second=0.0, output_tokens=150, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+
+    def uniform(self, low, high):
+        with self.random_lock:
+            return self.random.uniform(low, high)
+
+class MockStats:
+    """请求统计：总数、按状态码计数、按模型计数、并发峰值与累计处理时间。"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.by_status = {}
+        self.by_model = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.busy_time = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def begin(self, model):
+        with self.lock:
+            self.requests += 1
+            self.by_model[model] = self.by_model.get(model, 0) + 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def end(self, status, elapsed, prompt_tokens=0, completion_tokens=0):
+        with self.lock:
+            self.in_flight -= 1
+            self.by_status[status] = self.by_status.get(status, 0) + 1
+            self.busy_time += elapsed
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "requests": self.requests, "by_status": dict(self.by_status), "by_model": dict(self.by_model),
+                "peak_in_flight": self.peak_in_flight, "busy_time": self.busy_time,
+                "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens,
+            }
+
+def _filler(num_tokens):
+    """生成约 num_tokens 个token的填充文本。"""
+    per_sentence = max(1, estimate_tokens(_FILLER))
+    return _FILLER * max(1, num_tokens // per_sentence)
+
+def _prompt_text(messages):
+    texts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        else:
+            texts.extend(part.get("text", "") for part in content or [] if part.get("type") == "text")
+    return "\n".join(texts)
+
+def _map_sections(prompt):
+    """按关键字把目录中的一级标题分配到标准分析模块，无法判断的依次轮流分配。"""
+    toc_match = re.search(r'\*\*论文目录结构:\*\*\s*```\n(.*?)```', prompt, re.S)
+    titles = re.findall(r'^- (.+)$', toc_match.group(1), re.M) if toc_match else []
+    mapping = {name: [] for name in STANDARD_SECTIONS}
+    for position, title in enumerate(titles):
+        lowered = title.lower()
+        module = next((name for name, keywords in _SECTION_KEYWORDS if any(k in lowered for k in keywords)),
+                      STANDARD_SECTIONS[position % len(STANDARD_SECTIONS)])
+        mapping[module].append(title)
+    return mapping
+
+def build_reply(request, settings):
+    """根据Prompt类型生成回答文本。"""
+    prompt = _prompt_text(request.get("messages", []))
+    size = settings.output_tokens
+    if "标准分析模块" in prompt:
+        return json.dumps(_map_sections(prompt), ensure_ascii=False)
+    count_match = re.search(r'提供了 (\d+) 张图表图片', prompt)
+    if count_match:
+        count = int(count_match.group(1))
+        figures = [{"index": i + 1, "analysis": _filler(size // count)} for i in range(count)]
+        return json.dumps({"figures": figures}, ensure_ascii=False)
+    if '"analysis_details"' in prompt:
+        points_match = re.search(r'\*\*(?:你之前生成的)?分析要点:\*\*\n(.*?)\n\n', prompt, re.S)
+        points = re.findall(r'^- (.+)$', points_match.group(1), re.M) if points_match else ["要点1"]
+        details = {point: _filler(size // len(points)) for point in points}
+        return json.dumps({"analysis_details": details}, ensure_ascii=False)
+    if '"analysis_points"' in prompt:
+        return json.dumps({"analysis_points": ["核心问题", "关键方法", "主要结论"]}, ensure_ascii=False)
+    return _filler(size)
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持 keep-alive，与真实服务一样复用连接
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+
+    def do_POST(self):
+        settings, stats = self.server.settings, self.server.stats
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip('/').endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+
+        model = request.get("model", "mock")
+        started = time.monotonic()
+        stats.begin(model)
+        status = 200
+        prompt_tokens = completion_tokens = 0
+        try:
+            time.sleep(max(0.0, settings.latency + settings.uniform(-settings.jitter, settings.jitter)))
+            if settings.error_rate > 0 and settings.uniform(0, 1) < settings.error_rate:
+                status = 429 if settings.uniform(0, 1) < 0.5 else 500
+                headers = {"retry-after-ms": "200"} if status == 429 else None
+                self._send_json(status, {"error": {"message": "injected error", "type": "mock_error"}}, headers)
+                return
+
+            reply = build_reply(request, settings)
+            prompt_tokens = estimate_tokens(_prompt_text(request.get("messages", [])))
+            completion_tokens = estimate_tokens(reply)
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+            completion_id = f"chatcmpl-mock-{stats.requests}"
+            if not request.get("stream"):
+                self._send_json(200, {
+                    "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+                return
+            self._stream_reply(completion_id, model, reply, usage, request, settings)
+        finally:
+            stats.end(status, time.monotonic() - started, prompt_tokens, completion_tokens)
+
+    def _stream_reply(self, completion_id, model, reply, usage, request, settings):
+        """以 SSE 分块返回回答；tokens_per_second > 0 时按该速率输出。"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(delta, finish_reason=None, extra=None):
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                       "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            payload.update(extra or {})
+            self._write_chunk(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+
+        piece_size = 16
+        for start in range(0, len(reply), piece_size):
+            piece = reply[start:start + piece_size]
+            if settings.tokens_per_second > 0:
+                time.sleep(estimate_tokens(piece) / settings.tokens_per_second)
+            event({"content": piece})
+        event({}, finish_reason="stop")
+        if (request.get("stream_options") or {}).get("include_usage"):
+            self._write_chunk(f"data: {json.dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'model': model, 'choices': [], 'usage': usage})}\n\n".encode('utf-8'))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, settings, host="127.0.0.1", port=0):
+        super().__init__((host, port), MockHandler)
+        self.settings = settings
+        self.stats = MockStats()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+def start_mock_server(settings, host="127.0.0.1", port=0):
+    """在后台线程中启动模拟服务并返回服务对象，用完后调用 shutdown()。"""
+    server = MockOpenAIServer(settings, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def add_settings_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.5, help="首个token前的平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延迟的随机抖动幅度（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回 429/500 错误的概率")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="流式输出速率，0 表示不限速")
+    parser.add_argument("--output-tokens", type=int, default=150, help="每个回答的大致token数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子，用于复现延迟与错误序列")
+
+def settings_from_args(args):
+    return MockSettings(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                        tokens_per_second=args.tokens_per_second, output_tokens=args.output_tokens, seed=args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(settings_from_args(args), args.host, args.port)
+    print(f"模拟服务已启动: {server.base_url} (Ctrl+C 退出)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats.snapshot(), ensure_ascii=False, indent=2))
+
+if __name__ == '__main__':
+    main()
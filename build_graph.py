@@ -0,0 +1,110 @@
+import os
+import json
+import hashlib
+import threading
+
+import config
+from prompts import prompts
+
+# 每篇论文的构建状态文件，记录每个阶段产物生成时的指纹：
+# {产物文件名: {"fingerprint": 指纹, "complete": 是否已完整生成}}
+BUILD_STATE_FILE = '.build_state.json'
+
+# 同一篇论文的多个阶段可能并发更新状态文件
+_state_lock = threading.Lock()
+
+def hash_path(path):
+    """计算文件内容的哈希；目录则按相对路径顺序哈希其中的全部文件；不存在时返回 'missing'。"""
+    if os.path.isdir(path):
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode('utf-8'))
+                digest.update(hash_path(file_path).encode('ascii'))
+        return digest.hexdigest()
+    if not os.path.exists(path):
+        return 'missing'
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def resolve_input_path(paper_name, input_path):
+    """阶段输入中的 {paper} 替换为论文名称；不含目录的名称视为 output/<论文>/ 下的文件。"""
+    input_path = input_path.format(paper=paper_name)
+    if os.path.dirname(input_path):
+        return input_path
+    return os.path.join('output', paper_name, input_path)
+
+def compute_fingerprint(paper_name, stage):
+    """
+    计算阶段产物的指纹：由全部输入文件的内容、阶段使用的Prompt模板原文以及模型名称共同决定，
+    其中任一项变化都会使该阶段（并经由产物内容使其下游阶段）失效。
+    """
+    parts = {
+        "inputs": {path: hash_path(resolve_input_path(paper_name, path)) for path in stage["inputs"]},
+        "prompts": {name: hashlib.sha256(getattr(prompts, name).encode('utf-8')).hexdigest()
+                    for name in stage.get("prompts", [])},
+        "model": getattr(config, stage["model"]) if stage.get("model") else None,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+def _state_path(paper_name):
+    return os.path.join('output', paper_name, BUILD_STATE_FILE)
+
+def load_build_state(paper_name):
+    try:
+        with open(_state_path(paper_name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _update_build_state(paper_name, artifact, record):
+    with _state_lock:
+        state = load_build_state(paper_name)
+        if record is None:
+            state.pop(artifact, None)
+        else:
+            state[artifact] = record
+        path = _state_path(paper_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+def check_stage(paper_name, stage, force=False):
+    """
+    判断阶段是否需要重新执行，返回 (状态, 当前指纹)，状态为：
+    - 'fresh'：产物存在且指纹未变，可以跳过；
+    - 'resume'：上次以相同指纹开始但未完成（或产物来自没有构建记录的旧版本），保留已有产物续跑；
+    - 'stale'：指纹已变化或要求强制重建，需要删除旧产物后重新生成。
+    """
+    fingerprint = compute_fingerprint(paper_name, stage)
+    artifact_path = os.path.join('output', paper_name, stage["artifact"])
+    record = load_build_state(paper_name).get(stage["artifact"])
+    if force:
+        return 'stale', fingerprint
+    if not os.path.exists(artifact_path) or record is None:
+        return 'resume', fingerprint
+    if record.get("fingerprint") != fingerprint:
+        return 'stale', fingerprint
+    if any(not os.path.exists(os.path.join('output', paper_name, extra))
+           for extra in stage.get("extra_artifacts", [])):
+        return 'resume', fingerprint
+    return ('fresh' if record.get("complete") else 'resume'), fingerprint
+
+def mark_stage_started(paper_name, stage, fingerprint, discard_artifact):
+    """记录阶段开始；discard_artifact 为 True 时先删除失效的旧产物，避免阶段在其基础上续跑。"""
+    artifact_path = os.path.join('output', paper_name, stage["artifact"])
+    if discard_artifact and os.path.exists(artifact_path):
+        os.remove(artifact_path)
+    _update_build_state(paper_name, stage["artifact"], {"fingerprint": fingerprint, "complete": False})
+
+def mark_stage_complete(paper_name, stage):
+    """阶段成功后按输入的最新内容记录指纹（预处理阶段会在运行中生成自己的部分输入）。"""
+    _update_build_state(paper_name, stage["artifact"],
+                        {"fingerprint": compute_fingerprint(paper_name, stage), "complete": True})
@@ -16,6 +16,82 @@ VISION_API_KEY = os.getenv("VISION_API_KEY", LLM_API_KEY)
 VISION_BASE_URL = os.getenv("VISION_BASE_URL", LLM_BASE_URL)
 VISION_MODEL_NAME = os.getenv("VISION_MODEL_NAME", "gpt-4-vision-preview")
 
+# --- Vision Image Preprocessing Configuration ---
+# 上传前将图片缩小到不超过该像素数（宽×高），0 表示不缩放
+VISION_MAX_PIXELS = int(os.getenv("VISION_MAX_PIXELS", "1048576"))
+# 重新编码的格式：auto（少色/透明图用PNG，其余用JPEG）、jpeg、png、webp，或 original（保持原文件）
+VISION_IMAGE_FORMAT = os.getenv("VISION_IMAGE_FORMAT", "auto").lower()
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "90"))
+# 编码结果按图片内容哈希缓存在此目录，重复分析时无需再次缩放编码
+VISION_IMAGE_CACHE_DIR = os.getenv("VISION_IMAGE_CACHE_DIR", os.path.join(".cache", "images"))
+# 批量模式：一次视觉请求最多打包的图片数，1 表示关闭批量、逐张分析
+VISION_BATCH_SIZE = int(os.getenv("VISION_BATCH_SIZE", "1"))
+# 批量请求的输入token预算（图片按像素数估算：每 28×28 像素约一个token）
+VISION_BATCH_MAX_TOKENS = int(os.getenv("VISION_BATCH_MAX_TOKENS", "8000"))
+
+# --- Concurrency Configuration ---
+# 图片分析阶段同时在途的视觉模型请求数上限，设置为 1 即退化为逐张串行分析
+VISION_MAX_CONCURRENCY = int(os.getenv("VISION_MAX_CONCURRENCY", "4"))
+# 内容分析阶段同时在途的语言模型请求数上限，各章节共享这一额度
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+# 每个模型端点在整个进程内同时在途的请求数上限（批量处理多篇论文时由所有论文共享）
+LLM_ENDPOINT_MAX_CONCURRENCY = int(os.getenv("LLM_ENDPOINT_MAX_CONCURRENCY", "8"))
+VISION_ENDPOINT_MAX_CONCURRENCY = int(os.getenv("VISION_ENDPOINT_MAX_CONCURRENCY", "8"))
+# 批量模式下每个流水线阶段同时处理的论文数
+BATCH_PAPERS_PER_STAGE = int(os.getenv("BATCH_PAPERS_PER_STAGE", "2"))
+
+# --- Rate Limit & Retry Configuration ---
+# 遇到 429/5xx/连接错误时的最大重试次数，以及指数退避的基础与最大等待秒数（实际等待带随机抖动）
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "60"))
+# 每个模型端点每分钟允许发出的请求数（令牌桶），0 表示不限制
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+VISION_REQUESTS_PER_MINUTE = int(os.getenv("VISION_REQUESTS_PER_MINUTE", "0"))
+# 共享HTTP连接池的大小与空闲连接保活时间（秒）
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "32"))
+LLM_HTTP_KEEPALIVE_SECONDS = float(os.getenv("LLM_HTTP_KEEPALIVE_SECONDS", "30"))
+
+# --- Streaming Configuration ---
+# 流式生成时，实时预览写入输出 markdown 文件的最小间隔（秒）
+LLM_STREAM_UPDATE_INTERVAL = float(os.getenv("LLM_STREAM_UPDATE_INTERVAL", "0.5"))
+# 流式请求是否要求服务端在末尾返回 usage（stream_options.include_usage），用于准确统计token；不支持该参数的服务可关闭
+LLM_STREAM_INCLUDE_USAGE = os.getenv("LLM_STREAM_INCLUDE_USAGE", "true").lower() in ("1", "true", "yes")
+
+# --- Prompt Budget Configuration ---
+# 单次请求Prompt的token上限；章节原文超出时按子章节/段落切分，并行分析后再合并
+LLM_MAX_PROMPT_TOKENS = int(os.getenv("LLM_MAX_PROMPT_TOKENS", "24000"))
+
+# --- LLM Response Cache Configuration ---
+# 以 (模型名, 消息, response_format, 图片数据) 的哈希为键缓存模型响应，重复运行时无需再次调用API
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join(".cache", "llm"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "512"))
+
+# --- Metrics Configuration ---
+# 每个阶段与每次模型调用的耗时、排队时间、token用量、上传字节数、缓存命中与重试次数，
+# 以 JSON lines 追加写入 output/<论文>/METRICS_FILE，运行结束时打印各阶段汇总表
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_FILE = os.getenv("METRICS_FILE", "metrics.jsonl")
+
+# --- PDF Preprocessing Configuration ---
+# magic-pdf 可执行文件、最长等待时间，以及检测输出文件的轮询间隔（秒）
+MAGIC_PDF_CMD = os.getenv("MAGIC_PDF_CMD", "magic-pdf")
+MAGIC_PDF_TIMEOUT = int(os.getenv("MAGIC_PDF_TIMEOUT", "1800"))
+MAGIC_PDF_POLL_INTERVAL = float(os.getenv("MAGIC_PDF_POLL_INTERVAL", "2"))
+# markdown 已生成后，等待 magic-pdf 写完其余产物的最长时间（秒）
+MAGIC_PDF_GRACE_PERIOD = float(os.getenv("MAGIC_PDF_GRACE_PERIOD", "10"))
+# 批量预处理进程池：worker 数（0 表示按CPU核数与可用内存自动计算）、每个 worker（含其 magic-pdf 子进程）的常驻内存上限(MB)与崩溃重试次数
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", "0"))
+PREPROCESS_WORKER_MEMORY_MB = int(os.getenv("PREPROCESS_WORKER_MEMORY_MB", "4096"))
+PREPROCESS_MAX_RETRIES = int(os.getenv("PREPROCESS_MAX_RETRIES", "2"))
+# 图片资源库：论文图片按内容哈希存放一份，output/<论文>/images 中的文件是指向它的硬链接
+ASSET_STORE_DIR = os.getenv("ASSET_STORE_DIR", os.path.join(".cache", "assets"))
+# 预处理时除 structured_data.json 外再写入紧凑的二进制格式 structured_data.bin，
+# 各分析阶段优先读取它：只解析章节树骨架，章节正文按需读取
+STRUCTURED_DATA_BINARY = os.getenv("STRUCTURED_DATA_BINARY", "true").lower() in ("1", "true", "yes")
+
 # --- Project Configuration ---
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", "output")
 TEMP_DIR = os.getenv("TEMP_DIR", "temp")
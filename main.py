@@ -2,20 +2,38 @@ import os
 import sys
 import argparse
 
+import config
+from pipeline import discover_papers, run_batch, run_paper_pipeline, print_batch_summary
 from analyzers.structure_analyzer import analyze_paper_structure
 from analyzers.image_analyzer import analyze_paper_images
 from analyzers.content_analyzer import analyze_paper_content
 from analyzers.insight_analyzer import analyze_paper_insight
 from analyzers.report_generator import generate_final_report
 from pdf_preprocess.main_parser import process_paper
+from pdf_preprocess.preprocess_driver import preprocess_paper
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="PaperAgent 论文分析流程")
+    parser.add_argument("--paper", help="要处理的论文名称（不含.pdf后缀），默认使用配置区的 PAPER_NAME")
+    parser.add_argument("--batch", metavar="DIR_OR_MANIFEST",
+                        help="批量模式：PDF所在目录，或每行一个论文名称的清单文件(.txt/.json)")
+    parser.add_argument("--papers-per-stage", type=int, default=config.BATCH_PAPERS_PER_STAGE,
+                        help="批量模式下每个阶段同时处理的论文数")
+    parser.add_argument("--preprocess-workers", type=int, default=config.PREPROCESS_WORKERS,
+                        help="批量模式下PDF预处理的进程数，0 表示按CPU核数与可用内存自动计算")
+    parser.add_argument("--force", action="store_true",
+                        help="忽略构建记录，重新执行全部阶段（默认只重新执行产物已过期的阶段）")
+    return parser.parse_args()
 
 def main():
     """
     项目的主入口。
-    支持两种运行模式：
+    支持三种运行模式：
     1. 分步模式 - 取消注释您需要执行的步骤
-    2. 全流程模式 - 设置 RUN_ALL_STEPS = True
+    2. 全流程模式 - 设置 RUN_ALL_STEPS = True，或通过 --paper 指定论文
+    3. 批量模式 - 通过 --batch 指定PDF目录或论文清单，多篇论文以流水线方式并行处理
     """
+    args = parse_args()
     # =========================== 配置区 ===========================
     # 在这里设置您要处理的论文名称（不含.pdf后缀）
     # 注意：这应与 magic-pdf 处理后的输出目录名称相同
@@ -23,22 +41,33 @@ def main():
     
     # 设置为 True 可一键执行从预处理到生成最终报告的全部步骤
     RUN_ALL_STEPS = True
+
+    if args.batch:
+        paper_names = discover_papers(args.batch)
+        if not paper_names:
+            print(f"错误: 在 {args.batch} 中未找到任何待处理的论文。")
+            sys.exit(1)
+        print(f"=== 开始批量分析 {len(paper_names)} 篇论文 ===")
+        results = run_batch(paper_names, papers_per_stage=args.papers_per_stage,
+                            preprocess_workers=args.preprocess_workers, force=args.force)
+        print_batch_summary(results)
+        if any(r["status"] != "success" for r in results):
+            sys.exit(1)
+        return
+
+    if args.paper:
+        PAPER_NAME = args.paper
+        RUN_ALL_STEPS = True
     
     # =========================== 执行区 ===========================
     if RUN_ALL_STEPS:
         print("=== 开始执行全流程分析 ===")
-        # 第1步：预处理PDF文件
-        process_paper(PAPER_NAME)
-        # 第2步：结构分析与映射
-        analyze_paper_structure(PAPER_NAME)
-        # 第3步：图片提取与分析
-        analyze_paper_images(PAPER_NAME)
-        # 第4步：章节内容深度分析
-        analyze_paper_content(PAPER_NAME)
-        # 第5步：全局洞察分析
-        analyze_paper_insight(PAPER_NAME)
-        # 第6步：生成最终报告
-        generate_final_report(PAPER_NAME)
+        # 依次执行：预处理 → 结构分析 → 图片分析 → 内容分析 → 洞察分析 → 报告生成
+        # 只有输入、Prompt模板或模型名称发生变化的阶段（及其下游）才会重新执行
+        result = run_paper_pipeline(PAPER_NAME, force=args.force)
+        if result["status"] != "success":
+            print(f"=== 全流程分析失败于 {result['failed_stage']}: {result['error']} ===")
+            sys.exit(1)
         print("=== 全流程分析完成！最终报告已生成 ===")
     else:
         # 分步执行模式：取消注释您想要执行的步骤
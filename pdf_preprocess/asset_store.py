@@ -0,0 +1,97 @@
+import os
+import shutil
+import hashlib
+import config
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，无法使用 reflink
+    fcntl = None
+
+# Linux 的 FICLONE ioctl：在 Btrfs/XFS 等文件系统上以写时复制方式克隆文件，不复制数据块
+_FICLONE = 0x40049409
+
+# 按 (路径, 大小, 修改时间) 缓存文件内容的哈希，同一进程内重复引用的图片只读取一次
+_digest_cache = {}
+
+def file_digest(path):
+    """返回文件内容的 sha256。"""
+    stat = os.stat(path)
+    key = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _digest_cache:
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(block)
+        _digest_cache[key] = hasher.hexdigest()
+    return _digest_cache[key]
+
+def _reflink(source_path, dest_path):
+    """尝试以 reflink 克隆文件，文件系统不支持时返回 False。"""
+    if fcntl is None:
+        return False
+    try:
+        with open(source_path, 'rb') as src, open(dest_path, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        shutil.copystat(source_path, dest_path)
+        return True
+    except OSError:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        return False
+
+def _clone(source_path, dest_path, allow_hardlink):
+    """把 source_path 放到 dest_path（原子替换），依次尝试硬链接、reflink 与复制，返回实际使用的方式。"""
+    tmp_path = f"{dest_path}.{os.getpid()}.tmp"
+    try:
+        method = None
+        if allow_hardlink:
+            try:
+                os.link(source_path, tmp_path)
+                method = 'hardlink'
+            except OSError:
+                pass
+        if method is None:
+            method = 'reflink' if _reflink(source_path, tmp_path) else 'copy'
+            if method == 'copy':
+                shutil.copy2(source_path, tmp_path)
+        os.replace(tmp_path, dest_path)
+        return method
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _store_object(source_path, digest):
+    """
+    确保内容为 digest 的文件已存在于资源库中，返回其路径。
+    资源库中的文件是独立的副本（reflink 或复制），不与 magic-pdf 的原始产物共享数据，
+    这样即使原始图片被原地改写，以内容哈希命名的文件也不会随之改变。
+    """
+    _, extension = os.path.splitext(source_path)
+    object_path = os.path.join(config.ASSET_STORE_DIR, digest[:2], f"{digest}{extension.lower()}")
+    if not os.path.exists(object_path):
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        _clone(source_path, object_path, allow_hardlink=False)
+    return object_path
+
+def place_asset(source_path, dest_path):
+    """
+    将图片放置到 dest_path：内容相同的目标文件直接跳过；否则先按内容哈希存入资源库，
+    再从资源库硬链接到目标位置（跨文件系统时退化为 reflink 或复制）。
+    同一张图片被多次引用、或多篇论文中出现相同的图片（如徽标）时，磁盘上只保存一份数据。
+    返回 'unchanged'、'hardlink'、'reflink' 或 'copy'。
+    """
+    if os.path.exists(dest_path):
+        if os.path.samefile(source_path, dest_path):
+            return 'unchanged'
+        if os.path.getsize(source_path) == os.path.getsize(dest_path) \
+                and file_digest(source_path) == file_digest(dest_path):
+            return 'unchanged'
+
+    os.makedirs(os.path.dirname(dest_path) or '.', exist_ok=True)
+    try:
+        object_path = _store_object(source_path, file_digest(source_path))
+    except OSError as e:
+        print(f"警告: 无法写入图片资源库，将直接复制: {e}")
+        return _clone(source_path, dest_path, allow_hardlink=False)
+    return _clone(object_path, dest_path, allow_hardlink=True)
@@ -1,8 +1,16 @@
 import os
 import re
 import json
-import shutil
+import mmap
+from collections import deque
+from difflib import SequenceMatcher
 from PyPDF2 import PdfReader
+import structured_store
+from pdf_preprocess import asset_store
+
+# 目录与Markdown章节模糊匹配的相似度阈值(0~1)，以及每个未匹配目录项最多比较的候选章节数
+TOC_FUZZY_THRESHOLD = 0.8
+TOC_FUZZY_WINDOW = 20
 
 def get_toc_from_pdf(pdf_path):
     """
@@ -76,50 +84,71 @@ def build_toc_hierarchy(flat_toc):
         
     return hierarchical_toc
 
-def parse_md_content(md_path):
+# Markdown 标题行，以及代码块的起止围栏（``` 或 ~~~，最多缩进3个空格）
+_HEADING_PATTERN = re.compile(r'^(#+)\s+(.*)')
+_FENCE_PATTERN = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+# 超过该大小的Markdown文件通过内存映射逐行读取
+MD_MMAP_THRESHOLD_BYTES = 64 * 1024 * 1024
+
+def _iter_md_lines(md_path, use_mmap):
+    """逐行读取Markdown文件（保留行尾换行符）；use_mmap 时按内存映射读取，由操作系统按需换入页面。"""
+    if not use_mmap:
+        with open(md_path, 'r', encoding='utf-8') as f:
+            yield from f
+        return
+    with open(md_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:  # 空文件无法映射
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b''):
+                line = line.decode('utf-8')
+                # 与文本模式一致，统一换行符
+                yield line[:-2] + '\n' if line.endswith('\r\n') else line
+
+def iter_md_sections(md_path, use_mmap=False):
+    """
+    流式解析Markdown文件，按文档顺序逐个产出 (标题, 级别, 原文)，其中原文包含标题行本身。
+    第一个产出的总是标题之前的内容（标题、作者等），其标题为None、级别为0。
+    代码块（``` 或 ~~~ 围栏）中以 # 开头的行不会被当作标题。内存中只保留当前章节的内容。
+    """
+    title, level, lines = None, 0, []
+    fence = None
+    for line in _iter_md_lines(md_path, use_mmap):
+        # 绝大多数行既不是标题也不是围栏，先按首字符筛掉，避免逐行执行正则
+        first_char = line[:1]
+        fence_match = _FENCE_PATTERN.match(line) if first_char in '`~ ' else None
+        if fence is not None:
+            # 只有同种字符、且不短于起始围栏的行才能结束代码块
+            if fence_match and fence_match.group(1)[0] == fence[0] and len(fence_match.group(1)) >= len(fence) \
+                    and not line.strip().lstrip(fence[0]):
+                fence = None
+        elif fence_match:
+            fence = fence_match.group(1)
+        elif first_char == '#':
+            header_match = _HEADING_PATTERN.match(line)
+            if header_match:
+                yield title, level, "".join(lines).strip()
+                title, level, lines = header_match.group(2).strip(), len(header_match.group(1)), []
+        lines.append(line)
+    yield title, level, "".join(lines).strip()
+
+def parse_md_content(md_path, use_mmap=None):
     """
     解析Markdown文件，将其分割成带有标题、级别和内容的章节列表。
+    文件按行流式读取，不会整体载入内存；use_mmap 为None时，超过 MD_MMAP_THRESHOLD_BYTES 的文件使用内存映射。
     """
     try:
-        with open(md_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        if use_mmap is None:
+            use_mmap = os.path.getsize(md_path) > MD_MMAP_THRESHOLD_BYTES
+        sections_iter = iter_md_sections(md_path, use_mmap=use_mmap)
+        # 第一部分通常是摘要前的任何内容（标题、作者等）
+        _, _, preamble = next(sections_iter)
+        sections = [{'title': title, 'level': level, 'raw_content': raw_content}
+                    for title, level, raw_content in sections_iter]
     except FileNotFoundError:
         print(f"错误: Markdown文件未找到于 '{md_path}'")
         return None, []
 
-    # 按标题分割全文
-    # 使用正则表达式查找所有以'#'开头的行
-    # (?=...) 是一个正向前瞻，它匹配但不消耗字符，所以分隔符会保留在结果中
-    parts = re.split(r'(?=\n#+\s)', '\n' + content)
-    
-    sections = []
-    preamble = ""
-    
-    if parts:
-        # 第一部分通常是摘要前的任何内容（标题、作者等）
-        preamble = parts[0].strip()
-        
-        for part in parts[1:]:
-            part = part.strip()
-            if not part:
-                continue
-            
-            try:
-                header_match = re.match(r'^(#+)\s+(.*)', part)
-                if not header_match:
-                    continue
-
-                level = len(header_match.group(1))
-                title = header_match.group(2).split('\n')[0].strip()
-                
-                sections.append({
-                    'title': title,
-                    'level': level,
-                    'raw_content': part
-                })
-            except IndexError:
-                print(f"警告: 无法解析Markdown部分: '{part[:50]}...'")
-
     return preamble, sections
 
 def clean_title(title):
@@ -133,63 +162,286 @@ def clean_title(title):
     normalized = re.sub(r'[^\w\s]', '', normalized)
     return normalized.lower()
 
-def populate_content_and_assets(toc_nodes, md_sections, md_path, dest_image_dir, used_indices):
+def build_section_title_index(md_sections):
     """
-    递归地为层级目录填充内容和处理图片/表格。
-    图片将被从源目录复制并重命名到目标目录。
+    为Markdown章节建立 清理后的标题 -> 按出现顺序排列的章节下标队列 的索引。
+    每篇论文只需构建一次，匹配时无需再对每个目录节点重新清理所有章节标题。
     """
-    source_md_dir = os.path.dirname(md_path)
+    title_index = {}
+    for i, section in enumerate(md_sections):
+        title_index.setdefault(clean_title(section['title']), deque()).append(i)
+    return title_index
+
+def load_heading_pages(content_list_path):
+    """
+    从 magic-pdf 生成的 <name>_content_list.json 中按顺序读取所有标题及其页码（从1开始）。
+    返回 [(清理后的标题, 页码), ...]，文件不存在或无法解析时返回空列表。
+    """
+    try:
+        with open(content_list_path, 'r', encoding='utf-8') as f:
+            content_list = json.load(f)
+    except FileNotFoundError:
+        return []
+    except json.JSONDecodeError:
+        print(f"警告: 无法解析 {content_list_path}，目录匹配将不使用页码信息。")
+        return []
+
+    return [
+        (clean_title(item.get('text', '')), item.get('page_idx', 0) + 1)
+        for item in content_list
+        if item.get('type') == 'text' and item.get('text_level')
+    ]
+
+def assign_section_pages(md_sections, heading_pages, lookahead=5):
+    """
+    按文档顺序把 content_list 中的标题页码对齐到Markdown章节上（写入 section['page']）。
+    两者的标题顺序一致，只需单指针向前推进，并允许少量标题缺失；对不上的章节页码为None。
+    """
+    j = 0
+    for section in md_sections:
+        section['page'] = None
+        cleaned = clean_title(section['title'])
+        for k in range(j, min(j + lookahead, len(heading_pages))):
+            if heading_pages[k][0] == cleaned:
+                section['page'] = heading_pages[k][1]
+                j = k + 1
+                break
+
+def title_similarity(a, b, threshold=TOC_FUZZY_THRESHOLD):
+    """两个清理后标题的相似度(0~1)，先用廉价的上界估计剪枝（低于阈值时直接返回0），再计算精确的比值。"""
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+        return 0.0
+    return matcher.ratio()
+
+def _flatten_toc(toc_nodes):
+    """按文档顺序（先序遍历）展开层级目录。"""
+    flat = []
     for node in toc_nodes:
+        flat.append(node)
+        flat.extend(_flatten_toc(node['subsections']))
+    return flat
+
+def align_toc_with_sections(toc_nodes, md_sections, threshold=TOC_FUZZY_THRESHOLD, window=TOC_FUZZY_WINDOW):
+    """
+    将PDF目录节点与Markdown章节对齐，返回 {id(节点): 章节下标}，并在每个节点上记录 match_confidence。
+    1. 精确匹配：清理后标题相同且尚未使用的第一个章节，置信度为1.0，作为对齐锚点；
+    2. 模糊匹配：未匹配的节点只在前后两个锚点之间（最多 window 个）的未使用章节中查找，
+       要求页码相差不超过1页（页码未知时不限制），取相似度最高且不低于阈值者。
+    由于每个节点只比较常数个候选章节，整体为近线性时间。
+    """
+    nodes = _flatten_toc(toc_nodes)
+    cleaned_titles = [clean_title(section['title']) for section in md_sections]
+    title_index = build_section_title_index(md_sections)
+
+    assignment = [None] * len(nodes)
+    used = set()
+    for n, node in enumerate(nodes):
+        node['match_confidence'] = 0.0
+        candidates = title_index.get(clean_title(node['title']))
+        while candidates:
+            i = candidates.popleft()
+            if i not in used:
+                assignment[n] = i
+                used.add(i)
+                node['match_confidence'] = 1.0
+                break
+
+    # 每个节点之后最近的锚点所在的章节下标，用于限定模糊匹配的搜索区间
+    next_anchor = [len(md_sections)] * len(nodes)
+    upcoming = len(md_sections)
+    for n in range(len(nodes) - 1, -1, -1):
+        next_anchor[n] = upcoming
+        if assignment[n] is not None:
+            upcoming = assignment[n]
+
+    prev_anchor = -1
+    for n, node in enumerate(nodes):
+        if assignment[n] is not None:
+            prev_anchor = max(prev_anchor, assignment[n])
+            continue
+
         cleaned_node_title = clean_title(node['title'])
-        
-        for i, section in enumerate(md_sections):
-            if i in used_indices:
+        upper = next_anchor[n] if next_anchor[n] > prev_anchor else len(md_sections)
+        best_index, best_score = None, threshold
+        for i in range(prev_anchor + 1, min(upper, prev_anchor + 1 + window)):
+            if i in used:
+                continue
+            section_page = md_sections[i].get('page')
+            if section_page is not None and abs(section_page - node['page']) > 1:
                 continue
+            score = title_similarity(cleaned_node_title, cleaned_titles[i], threshold)
+            if score >= best_score:
+                best_index, best_score = i, score
+
+        if best_index is not None:
+            assignment[n] = best_index
+            used.add(best_index)
+            node['match_confidence'] = round(best_score, 3)
+            prev_anchor = best_index
+
+    exact = fuzzy = unmatched = 0
+    for node, i in zip(nodes, assignment):
+        if i is None:
+            unmatched += 1
+            print(f"   警告: 目录项 '{node['title']}' 未能匹配到任何章节，其内容将为空。")
+        elif node['match_confidence'] < 1.0:
+            fuzzy += 1
+            print(f"   模糊匹配: '{node['title']}' -> '{md_sections[i]['title']}' (置信度 {node['match_confidence']})")
+        else:
+            exact += 1
+    print(f"   目录匹配: 精确 {exact} 个，模糊 {fuzzy} 个，未匹配 {unmatched} 个")
+
+    return {id(node): i for node, i in zip(nodes, assignment) if i is not None}
+
+# 图片引用，以及图注/表注的开头：Figure/Fig./图 与 Table/Tab./表，后接编号与分隔符
+_IMAGE_PATTERN = re.compile(r'!\[[^\]\n]*\]\(([^)\s]*)\)')
+# 编号之后的 "." 只有在后面不是数字时才是分隔符，避免把 "Figure 3.1 Overview" 拆成编号 3 与图注 "1 Overview"
+_CAPTION_LABEL = r'(Figure|Fig\.?|Table|Tab\.?|图|表)\s*(\d+(?:\.\d+)*)\s*(?:[:：|]|\.(?!\d))\s*'
+# 图注可以跨越多行，直到空行、图片、标题、HTML表格或Markdown表格行为止
+_CAPTION_BODY = r'([^\n]*(?:\n(?![ \t]*(?:\n|$|!\[|#|<|\|))[^\n]*)*)'
+_CAPTION_BELOW_PATTERN = re.compile(r'\s*' + _CAPTION_LABEL + _CAPTION_BODY, re.IGNORECASE)
+_CAPTION_BLOCK_PATTERN = re.compile(r'[ \t]*' + _CAPTION_LABEL + _CAPTION_BODY + r'\s*$', re.IGNORECASE)
+_BLANK_LINE_PATTERN = re.compile(r'\n[ \t]*\n')
+
+def _normalize_asset_type(label):
+    return 'Table' if label.lower().startswith('tab') or label == '表' else 'Figure'
+
+def _caption_from_match(match):
+    return {
+        'type': _normalize_asset_type(match.group(1)),
+        'number': match.group(2),
+        'caption': ' '.join(line.strip() for line in match.group(3).split('\n') if line.strip()),
+        'span': (match.start(1), match.end(3)),  # 同一条图注无论作为上方还是下方候选，区间都相同
+    }
+
+def find_captioned_images(content):
+    """
+    找出章节原文中所有带图注/表注的图片，按出现顺序返回
+    [{'path', 'path_span', 'type'('Figure'/'Table'), 'number', 'caption'}]。
+    图注可以位于图片下方（紧随其后）或上方（图片前的一个段落），可以跨越多行，
+    并识别 "Figure 1:"、"Fig. 1."、"Table 2:"、"图1：" 等写法。
+    图片下方与上方都有候选图注时，表格取上方的表注（表注通常在表格之上）；图片取下方的图注，
+    但下方的图注与图片之间隔着空行时取上方的图注，因为它更可能是下一张图片的上方图注。
+    每条图注只会分配给一张图片；没有图注的图片不计入。
+    """
+    figures = []
+    used_captions = set()
+    for image_match in _IMAGE_PATTERN.finditer(content):
+        below_match = _CAPTION_BELOW_PATTERN.match(content, image_match.end())
+        below = _caption_from_match(below_match) if below_match else None
+        if below and below['span'] in used_captions:
+            below = None
+        below_detached = below is not None and \
+            _BLANK_LINE_PATTERN.search(content, image_match.end(), below_match.start(1)) is not None
+
+        # 图片之前的一个段落（以空行分隔）整体是一条图注时，作为上方的候选
+        above = None
+        block_end = len(content[:image_match.start()].rstrip())
+        if block_end:
+            block_start = content.rfind('\n\n', 0, block_end)
+            block_start = 0 if block_start < 0 else block_start + 2
+            above_match = _CAPTION_BLOCK_PATTERN.match(content, block_start, block_end)
+            if above_match:
+                above = _caption_from_match(above_match)
+                if above['span'] in used_captions:
+                    above = None
+
+        chosen = above if above and (below is None or below_detached or above['type'] == 'Table') else below
+        if chosen is None:
+            continue
+        used_captions.add(chosen['span'])
+        figures.append({
+            'path': image_match.group(1),
+            'path_span': image_match.span(1),
+            'type': chosen['type'],
+            'number': chosen['number'],
+            'caption': chosen['caption'],
+        })
+    return figures
 
-            if cleaned_node_title == clean_title(section['title']):
-                content = section['raw_content']
-                images_found = []
-                pattern = re.compile(r'!\[.*?\]\((.*?)\)\s*\n(Figure|Table)\s*([\d\.]+):\s*(.*)')
+def replace_spans(text, replacements):
+    """按 [((起, 止), 新文本)] 一次性替换 text 中互不重叠的片段，返回新文本。"""
+    pieces = []
+    last = 0
+    for (start, end), new_text in sorted(replacements):
+        pieces.append(text[last:start])
+        pieces.append(new_text)
+        last = end
+    pieces.append(text[last:])
+    return "".join(pieces)
+
+def populate_content_and_assets(toc_nodes, md_sections, md_path, dest_image_dir, used_indices, title_index=None, alignment=None):
+    """
+    递归地为层级目录填充内容和处理图片/表格。
+    图片以新的名称放置到目标目录（见 asset_store.place_asset）。
+    若提供 alignment（align_toc_with_sections 的结果）则按其对齐结果填充，
+    否则每个目录节点匹配标题相同且尚未被使用的第一个Markdown章节。
+    """
+    if alignment is None and title_index is None:
+        title_index = build_section_title_index(md_sections)
+
+    source_md_dir = os.path.dirname(md_path)
+    for node in toc_nodes:
+        match_index = None
+        if alignment is not None:
+            match_index = alignment.get(id(node))
+        else:
+            # 依次弹出候选下标，跳过已被使用的章节；被使用的章节不会再被匹配，因此可以直接丢弃
+            candidates = title_index.get(clean_title(node['title']))
+            while candidates:
+                i = candidates.popleft()
+                if i not in used_indices:
+                    match_index = i
+                    break
+
+        if match_index is not None:
+            section = md_sections[match_index]
+            content = section['raw_content']
+            images_found = []
+            replacements = []
+
+            for figure in find_captioned_images(content):
+                original_path_from_md = figure['path']
+                asset_type, number = figure['type'], figure['number']
+                asset_id_num = number.replace('.', '_')
+                caption = f"{asset_type} {number}: {figure['caption']}"
                 
-                for match in pattern.finditer(content):
-                    original_path_from_md = match.group(1)
-                    asset_type = match.group(2)
-                    asset_id_num = match.group(3).replace('.', '_')
-                    caption = f"{asset_type} {match.group(3)}: {match.group(4).strip()}"
-                    
-                    _, extension = os.path.splitext(original_path_from_md)
-                    new_filename = f"{asset_type}_{asset_id_num}{extension}"
-                    new_path_relative = os.path.join('images', new_filename)
-                    
-                    source_image_path = os.path.join(source_md_dir, original_path_from_md)
-                    dest_image_path = os.path.join(dest_image_dir, new_filename)
-
-                    try:
-                        if os.path.exists(source_image_path):
-                            os.makedirs(dest_image_dir, exist_ok=True)
-                            shutil.copy2(source_image_path, dest_image_path) # 使用copy2保留元数据
-                        else:
-                            print(f"警告: 找不到源图片文件: {source_image_path}")
-
-                    except OSError as e:
-                        print(f"错误: 复制文件 '{source_image_path}' 失败: {e}")
-
-                    content = content.replace(original_path_from_md, new_path_relative)
-                    
-                    images_found.append({
-                        'id': f"{asset_type} {match.group(3)}",
-                        'new_path': new_path_relative,
-                        'original_path': original_path_from_md,
-                        'caption': caption
-                    })
+                _, extension = os.path.splitext(original_path_from_md)
+                new_filename = f"{asset_type}_{asset_id_num}{extension}"
+                new_path_relative = os.path.join('images', new_filename)
                 
-                node['content'] = content
-                node['images'] = images_found
-                used_indices.add(i)
-                break
+                source_image_path = os.path.join(source_md_dir, original_path_from_md)
+                dest_image_path = os.path.join(dest_image_dir, new_filename)
+
+                try:
+                    if os.path.exists(source_image_path):
+                        # 经由内容寻址的资源库以硬链接放置，已是最新的图片直接跳过
+                        asset_store.place_asset(source_image_path, dest_image_path)
+                    else:
+                        print(f"警告: 找不到源图片文件: {source_image_path}")
+
+                except OSError as e:
+                    print(f"错误: 放置图片 '{source_image_path}' 失败: {e}")
+
+                replacements.append((figure['path_span'], new_path_relative))
+                
+                images_found.append({
+                    'id': f"{asset_type} {number}",
+                    'new_path': new_path_relative,
+                    'original_path': original_path_from_md,
+                    'caption': caption
+                })
+
+            # 只替换被识别的图片引用中的路径，一次线性拼接完成，不会误改共享前缀的其他路径
+            content = replace_spans(content, replacements)
+            
+            node['content'] = content
+            node['images'] = images_found
+            used_indices.add(match_index)
         
         if node['subsections']:
-            populate_content_and_assets(node['subsections'], md_sections, md_path, dest_image_dir, used_indices)
+            populate_content_and_assets(node['subsections'], md_sections, md_path, dest_image_dir, used_indices, title_index, alignment)
 
 def process_paper(paper_name):
     """
@@ -205,6 +457,7 @@ def process_paper(paper_name):
     source_pdf_path = os.path.join('pdf_preprocess', 'pdf', f'{paper_name}.pdf')
     source_output_dir = os.path.join('pdf_preprocess', 'output', paper_name, 'auto')
     source_md_path = os.path.join(source_output_dir, f'{paper_name}.md')
+    source_content_list_path = os.path.join(source_output_dir, f'{paper_name}_content_list.json')
 
     # 目标路径
     dest_paper_dir = os.path.join('output', paper_name)
@@ -226,9 +479,13 @@ def process_paper(paper_name):
     if not md_sections:
         return
 
-    print("4. 匹配目录、填充内容并复制/重命名图片...")
+    print("4. 对齐目录与章节（精确匹配 + 基于页码的模糊匹配）...")
+    assign_section_pages(md_sections, load_heading_pages(source_content_list_path))
+    alignment = align_toc_with_sections(structured_toc, md_sections)
+
+    print("5. 填充内容并放置/重命名图片...")
     used_indices = set()
-    populate_content_and_assets(structured_toc, md_sections, source_md_path, dest_image_dir, used_indices)
+    populate_content_and_assets(structured_toc, md_sections, source_md_path, dest_image_dir, used_indices, alignment=alignment)
 
     final_data = {
         'paper_title': preamble.split('\n')[0].replace('#', '').strip(),
@@ -236,13 +493,9 @@ def process_paper(paper_name):
         'sections': structured_toc
     }
     
-    print(f"5. 保存结构化数据到 {dest_json_path}...")
-    try:
-        with open(dest_json_path, 'w', encoding='utf-8') as f:
-            json.dump(final_data, f, indent=4, ensure_ascii=False)
+    print(f"6. 保存结构化数据到 {dest_json_path}...")
+    if structured_store.save_structured_data(final_data, dest_json_path):
         print("--- 处理完成 ---")
-    except IOError as e:
-        print(f"错误: 无法写入JSON文件: {e}")
 
 if __name__ == '__main__':
     # 调整这里的路径，使其在直接运行时也能找到example.pdf
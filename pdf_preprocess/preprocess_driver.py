@@ -0,0 +1,182 @@
+import os
+import re
+import sys
+import time
+import shutil
+import hashlib
+import filecmp
+import argparse
+import subprocess
+
+import config
+from pdf_preprocess.main_parser import process_paper
+
+PDF_DIR = os.path.join('pdf_preprocess', 'pdf')
+MAGIC_PDF_OUTPUT_DIR = os.path.join('pdf_preprocess', 'output')
+
+def sanitize_paper_name(name):
+    """将文件名中的非法字符替换为下划线，与 run_paper_analysis.sh 的规则一致。"""
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+def get_magic_pdf_md_path(paper_name, output_root=MAGIC_PDF_OUTPUT_DIR):
+    """magic-pdf 为论文生成的 markdown 文件路径：<output_root>/<name>/auto/<name>.md"""
+    return os.path.join(output_root, paper_name, 'auto', f'{paper_name}.md')
+
+def _stop_process(process, grace_seconds=5):
+    """先请求子进程退出，超时后强制结束，并回收进程，避免留下孤儿进程。"""
+    process.terminate()
+    try:
+        process.wait(timeout=grace_seconds)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def _output_sizes(paths):
+    """返回各输出文件的大小；任一文件尚不存在时返回None。"""
+    try:
+        return tuple(os.path.getsize(path) for path in paths)
+    except OSError:
+        return None
+
+def run_magic_pdf(pdf_path, paper_name, output_root=MAGIC_PDF_OUTPUT_DIR, timeout=None, poll_interval=None, on_crash=None):
+    """
+    以子进程方式运行 magic-pdf，并在处理完成后立即返回，而不是固定等待一段时间。
+    满足以下任一条件即视为完成：
+    1. 子进程退出（退出码为0且生成了markdown文件视为成功）；
+    2. auto/<name>.md 与 auto/<name>_content_list.json 均已出现且连续两次轮询大小不变（写入完毕），
+       此时再给子进程一个短暂的收尾时间，超时后结束子进程。
+    magic-pdf 异常退出（被信号终止或退出码非零）时以错误信息调用 on_crash。
+    返回是否成功生成了markdown文件。
+    """
+    timeout = timeout if timeout is not None else config.MAGIC_PDF_TIMEOUT
+    poll_interval = poll_interval if poll_interval is not None else config.MAGIC_PDF_POLL_INTERVAL
+    md_path = get_magic_pdf_md_path(paper_name, output_root)
+    content_list_path = os.path.join(os.path.dirname(md_path), f'{paper_name}_content_list.json')
+    command = [config.MAGIC_PDF_CMD, '-p', pdf_path, '-o', output_root, '-m', 'auto']
+
+    print(f"执行命令: {' '.join(command)}")
+    try:
+        process = subprocess.Popen(command)
+    except OSError as e:
+        print(f"错误: 无法启动 magic-pdf: {e}")
+        return False
+
+    start_time = time.time()
+    last_sizes = None
+    while True:
+        return_code = process.poll()
+        if return_code is not None:
+            if return_code != 0:
+                error = f"magic-pdf 处理失败，退出码 {return_code}"
+                print(f"错误: {error}")
+                if on_crash:
+                    on_crash(error)
+                return False
+            break
+
+        # content_list.json 在 markdown 之后写入，只等 markdown 就结束进程可能截断它
+        sizes = _output_sizes((md_path, content_list_path))
+        if sizes is not None:
+            if all(sizes) and sizes == last_sizes:
+                print("检测到 markdown 与 content_list 文件已生成，等待 magic-pdf 收尾...")
+                try:
+                    process.wait(timeout=config.MAGIC_PDF_GRACE_PERIOD)
+                except subprocess.TimeoutExpired:
+                    print("magic-pdf 在收尾时间内未退出，终止进程后继续后续处理。")
+                    _stop_process(process)
+                break
+        last_sizes = sizes
+
+        elapsed = time.time() - start_time
+        if elapsed > timeout:
+            print(f"错误: magic-pdf 处理超时 ({timeout} 秒)，终止进程。")
+            _stop_process(process)
+            return False
+        time.sleep(poll_interval)
+
+    if not os.path.exists(md_path):
+        print(f"错误: magic-pdf 已结束，但未找到输出文件: {md_path}")
+        return False
+    print(f"magic-pdf 处理完成，耗时 {time.time() - start_time:.1f} 秒")
+    return True
+
+def preprocess_paper(paper_name, force=False, timeout=None, on_crash=None):
+    """
+    预处理 pdf_preprocess/pdf/<name>.pdf：如 magic-pdf 产物不存在（或 force=True）则先运行 magic-pdf，
+    完成后立即调用 process_paper 生成 structured_data.json。on_crash 见 run_magic_pdf。
+    """
+    pdf_path = os.path.join(PDF_DIR, f'{paper_name}.pdf')
+    md_path = get_magic_pdf_md_path(paper_name)
+
+    if force or not os.path.exists(md_path):
+        if not os.path.exists(pdf_path):
+            print(f"错误: 找不到PDF文件 {pdf_path}，且不存在 magic-pdf 产物 {md_path}")
+            return False
+        print(f"--- 使用 magic-pdf 解析: {pdf_path} ---")
+        if not run_magic_pdf(pdf_path, paper_name, timeout=timeout, on_crash=on_crash):
+            return False
+    else:
+        print(f"--- 已存在 magic-pdf 产物，跳过解析: {md_path} ---")
+
+    process_paper(paper_name)
+    return os.path.exists(os.path.join('output', paper_name, 'structured_data.json'))
+
+def _claim_paper_name(stem):
+    """
+    为原始文件名 stem 确定论文名称：通常为清理后的名称，并在 pdf_preprocess/pdf/<名称>.source 中记录原始文件名。
+    若该名称已被另一个原始文件名占用（如 "a b.pdf" 与 "a-b.pdf" 清理后相同），
+    则加上由原始文件名计算的短哈希后缀，使两篇论文互不覆盖，且同一文件再次放入时得到相同的名称。
+    """
+    paper_name = sanitize_paper_name(stem)
+    try:
+        with open(os.path.join(PDF_DIR, f'{paper_name}.source'), 'r', encoding='utf-8') as f:
+            owner = f.read()
+    except OSError:
+        owner = None
+    if owner is not None and owner != stem:
+        paper_name = f"{paper_name}_{hashlib.sha256(stem.encode('utf-8')).hexdigest()[:8]}"
+        print(f"--- {stem}.pdf 与 {owner}.pdf 清理后的名称相同，改用论文名称 {paper_name} ---")
+    with open(os.path.join(PDF_DIR, f'{paper_name}.source'), 'w', encoding='utf-8') as f:
+        f.write(stem)
+    return paper_name
+
+def stage_pdf(pdf_path):
+    """
+    按清理后的论文名称将任意位置的PDF文件放入 pdf_preprocess/pdf/，
+    使 magic-pdf 的输出目录名与 process_paper 使用的论文名称保持一致。
+    不同文件名清理后相同时由 _claim_paper_name 区分；
+    同名论文的PDF内容变化时删除旧的 magic-pdf 产物，使其重新解析。返回论文名称。
+    """
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    os.makedirs(PDF_DIR, exist_ok=True)
+    staged_pdf_path = os.path.join(PDF_DIR, f'{sanitize_paper_name(stem)}.pdf')
+    if os.path.exists(staged_pdf_path) and os.path.samefile(pdf_path, staged_pdf_path):
+        return sanitize_paper_name(stem)
+    paper_name = _claim_paper_name(stem)
+    staged_pdf_path = os.path.join(PDF_DIR, f'{paper_name}.pdf')
+    if not os.path.exists(staged_pdf_path) or not filecmp.cmp(pdf_path, staged_pdf_path, shallow=False):
+        shutil.copy2(pdf_path, staged_pdf_path)
+        stale_output = os.path.join(MAGIC_PDF_OUTPUT_DIR, paper_name)
+        if os.path.isdir(stale_output):
+            print(f"--- {paper_name} 的PDF已变化，删除旧的 magic-pdf 产物 ---")
+            shutil.rmtree(stale_output)
+    return paper_name
+
+def preprocess_pdf(pdf_path, force=False, timeout=None):
+    """预处理任意位置的PDF文件（先经 stage_pdf 放入 pdf_preprocess/pdf/）。成功时返回论文名称，失败时返回None。"""
+    paper_name = stage_pdf(pdf_path)
+    if not preprocess_paper(paper_name, force=force, timeout=timeout):
+        return None
+    return paper_name
+
+if __name__ == '__main__':
+    # 需从项目根目录运行: python -m pdf_preprocess.preprocess_driver path/to/paper.pdf
+    parser = argparse.ArgumentParser(description="运行 magic-pdf 并生成结构化数据")
+    parser.add_argument("pdf_path", help="PDF文件路径")
+    parser.add_argument("--timeout", type=int, default=config.MAGIC_PDF_TIMEOUT, help="magic-pdf 最长等待时间（秒）")
+    parser.add_argument("--force", action="store_true", help="即使已有 magic-pdf 产物也重新解析")
+    args = parser.parse_args()
+
+    name = preprocess_pdf(args.pdf_path, force=args.force, timeout=args.timeout)
+    if not name:
+        sys.exit(1)
@@ -0,0 +1,214 @@
+import os
+import time
+import signal
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+import config
+
+# worker 内存看门狗检查进程树常驻内存的间隔（秒）
+MEMORY_POLL_INTERVAL = 1.0
+
+# 仅在 worker 进程中使用：当前正在预处理的论文，以及向主进程报告"因哪篇论文而崩溃"的队列
+_current_paper = None
+_crash_reports = None
+
+class MagicPdfCrashed(RuntimeError):
+    """magic-pdf 异常退出（被信号终止或退出码非零），可能是内存不足等偶发原因，应当重试。"""
+
+def get_available_memory_bytes():
+    """返回当前可用的物理内存字节数，无法获取时返回None。"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def plan_worker_count(requested=None, worker_memory_mb=None):
+    """
+    计算预处理进程池大小：不超过CPU核数，也不超过可用内存能容纳的 worker 数。
+    requested 为正数时直接使用该值。
+    """
+    if requested and requested > 0:
+        return requested
+    worker_memory_mb = worker_memory_mb or config.PREPROCESS_WORKER_MEMORY_MB
+    workers = os.cpu_count() or 1
+    available = get_available_memory_bytes()
+    if available and worker_memory_mb > 0:
+        workers = min(workers, available // (worker_memory_mb * 1024 * 1024))
+    return max(1, int(workers))
+
+def _read_process_table():
+    """从 /proc 读取全部进程的 {进程号: (父进程号, 常驻内存字节数)}，无法读取时返回None。"""
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    try:
+        pids = [int(name) for name in os.listdir('/proc') if name.isdigit()]
+    except OSError:
+        return None
+    table = {}
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat', 'r') as f:
+                # 进程名可能包含空格与括号，字段从最后一个 ')' 之后开始：状态、父进程号、……、RSS(页数)
+                fields = f.read().rsplit(')', 1)[1].split()
+            table[pid] = (int(fields[1]), int(fields[21]) * page_size)
+        except (OSError, IndexError, ValueError):
+            continue
+    return table
+
+def _process_tree(root_pid, table):
+    """返回 root_pid 及其全部后代进程的进程号列表。"""
+    children = {}
+    for pid, (parent, _) in table.items():
+        children.setdefault(parent, []).append(pid)
+    tree, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        tree.append(pid)
+        stack.extend(children.get(pid, []))
+    return tree
+
+def _memory_watchdog(limit_bytes):
+    """
+    worker 的后台线程：进程树（worker 与 magic-pdf 子进程）的常驻内存之和超过上限时结束整个进程树。
+    只统计常驻内存（RSS）而不限制地址空间：torch/CUDA 会预留远超实际使用量的虚拟地址空间。
+    """
+    worker_pid = os.getpid()
+    while True:
+        time.sleep(MEMORY_POLL_INTERVAL)
+        table = _read_process_table()
+        if table is None:
+            continue
+        tree = _process_tree(worker_pid, table)
+        rss = sum(table[pid][1] for pid in tree if pid in table)
+        if rss > limit_bytes:
+            print(f"错误: 预处理进程的常驻内存 {rss // (1024 * 1024)} MB 超过上限 "
+                  f"{limit_bytes // (1024 * 1024)} MB，终止该进程（将重建进程池后重试）")
+            if _current_paper is not None and _crash_reports is not None:
+                _crash_reports.put(_current_paper)
+            for pid in tree[1:]:  # 先结束 magic-pdf 等后代进程，避免它们在 worker 退出后成为孤儿
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+            os._exit(1)
+
+def _limit_worker_memory(worker_memory_mb, crash_reports=None):
+    """
+    进程池 initializer：启动内存看门狗，按 worker 与其 magic-pdf 子进程的常驻内存之和限制内存，
+    超限时把当前论文名称写入 crash_reports 后结束 worker，进程池损坏后受影响的论文会被重试。
+    没有 /proc 的平台上不做限制。
+    """
+    global _crash_reports
+    _crash_reports = crash_reports
+    if worker_memory_mb <= 0:
+        return
+    if not os.path.isdir('/proc'):
+        print("警告: 当前平台不支持读取进程内存，无法限制预处理进程的内存。")
+        return
+    threading.Thread(target=_memory_watchdog, args=(worker_memory_mb * 1024 * 1024,), daemon=True).start()
+
+def _preprocess_worker(paper_name, force=False):
+    """
+    在独立进程中完成单篇论文的 magic-pdf 解析与结构化处理；产物已是最新时直接跳过。
+    magic-pdf 异常退出时抛出 MagicPdfCrashed，由调用方重试。
+    """
+    global _current_paper
+    from pipeline import STAGES, run_stage
+    from pdf_preprocess.preprocess_driver import preprocess_paper
+    crashes = []
+    stage = dict(STAGES[0], func=functools.partial(preprocess_paper, on_crash=crashes.append))
+    _current_paper = paper_name
+    try:
+        ok, _ = run_stage(paper_name, stage, force=force)
+    finally:
+        _current_paper = None
+    if not ok and crashes:
+        raise MagicPdfCrashed(crashes[-1])
+    return ok
+
+def iter_preprocessed(paper_names, max_workers=None, max_retries=None, worker_memory_mb=None, force=False):
+    """
+    用进程池并发预处理多篇论文，每完成一篇就产出 (论文名称, 是否成功, 错误信息)，
+    调用方可以立即把成功的论文交给后续分析阶段。
+    worker 崩溃（如因内存超限被看门狗结束）导致进程池损坏时，会重建进程池并重试受影响的论文；
+    magic-pdf 异常退出时同样重试。每篇论文最多重试 max_retries 次；预处理正常返回失败则不重试。
+    """
+    max_retries = config.PREPROCESS_MAX_RETRIES if max_retries is None else max_retries
+    worker_memory_mb = config.PREPROCESS_WORKER_MEMORY_MB if worker_memory_mb is None else worker_memory_mb
+    max_workers = plan_worker_count(max_workers, worker_memory_mb)
+    # 使用 spawn 启动 worker，避免在多线程的父进程中 fork
+    mp_context = multiprocessing.get_context('spawn')
+    print(f"--- 预处理进程池: {max_workers} 个 worker，每个内存上限 {worker_memory_mb} MB ---")
+
+    attempts = {name: 0 for name in paper_names}
+    to_submit = list(paper_names)
+    # worker 因内存超限被看门狗结束前，会把当时正在处理的论文写入该队列
+    crash_reports = mp_context.SimpleQueue()
+
+    def new_executor():
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context,
+                                   initializer=_limit_worker_memory, initargs=(worker_memory_mb, crash_reports))
+
+    executor = new_executor()
+    pending = {}
+    try:
+        while to_submit or pending:
+            while to_submit:
+                paper_name = to_submit.pop(0)
+                attempts[paper_name] += 1
+                pending[executor.submit(_preprocess_worker, paper_name, force)] = paper_name
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            failed = []
+            broken = []
+            for future in done:
+                paper_name = pending.pop(future)
+                try:
+                    ok = future.result()
+                except BrokenProcessPool:
+                    broken.append(paper_name)
+                except Exception as e:
+                    failed.append((paper_name, f"预处理发生异常: {type(e).__name__}: {e}"))
+                else:
+                    yield paper_name, ok, None if ok else "预处理未生成 structured_data.json"
+
+            if broken:
+                # 进程池一旦损坏，其中尚未完成的任务都会失败，需要重建进程池并重新提交。
+                # 只有导致崩溃的论文计入重试次数，其余受牵连的论文退还本次计数；
+                # 无法得知是哪篇论文导致崩溃时（如 worker 被系统直接杀死），仍按原先的方式计入已收到异常的论文
+                culprits = set()
+                while not crash_reports.empty():
+                    culprits.add(crash_reports.get())
+                for future in pending:
+                    future.cancel()
+                affected = broken + list(pending.values())
+                pending.clear()
+                for paper_name in affected:
+                    charged = paper_name in culprits if culprits else paper_name in broken
+                    if charged:
+                        failed.append((paper_name, "预处理进程异常退出"))
+                    else:
+                        attempts[paper_name] -= 1
+                        to_submit.append(paper_name)
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = new_executor()
+
+            for paper_name, error in failed:
+                if attempts[paper_name] <= max_retries:
+                    print(f"警告: {paper_name} {error}，准备第 {attempts[paper_name]} 次重试")
+                    to_submit.append(paper_name)
+                else:
+                    yield paper_name, False, error
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        crash_reports.close()
@@ -0,0 +1,326 @@
+import os
+import json
+import time
+import asyncio
+import traceback
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import build_graph
+from analyzers.structure_analyzer import analyze_paper_structure
+from analyzers import figure_progress
+from analyzers import metrics
+from analyzers.image_analyzer import analyze_paper_images
+from analyzers.content_analyzer import analyze_paper_content
+from analyzers.insight_analyzer import analyze_paper_insight
+from analyzers.report_generator import generate_final_report
+from pdf_preprocess.preprocess_driver import preprocess_paper, stage_pdf
+from pdf_preprocess.preprocess_farm import iter_preprocessed
+
+# 六个阶段按顺序执行，构成一条产物依赖链。每个阶段的字段：
+# - name: 阶段名称；func: 阶段函数；artifact: 阶段完成后应存在的产物文件（位于 output/<论文>/ 下）
+# - extra_artifacts: 阶段附带生成、供下游读取的其他文件，缺失时该阶段同样需要重新执行
+# - inputs: 阶段读取的文件，产物指纹由这些文件的内容、prompts 中使用的Prompt模板与 model 指定的模型名称决定
+# - overlaps: 可与之并发运行的上游阶段：上游需要重新执行时本阶段不等它完成就开始（逐项等待其中间结果），
+#   但直到上游成功结束后才记为完成；on_start: 阶段函数开始前、下游得知本阶段需要执行之前调用的登记函数
+# - incremental: 阶段函数自行按输入逐项判断需要重做的部分，指纹变化时保留旧产物（--force 时仍然删除）
+# 预处理阶段在缺少 magic-pdf 产物时会先解析PDF，完成后立即进入 process_paper
+STAGES = [
+    {"name": "预处理", "func": preprocess_paper, "artifact": "structured_data.json",
+     "inputs": ["pdf_preprocess/pdf/{paper}.pdf", "pdf_preprocess/output/{paper}/auto/{paper}.md"]},
+    {"name": "结构分析", "func": analyze_paper_structure, "artifact": "section_mapping.json",
+     "inputs": ["structured_data.json"],
+     "prompts": ["MAPPING_SECTIONS_PROMPT"], "model": "LLM_MODEL_NAME"},
+    {"name": "图片分析", "func": analyze_paper_images, "artifact": "image_analysis.md",
+     "extra_artifacts": ["figure_index.json"], "on_start": figure_progress.start,
+     "inputs": ["structured_data.json", "images"],
+     "prompts": ["ANALYZE_FIGURE_PROMPT", "ANALYZE_FIGURES_BATCH_PROMPT"], "model": "VISION_MODEL_NAME"},
+    {"name": "内容分析", "func": analyze_paper_content, "artifact": "content_analysis.json",
+     "overlaps": ["图片分析"], "incremental": True,
+     "inputs": ["structured_data.json", "section_mapping.json", "figure_index.json"],
+     "prompts": ["SMART_ANALYZE_SECTION_PROMPT", "DEEP_ANALYZE_PROMPT", "MERGE_SECTION_ANALYSIS_PROMPT"],
+     "model": "LLM_MODEL_NAME"},
+    {"name": "洞察分析", "func": analyze_paper_insight, "artifact": "insights.md",
+     "inputs": ["structured_data.json", "section_mapping.json", "image_analysis.md", "content_analysis.json"],
+     "prompts": ["GENERATE_FINAL_INSIGHTS_PROMPT"], "model": "LLM_MODEL_NAME"},
+    {"name": "报告生成", "func": generate_final_report, "artifact": "Final_Report.md",
+     "inputs": ["structured_data.json", "section_mapping.json", "image_analysis.md",
+                "content_analysis.json", "insights.md"]},
+]
+
+def run_stage(paper_name, stage, force=False, on_status=None, before_commit=None, queued_at=None, rerun=False):
+    """
+    增量执行单个阶段并检查其产物。
+    产物存在且指纹（输入内容 + Prompt模板 + 模型名称）未变时直接跳过；指纹变化时删除旧产物后重新生成
+    （incremental 阶段保留旧产物，由阶段函数只重做输入变化的部分）。
+    rerun 为 True 时即使产物已是最新也执行阶段函数（用于上游正在并发重新执行的情况）。
+    各阶段函数自身只打印错误而不抛出异常，因此以产物文件是否存在来判断阶段是否成功；
+    阶段函数返回 False 表示产物可用但不完整。
+    on_status 在判断出构建状态（fresh/resume/stale）后立即以该状态调用；
+    before_commit 在阶段函数返回后、记为完成前调用，返回 (是否成功, 错误信息)，用于等待并发运行的上游阶段。
+    阶段的耗时、排队时间（自 queued_at 起）与模型调用统计写入 output/<论文>/metrics.jsonl。
+    返回 (是否成功, 错误信息)。
+    """
+    with metrics.stage_scope(paper_name, stage["name"], queued_at=queued_at) as stage_record:
+        ok, error, status = _run_stage(paper_name, stage, force, on_status, before_commit, rerun)
+        stage_record.update(status=status, error=error)
+    return ok, error
+
+def _run_stage(paper_name, stage, force, on_status, before_commit, rerun):
+    """run_stage 的实际执行部分，返回 (是否成功, 错误信息, 计量状态)。"""
+    stage_name, artifact = stage["name"], stage["artifact"]
+    status, fingerprint = build_graph.check_stage(paper_name, stage, force=force)
+    if status == 'fresh' and rerun:
+        status = 'resume'
+    if status == 'fresh':
+        if on_status:
+            on_status(status)
+        print(f"--- [{paper_name}] {stage_name}阶段的产物 {artifact} 已是最新，跳过 ---")
+        return True, None, "fresh"
+
+    discard = status == 'stale' and (force or not stage.get("incremental"))
+    build_graph.mark_stage_started(paper_name, stage, fingerprint, discard_artifact=discard)
+    if stage.get("on_start"):
+        stage["on_start"](paper_name)
+    if on_status:
+        on_status(status)
+    try:
+        stage_result = stage["func"](paper_name)
+    except Exception as e:
+        traceback.print_exc()
+        return False, f"{stage_name}阶段发生异常: {e}", "failed"
+
+    if before_commit:
+        ok, error = before_commit()
+        if not ok:
+            return False, error, "failed"
+
+    artifact_path = os.path.join('output', paper_name, artifact)
+    if not os.path.exists(artifact_path):
+        return False, f"{stage_name}阶段未生成 {artifact}", "failed"
+    if stage_result is False:
+        # 产物已生成但不完整（如部分图片分析失败）：下游照常继续，但不记为完成，下次运行时该阶段会续跑
+        print(f"--- [{paper_name}] {stage_name}阶段的产物不完整，下次运行时将重试 ---")
+        return True, None, "incomplete"
+    build_graph.mark_stage_complete(paper_name, stage)
+    return True, None, "success"
+
+def get_stage_dependencies(stages=STAGES):
+    """
+    根据各阶段读取的文件推导阶段依赖图：读取了某阶段产物的阶段依赖于该阶段。
+    返回 {阶段名称: [依赖的阶段名称]}；产物不由 stages 中任何阶段生成的输入视为已就绪。
+    """
+    producers = {}
+    for stage in stages:
+        for artifact in [stage["artifact"]] + stage.get("extra_artifacts", []):
+            producers[artifact] = stage["name"]
+    dependencies = {}
+    for stage in stages:
+        upstream = []
+        for input_path in stage["inputs"]:
+            producer = producers.get(input_path)
+            if producer and producer != stage["name"] and producer not in upstream:
+                upstream.append(producer)
+        dependencies[stage["name"]] = upstream
+    return dependencies
+
+async def run_paper_dag(paper_name, stages=STAGES, force=False, stage_limits=None):
+    """
+    按依赖图异步执行单篇论文的各阶段：每个阶段在其全部上游阶段成功后立即开始，
+    互不依赖的阶段（如结构分析与图片分析，二者都只依赖 structured_data.json）同时运行。
+    声明了 overlaps 的阶段在其上游需要重新执行时与上游并发运行（如内容分析逐部分等待图片分析的中间结果），
+    此时本阶段总是执行（旧产物可能基于过时的上游产物），由 incremental 阶段自行判断哪些部分需要重做。
+    阶段函数是同步的，在线程池中执行；stage_limits 为 {阶段名称: asyncio.Semaphore}，用于批量模式下限制每个阶段同时处理的论文数。
+    任一阶段失败时，其下游阶段不再执行。返回该论文的结果记录。
+    """
+    result = {"paper": paper_name, "status": "success", "failed_stage": None, "error": None}
+    start_time = time.time()
+    dependencies = get_stage_dependencies(stages)
+    failures = {}
+    tasks = {}
+    loop = asyncio.get_running_loop()
+    # 各阶段的构建状态一经判断即写入，未执行的阶段记为 'failed'；供声明了 overlaps 的下游决定是否提前开始
+    decided = {stage["name"]: loop.create_future() for stage in stages}
+
+    def set_decided(stage_name, status):
+        if not decided[stage_name].done():
+            decided[stage_name].set_result(status)
+
+    async def await_upstreams(names):
+        for upstream in names:
+            if not await tasks[upstream]:
+                return False, f"上游阶段{upstream}失败"
+        return True, None
+
+    async def run_stage_node(stage):
+        stage_name = stage["name"]
+        overlaps = [name for name in stage.get("overlaps", []) if name in dependencies[stage_name]]
+        ok, _ = await await_upstreams([name for name in dependencies[stage_name] if name not in overlaps])
+        if not ok:
+            return False
+
+        running_upstreams = []
+        for upstream in overlaps:
+            upstream_status = await decided[upstream]
+            if upstream_status == 'failed':
+                return False
+            if upstream_status == 'fresh':
+                if not await tasks[upstream]:
+                    return False
+            else:
+                running_upstreams.append(upstream)
+
+        def before_commit():
+            # 在线程中等待并发运行的上游阶段结束
+            return asyncio.run_coroutine_threadsafe(await_upstreams(running_upstreams), loop).result()
+
+        queued_at = time.monotonic()
+        limit = (stage_limits or {}).get(stage_name) or contextlib.nullcontext()
+        async with limit:
+            ok, error = await asyncio.to_thread(
+                run_stage, paper_name, stage, force,
+                on_status=lambda status: loop.call_soon_threadsafe(set_decided, stage_name, status),
+                before_commit=before_commit if running_upstreams else None, queued_at=queued_at,
+                rerun=bool(running_upstreams))
+        if not ok:
+            failures[stage_name] = error
+        return ok
+
+    async def run_node(stage):
+        try:
+            return await run_stage_node(stage)
+        finally:
+            set_decided(stage["name"], 'failed')
+
+    # STAGES 按拓扑顺序排列，创建任务时上游任务总是已经存在
+    for stage in stages:
+        tasks[stage["name"]] = asyncio.create_task(run_node(stage))
+    await asyncio.gather(*tasks.values())
+
+    for stage in stages:
+        if stage["name"] in failures:
+            result.update(status="failed", failed_stage=stage["name"], error=failures[stage["name"]])
+            break
+    result["elapsed"] = time.time() - start_time
+    return result
+
+def run_paper_pipeline(paper_name, force=False):
+    """
+    为单篇论文按依赖图增量执行全部六个阶段，结束后打印各阶段的性能汇总。
+    force=True 时忽略构建记录全部重建。返回该论文的结果记录。
+    """
+    start_time = time.time()
+    result = asyncio.run(run_paper_dag(paper_name, force=force))
+    metrics.print_summary(paper_name, since=start_time)
+    return result
+
+def discover_papers(source):
+    """
+    从目录或清单文件中获取待处理的论文名称列表。
+    - 目录：其中每个 .pdf 文件对应一篇论文
+    - .json 清单：论文名称组成的列表
+    - 其他文本清单：每行一个论文名称或PDF路径，忽略空行和以 # 开头的行
+    找到的PDF文件经 stage_pdf 按清理后的名称放入 pdf_preprocess/pdf/，预处理阶段据此解析。
+    """
+    if os.path.isdir(source):
+        pdf_paths = sorted(os.path.join(source, f) for f in os.listdir(source) if f.lower().endswith('.pdf'))
+        return sorted(set(stage_pdf(path) for path in pdf_paths))
+
+    with open(source, 'r', encoding='utf-8') as f:
+        if source.lower().endswith('.json'):
+            entries = json.load(f)
+        else:
+            entries = [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+    papers = []
+    for entry in entries:
+        if entry.lower().endswith('.pdf'):
+            name = stage_pdf(entry) if os.path.isfile(entry) else os.path.splitext(os.path.basename(entry))[0]
+        else:
+            name = entry
+        if name not in papers:
+            papers.append(name)
+    return papers
+
+def run_batch(paper_names, papers_per_stage=None, preprocess_workers=None, force=False):
+    """
+    以流水线方式批量处理多篇论文，全部调度在同一个事件循环中完成：
+    - 预处理（CPU密集）由进程池并发完成，每完成一篇就立即开始该论文的分析；
+    - 每篇论文的分析阶段按依赖图执行，不同论文可以同时处于不同阶段，
+      每个阶段同时处理的论文数不超过 papers_per_stage。
+    对模型端点的并发由 model_clients 中的全局信号量统一限制；各阶段按构建记录增量执行。
+    返回按输入顺序排列的每篇论文结果记录。
+    """
+    papers_per_stage = max(1, papers_per_stage or config.BATCH_PAPERS_PER_STAGE)
+    return asyncio.run(_run_batch_async(paper_names, papers_per_stage, preprocess_workers, force))
+
+async def _run_batch_async(paper_names, papers_per_stage, preprocess_workers, force):
+    loop = asyncio.get_running_loop()
+    analysis_stages = STAGES[1:]
+    # 每个分析阶段最多 papers_per_stage 个线程，另留一个线程给预处理结果的接收
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=papers_per_stage * len(analysis_stages) + 1))
+    stage_limits = {stage["name"]: asyncio.Semaphore(papers_per_stage) for stage in analysis_stages}
+    start_time = time.time()
+    results = {name: {"paper": name, "status": "pending", "failed_stage": None, "error": None,
+                      "elapsed": 0.0, "started_at": start_time} for name in paper_names}
+    preprocessed = asyncio.Queue()
+
+    def mark_failed(paper_name, stage_name, error):
+        results[paper_name].update(status="failed", failed_stage=stage_name, error=error,
+                                   elapsed=time.time() - start_time)
+        print(f"=== [{paper_name}] {error} ===")
+
+    def preprocess_feeder():
+        # 在线程中迭代进程池的结果，并把每篇论文的预处理结果交回事件循环
+        reported = set()
+        try:
+            for paper_name, ok, error in iter_preprocessed(paper_names, max_workers=preprocess_workers, force=force):
+                reported.add(paper_name)
+                loop.call_soon_threadsafe(preprocessed.put_nowait, (paper_name, ok, error))
+        except Exception as e:
+            traceback.print_exc()
+            for paper_name in paper_names:
+                if paper_name not in reported:
+                    loop.call_soon_threadsafe(preprocessed.put_nowait, (paper_name, False, f"预处理进程池异常: {e}"))
+        finally:
+            loop.call_soon_threadsafe(preprocessed.put_nowait, None)
+
+    async def analyze_paper(paper_name):
+        print(f"=== [{paper_name}] 预处理完成，开始分析 ===")
+        record = await run_paper_dag(paper_name, analysis_stages, force=force, stage_limits=stage_limits)
+        if record["status"] != "success":
+            mark_failed(paper_name, record["failed_stage"], record["error"])
+        else:
+            results[paper_name].update(status="success", elapsed=time.time() - start_time)
+
+    feeder = loop.run_in_executor(None, preprocess_feeder)
+    paper_tasks = []
+    while True:
+        item = await preprocessed.get()
+        if item is None:
+            break
+        paper_name, ok, error = item
+        if ok:
+            paper_tasks.append(asyncio.create_task(analyze_paper(paper_name)))
+        else:
+            mark_failed(paper_name, STAGES[0]["name"], error)
+
+    await feeder
+    await asyncio.gather(*paper_tasks)
+    return [results[name] for name in paper_names]
+
+def print_batch_summary(results):
+    """打印批量处理的逐篇结果汇总，以及每篇论文各阶段的性能汇总。"""
+    for r in results:
+        metrics.print_summary(r["paper"], since=r.get("started_at"))
+    succeeded = sum(1 for r in results if r["status"] == "success")
+    print("=" * 60)
+    print(f"批量处理完成: 共 {len(results)} 篇，成功 {succeeded} 篇，失败 {len(results) - succeeded} 篇")
+    print("=" * 60)
+    for r in results:
+        if r["status"] == "success":
+            print(f"✅ {r['paper']} ({r['elapsed']:.1f}s)")
+        else:
+            print(f"❌ {r['paper']} ({r['elapsed']:.1f}s) 失败于 {r['failed_stage']}: {r['error']}")
+    print("=" * 60)
@@ -76,6 +76,37 @@ ANALYZE_FIGURE_PROMPT = """
 请返回一段通顺的文本，全面地解读这个图表。
 """
 
+# 批量模式：一次请求分析多张图表，图片按顺序附在本Prompt之前，每张图片前有其编号
+ANALYZE_FIGURES_BATCH_PROMPT = """
+你是一个专门分析学术论文图表的AI助手。
+用户按顺序提供了 {figure_count} 张图表图片，每张图片前都标注了它的编号（如 "[图表 1]"）。
+请对 **每一张** 图表分别生成详细解读。
+
+**每张图表的解读目标:**
+1.  **描述图表内容 (What):** 清晰地描述图表是什么类型（如折线图、柱状图、流程图、模型架构图等），以及它展示了哪些数据和元素。
+2.  **解释图表目的 (Why):** 分析作者展示这个图表的意图是什么？它试图说明什么问题或证明什么观点？
+3.  **总结图表结论 (Conclusion):** 从图表中可以得出什么核心结论或重要发现？
+
+**各图表的图注/表注:**
+{figure_captions}
+
+**输出要求:**
+1.  你的输出必须是 **严格的JSON格式**，不包含任何JSON以外的解释或文字。
+2.  JSON的键（key）是 **"figures"**，其值是一个列表，按编号顺序为每张图表给出一个对象。
+3.  每个对象包含 **"index"**（图表编号，整数）和 **"analysis"**（对该图表的一段通顺、全面的解读文本）。
+4.  不同图表的解读必须相互独立，不要在一张图表的解读中引用另一张图表的编号。
+
+**示例输出格式:**
+```json
+{{
+    "figures": [
+        {{"index": 1, "analysis": "对图表1的详细解读..."}},
+        {{"index": 2, "analysis": "对图表2的详细解读..."}}
+    ]
+}}
+```
+"""
+
 GENERATE_FINAL_INSIGHTS_PROMPT = """
 你是一个顶尖的科研领域AI评审员。
 你的任务是在阅读了一篇论文的所有章节摘要和图表分析后，从一个批判性和全局性的视角，对该论文进行深入的分析。
@@ -210,4 +241,37 @@ DEEP_ANALYZE_PROMPT = """
     }}
 }}
 ```
-""" 
\ No newline at end of file
+""" 
+
+# 用于超长章节分片分析后的归约：将各片段的分析结果合并为一份
+MERGE_SECTION_ANALYSIS_PROMPT = """
+你是一位顶级的科研助理。由于某个章节的原文过长，它被拆分成了若干片段，并已按相同的分析要点分别完成了分析。
+现在请将这些片段的分析结果合并为一份完整、连贯的分析。
+
+**待分析部分:** {section_name}
+
+**分析要点:**
+{analysis_points_str}
+
+**各片段的分析结果（按原文顺序排列）:**
+```json
+{partial_analyses}
+```
+
+**你的任务与输出要求:**
+1.  **针对每一个"分析要点"**，综合所有片段中的相关内容，去除重复，保留关键细节与数据，整理成一段连贯的详细文本。
+2.  如果某个片段中没有与某个要点相关的内容，忽略该片段即可，不要编造内容。
+3.  你的输出必须是 **严格的JSON格式**，不包含任何JSON以外的解释或文字。
+4.  JSON的键（key）是 **"analysis_details"**，其值是一个JSON对象，键为每一个"分析要点"，值为合并后的 **详细文本（字符串）**。
+
+**示例输出格式:**
+```json
+{{
+    "analysis_details": {{
+        "要点1": "合并后的关于分析要点1的详细内容...",
+        "要点2": "合并后的关于分析要点2的详细内容...",
+        "要点3": "合并后的关于分析要点3的详细内容..."
+    }}
+}}
+```
+"""
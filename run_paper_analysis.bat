@@ -8,7 +8,7 @@ REM 用途：自动处理从PDF到分析报告的全部流程
 REM =============================================
 
 REM 默认设置
-set WAIT_TIME=180
+set WAIT_TIME=1800
 set PDF_PATH=
 set SHOW_HELP=0
 
@@ -36,10 +36,12 @@ if not exist "%PDF_PATH%" (
     exit /b 1
 )
 
-REM 获取脚本目录和项目根目录
+REM 转换为绝对路径（后续会切换到脚本目录执行）
+for %%I in ("%PDF_PATH%") do set PDF_PATH=%%~fI
+
+REM 获取脚本目录
 set SCRIPT_DIR=%~dp0
 set SCRIPT_DIR=%SCRIPT_DIR:~0,-1%
-for %%I in ("%SCRIPT_DIR%\..") do set PROJECT_ROOT=%%~fI
 
 REM 提取论文名称
 for %%I in ("%PDF_PATH%") do set PAPER_NAME=%%~nI
@@ -60,7 +62,7 @@ echo PaperAgent 论文分析流程
 echo =====================================================
 echo PDF文件: %PDF_PATH%
 echo 论文名称: %PAPER_NAME%
-echo 等待时间: %WAIT_TIME% 秒
+echo 最长等待时间: %WAIT_TIME% 秒
 echo =====================================================
 
 REM 第1阶段: magic-pdf 预处理
@@ -68,53 +70,31 @@ echo.
 echo === 第1阶段: 使用magic-pdf处理PDF文件 ===
 echo.
 
-REM 修复: 正确设置输出目录
-set OUTPUT_DIR=%SCRIPT_DIR%\pdf_preprocess\output
-echo 输出目录: %OUTPUT_DIR%
-echo 执行命令: magic-pdf -p "%PDF_PATH%" -o "%OUTPUT_DIR%" -m auto
-
-REM 执行magic-pdf (添加引号确保路径正确处理)
-magic-pdf -p "%PDF_PATH%" -o "%OUTPUT_DIR%" -m auto
+REM 由Python驱动运行magic-pdf：检测到进程结束或markdown输出生成后立即进入结构化处理，
+REM 不再固定等待；-w 指定的时间仅作为最长等待时间
+echo 执行命令: python -m pdf_preprocess.preprocess_driver "%PDF_PATH%" --timeout %WAIT_TIME%
+pushd "%SCRIPT_DIR%"
+python -m pdf_preprocess.preprocess_driver "%PDF_PATH%" --timeout %WAIT_TIME%
+set PREPROCESS_EXIT=%ERRORLEVEL%
+popd
 
-if %ERRORLEVEL% NEQ 0 (
+if %PREPROCESS_EXIT% NEQ 0 (
     echo 错误: magic-pdf处理失败!
     exit /b 1
 )
 
 echo.
-echo magic-pdf处理启动成功，等待处理完成...
-
-REM 等待处理完成，显示进度
-for /l %%i in (1,1,%WAIT_TIME%) do (
-    REM 每10秒更新一次进度
-    set /a "mod=%%i %% 10"
-    if !mod! equ 0 (
-        set /a "percent=%%i * 100 / %WAIT_TIME%"
-        echo 处理进度: !percent!%% (%%i/%WAIT_TIME% 秒)
-    )
-    timeout /t 1 /nobreak >nul
-)
+echo magic-pdf处理完成!
 
-echo.
-echo magic-pdf处理等待完成!
-
-REM 第2阶段: 配置并运行main.py分析
+REM 第2阶段: 运行main.py分析
 echo.
 echo === 第2阶段: 执行论文分析流程 ===
 echo.
 
-REM 创建临时main.py文件
-set TEMP_MAIN=%SCRIPT_DIR%\temp_main.py
-copy "%SCRIPT_DIR%\main.py" "%TEMP_MAIN%" >nul
-
-REM 修改配置参数 (Windows中使用临时文件方式)
-powershell -Command "(Get-Content '%TEMP_MAIN%') -replace 'PAPER_NAME = \"example\"', 'PAPER_NAME = \"%PAPER_NAME%\"' | Set-Content '%TEMP_MAIN%'"
-powershell -Command "(Get-Content '%TEMP_MAIN%') -replace 'RUN_ALL_STEPS = False', 'RUN_ALL_STEPS = True' | Set-Content '%TEMP_MAIN%'"
-
-REM 运行分析
+REM 运行分析（通过命令行参数指定论文名称）
 echo 正在运行论文分析流程，这可能需要一段时间...
-pushd "%PROJECT_ROOT%"
-python "%TEMP_MAIN%"
+pushd "%SCRIPT_DIR%"
+python main.py --paper "%PAPER_NAME%"
 popd
 
 REM 检查分析结果
@@ -129,9 +109,6 @@ if exist "%REPORT_PATH%" (
     echo 请检查上述输出以获取更多信息。
 )
 
-REM 清理临时文件
-if exist "%TEMP_MAIN%" del /q "%TEMP_MAIN%"
-
 echo.
 echo =====================================================
 echo 分析流程结束
@@ -143,7 +120,7 @@ echo 用法: run_paper_analysis.bat [选项] <PDF文件路径>
 echo.
 echo 选项:
 echo   -h, --help        显示此帮助信息
-echo   -w, --wait TIME   设置magic-pdf处理等待时间，单位秒（默认180秒）
+echo   -w, --wait TIME   设置magic-pdf处理的最长等待时间，单位秒（默认1800秒）
 echo.
 echo 示例:
 echo   run_paper_analysis.bat "path\to\my paper.pdf"
@@ -11,7 +11,7 @@ show_help() {
     echo ""
     echo "选项:"
     echo "  -h, --help        显示此帮助信息"
-    echo "  -w, --wait TIME   设置magic-pdf处理等待时间，单位秒（默认180秒）"
+    echo "  -w, --wait TIME   设置magic-pdf处理的最长等待时间，单位秒（默认1800秒）"
     echo ""
     echo "示例:"
     echo "  bash run_paper_analysis.sh \"path/to/my paper.pdf\""
@@ -21,7 +21,7 @@ show_help() {
 
 # 处理参数
 PDF_PATH=""
-WAIT_TIME=180
+WAIT_TIME=1800
 
 while [[ $# -gt 0 ]]; do
     case $1 in
@@ -52,9 +52,11 @@ if [ ! -f "$PDF_PATH" ]; then
     exit 1
 fi
 
+# 转换为绝对路径（后续会切换到脚本目录执行）
+PDF_PATH="$(cd "$(dirname "$PDF_PATH")" && pwd)/$(basename "$PDF_PATH")"
+
 # 获取脚本所在目录的绝对路径
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
-PROJECT_ROOT="$(dirname "$SCRIPT_DIR")"
 PAPER_NAME=$(basename "$PDF_PATH" .pdf)
 
 # 清理论文名称（替换不合法字符为下划线）
@@ -65,7 +67,7 @@ echo "PaperAgent 论文分析流程"
 echo "====================================================="
 echo "PDF文件: $PDF_PATH"
 echo "论文名称: $PAPER_NAME"
-echo "等待时间: $WAIT_TIME 秒"
+echo "最长等待时间: $WAIT_TIME 秒"
 echo "====================================================="
 
 # 第1阶段: magic-pdf 预处理
@@ -73,11 +75,12 @@ echo ""
 echo "=== 第1阶段: 使用magic-pdf处理PDF文件 ==="
 echo ""
 
-OUTPUT_DIR="$SCRIPT_DIR/pdf_preprocess/output"
-MAGIC_PDF_CMD="magic-pdf -p \"$PDF_PATH\" -o \"$OUTPUT_DIR\" -m auto"
+# 由Python驱动运行magic-pdf：检测到进程结束或markdown输出生成后立即进入结构化处理，
+# 不再固定等待；-w 指定的时间仅作为最长等待时间
+PREPROCESS_CMD="python -m pdf_preprocess.preprocess_driver \"$PDF_PATH\" --timeout $WAIT_TIME"
 
-echo "执行命令: $MAGIC_PDF_CMD"
-eval $MAGIC_PDF_CMD
+echo "执行命令: $PREPROCESS_CMD"
+(cd "$SCRIPT_DIR" && eval $PREPROCESS_CMD)
 
 if [ $? -ne 0 ]; then
     echo "错误: magic-pdf处理失败!"
@@ -85,42 +88,16 @@ if [ $? -ne 0 ]; then
 fi
 
 echo ""
-echo "magic-pdf处理启动成功，等待处理完成..."
-
-# 等待处理完成，显示进度条
-for ((i=1; i<=$WAIT_TIME; i++)); do
-    # 每10秒更新一次进度
-    if [ $((i % 10)) -eq 0 ] || [ $i -eq $WAIT_TIME ]; then
-        percent=$(echo "scale=1; $i * 100 / $WAIT_TIME" | bc)
-        echo -ne "处理进度: $percent% ($i/$WAIT_TIME 秒)\r"
-    fi
-    sleep 1
-done
-
-echo ""
-echo "magic-pdf处理等待完成!"
+echo "magic-pdf处理完成!"
 
-# 第2阶段: 配置并运行main.py分析
+# 第2阶段: 运行main.py分析
 echo ""
 echo "=== 第2阶段: 执行论文分析流程 ==="
 echo ""
 
-# 创建临时main.py文件
-TEMP_MAIN="$SCRIPT_DIR/temp_main.py"
-cp "$SCRIPT_DIR/main.py" "$TEMP_MAIN"
-
-# 修改配置参数
-if [[ "$OSTYPE" == "darwin"* ]]; then  # macOS
-    sed -i "" "s/PAPER_NAME = \"example\"/PAPER_NAME = \"$PAPER_NAME\"/" "$TEMP_MAIN"
-    sed -i "" "s/RUN_ALL_STEPS = False/RUN_ALL_STEPS = True/" "$TEMP_MAIN"
-else  # Linux and others
-    sed -i "s/PAPER_NAME = \"example\"/PAPER_NAME = \"$PAPER_NAME\"/" "$TEMP_MAIN"
-    sed -i "s/RUN_ALL_STEPS = False/RUN_ALL_STEPS = True/" "$TEMP_MAIN"
-fi
-
-# 运行分析
+# 运行分析（通过命令行参数指定论文名称）
 echo "正在运行论文分析流程，这可能需要一段时间..."
-(cd "$PROJECT_ROOT" && python "$TEMP_MAIN")
+(cd "$SCRIPT_DIR" && python main.py --paper "$PAPER_NAME")
 
 # 检查分析结果
 REPORT_PATH="$SCRIPT_DIR/output/$PAPER_NAME/Final_Report.md"
@@ -134,9 +111,6 @@ else
     echo "请检查上述输出以获取更多信息。"
 fi
 
-# 清理临时文件
-rm -f "$TEMP_MAIN"
-
 echo ""
 echo "====================================================="
 echo "分析流程结束"
@@ -0,0 +1,230 @@
+import os
+import json
+import struct
+import config
+
+# structured_data 的紧凑二进制格式（与 structured_data.json 位于同一目录）：
+#   文件头 | 骨架(JSON) | 偏移表 | 各章节正文(UTF-8)
+# 骨架包含论文标题、preamble 与去掉正文的章节树，每个节点以 "_body" 记录其正文在偏移表中的序号；
+# 偏移表的每一项为 (正文相对于正文区起点的偏移, 字节数)。加载时只解析骨架，正文在首次访问时才读取。
+BINARY_SUFFIX = '.bin'
+_MAGIC = b'PASD'
+_VERSION = 1
+_HEADER = struct.Struct('<4sHQI')  # 魔数, 版本, 骨架字节数, 正文数
+_BODY_ENTRY = struct.Struct('<QI')
+
+class StructuredDataError(RuntimeError):
+    """章节正文无法按需读取（如二进制文件在加载后被替换）。继续分析会把该章节当作空章节，因此直接抛出。"""
+
+def binary_path_for(json_path):
+    return os.path.splitext(json_path)[0] + BINARY_SUFFIX
+
+class _BodyReader:
+    """
+    按偏移表从二进制文件中读取单个章节的正文；文件在加载后被替换时抛出 StructuredDataError，避免读到错位的内容。
+    每次读取都重新打开文件并在读完后关闭，不长期占用句柄（Windows 上被打开的文件无法被 os.replace 替换）。
+    """
+
+    def __init__(self, path, body_start, entries, identity):
+        self.path = path
+        self.body_start = body_start
+        self.entries = entries
+        self.identity = identity
+
+    def read(self, index):
+        offset, length = self.entries[index]
+        try:
+            with open(self.path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if (stat.st_size, stat.st_mtime_ns) != self.identity:
+                    raise StructuredDataError(f"结构化数据文件 {self.path} 在加载后被修改，请重新运行该阶段")
+                f.seek(self.body_start + offset)
+                data = f.read(length)
+        except OSError as e:
+            raise StructuredDataError(f"读取章节正文失败: {self.path}: {e}") from e
+        if len(data) != length:
+            raise StructuredDataError(f"结构化数据文件 {self.path} 被截断，无法读取章节正文")
+        return data.decode('utf-8')
+
+class LazySection(dict):
+    """
+    章节节点：除 content 外的字段在加载时即可用，content 在首次访问时才从文件中读取。
+    按键取值不会触发读取；遍历全部键值（dict(section)、items()、json.dumps 等）时先读取正文，
+    使其行为与包含 content 的普通字典一致。
+    """
+
+    __slots__ = ('_reader', '_body_index')
+
+    def __init__(self, fields, reader, body_index):
+        super().__init__(fields)
+        self._reader = reader
+        self._body_index = body_index
+
+    def _load_content(self):
+        if self._reader is not None:
+            dict.__setitem__(self, 'content', self._reader.read(self._body_index))
+            self._reader = None
+
+    def __getitem__(self, key):
+        if key == 'content':
+            self._load_content()
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key == 'content':
+            self._load_content()
+        return dict.get(self, key, default)
+
+    def pop(self, key, *default):
+        if key == 'content':
+            self._load_content()
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key, default=None):
+        if key == 'content':
+            self._load_content()
+        return dict.setdefault(self, key, default)
+
+    def __contains__(self, key):
+        return key == 'content' or dict.__contains__(self, key)
+
+    def __len__(self):
+        return dict.__len__(self) + (self._reader is not None)
+
+    def keys(self):
+        self._load_content()
+        return dict.keys(self)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        self._load_content()
+        return dict.items(self)
+
+    def values(self):
+        self._load_content()
+        return dict.values(self)
+
+    def copy(self):
+        self._load_content()
+        return dict.copy(self)
+
+    def __eq__(self, other):
+        self._load_content()
+        if isinstance(other, LazySection):
+            other._load_content()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __repr__(self):
+        self._load_content()
+        return dict.__repr__(self)
+
+    def to_dict(self):
+        """转换为普通字典（读取正文），子章节同样转换。"""
+        fields = dict(self.items())
+        fields['subsections'] = [to_plain(section) for section in fields.get('subsections') or []]
+        return fields
+
+def to_plain(section):
+    return section.to_dict() if isinstance(section, LazySection) else section
+
+def encode_structured_data(data):
+    """把结构化数据编码为二进制格式的字节串。"""
+    bodies = []
+
+    def strip_bodies(sections):
+        skeleton = []
+        for section in sections:
+            node = {key: value for key, value in section.items() if key not in ('content', 'subsections')}
+            node['_body'] = len(bodies)
+            bodies.append((section.get('content') or '').encode('utf-8'))
+            node['subsections'] = strip_bodies(section.get('subsections') or [])
+            skeleton.append(node)
+        return skeleton
+
+    skeleton = {key: value for key, value in data.items() if key != 'sections'}
+    skeleton['sections'] = strip_bodies(data.get('sections') or [])
+    skeleton_bytes = json.dumps(skeleton, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    table = []
+    offset = 0
+    for body in bodies:
+        table.append(_BODY_ENTRY.pack(offset, len(body)))
+        offset += len(body)
+    return b''.join([_HEADER.pack(_MAGIC, _VERSION, len(skeleton_bytes), len(bodies)), skeleton_bytes]
+                    + table + bodies)
+
+def _load_binary(bin_path):
+    """加载二进制格式：只解析骨架，章节正文保持未读取。格式不符时抛出 ValueError。"""
+    with open(bin_path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        magic, version, skeleton_size, body_count = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"不支持的结构化数据格式: {magic!r} v{version}")
+        skeleton = json.loads(f.read(skeleton_size).decode('utf-8'))
+        table = f.read(_BODY_ENTRY.size * body_count)
+    entries = [_BODY_ENTRY.unpack_from(table, i * _BODY_ENTRY.size) for i in range(body_count)]
+    body_start = _HEADER.size + skeleton_size + len(table)
+    reader = _BodyReader(bin_path, body_start, entries, (stat.st_size, stat.st_mtime_ns))
+
+    def attach(sections):
+        attached = []
+        for node in sections:
+            body_index = node.pop('_body')
+            node['subsections'] = attach(node.get('subsections') or [])
+            attached.append(LazySection(node, reader, body_index))
+        return attached
+
+    skeleton['sections'] = attach(skeleton.get('sections') or [])
+    return skeleton
+
+def load_structured_data(json_path):
+    """
+    加载论文的结构化数据。同目录下存在不旧于 JSON 的二进制文件时优先读取它（章节正文按需读取），
+    否则读取 JSON。失败时打印错误并返回None。
+    """
+    bin_path = binary_path_for(json_path)
+    try:
+        if os.path.exists(bin_path) and (not os.path.exists(json_path)
+                                         or os.stat(bin_path).st_mtime_ns >= os.stat(json_path).st_mtime_ns):
+            return _load_binary(bin_path)
+    except (OSError, ValueError, struct.error) as e:
+        print(f"警告: 无法读取二进制结构化数据 {bin_path}，改为读取JSON: {e}")
+
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"错误: 找不到结构化数据文件: {json_path}")
+        return None
+    except json.JSONDecodeError:
+        print(f"错误: 解析JSON文件失败: {json_path}")
+        return None
+
+def _write_atomic(path, data, mode):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, mode, **({} if 'b' in mode else {'encoding': 'utf-8'})) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def save_structured_data(data, json_path):
+    """
+    保存结构化数据：总是导出 JSON（供兼容与人工查看），启用 STRUCTURED_DATA_BINARY 时再写入二进制格式。
+    二进制文件在 JSON 之后写入，使其修改时间不早于 JSON。返回是否成功。
+    """
+    try:
+        _write_atomic(json_path, json.dumps(data, indent=4, ensure_ascii=False), 'w')
+        bin_path = binary_path_for(json_path)
+        if config.STRUCTURED_DATA_BINARY:
+            _write_atomic(bin_path, encode_structured_data(data), 'wb')
+        elif os.path.exists(bin_path):
+            os.remove(bin_path)  # 避免残留的旧二进制文件被优先读取
+        return True
+    except IOError as e:
+        print(f"错误: 无法写入结构化数据: {e}")
+        return False
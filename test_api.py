@@ -1,7 +1,7 @@
 import os
 import base64
-from openai import OpenAI
 import config
+from analyzers import model_clients
 
 # --- Helper Functions ---
 
@@ -53,12 +53,9 @@ def test_language_model():
     print(f"使用模型: {config.LLM_MODEL_NAME}")
     print(f"使用URL: {config.LLM_BASE_URL}")
 
-    # 初始化客户端
+    # 初始化客户端（与分析流程使用同一客户端工厂，但不读写响应缓存，确保真正访问了API）
     try:
-        client = OpenAI(
-            api_key=config.LLM_API_KEY,
-            base_url=config.LLM_BASE_URL,
-        )
+        client = model_clients.create_llm_client(use_cache=False)
     except Exception as e:
         print(f"初始化OpenAI客户端时出错: {e}")
         return False
@@ -114,10 +111,7 @@ def test_vision_model():
 
     # 初始化客户端并发送请求
     try:
-        client = OpenAI(
-            api_key=config.VISION_API_KEY,
-            base_url=config.VISION_BASE_URL,
-        )
+        client = model_clients.create_vision_client(use_cache=False)
 
         print("正在向视觉模型发送请求 (使用流式模式)...")
         completion = client.chat.completions.create(
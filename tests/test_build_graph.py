@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+import build_graph
+
+PAPER = 'paper'
+STAGE = {"artifact": "summary.md", "inputs": ["input.txt"], "prompts": [], "model": None}
+
+def _write(name, text):
+    with open(os.path.join('output', PAPER, name), 'w', encoding='utf-8') as f:
+        f.write(text)
+
+@pytest.fixture(autouse=True)
+def paper_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(os.path.join('output', PAPER))
+    _write('input.txt', 'v1')
+
+def _build():
+    """模拟一次成功的阶段执行：记录开始、写出产物、记录完成。"""
+    _, fingerprint = build_graph.check_stage(PAPER, STAGE)
+    build_graph.mark_stage_started(PAPER, STAGE, fingerprint, discard_artifact=False)
+    _write(STAGE["artifact"], 'result')
+    build_graph.mark_stage_complete(PAPER, STAGE)
+
+def test_missing_artifact_resumes():
+    assert build_graph.check_stage(PAPER, STAGE)[0] == 'resume'
+
+def test_completed_artifact_is_fresh():
+    _build()
+    assert build_graph.check_stage(PAPER, STAGE)[0] == 'fresh'
+
+def test_interrupted_stage_resumes():
+    _, fingerprint = build_graph.check_stage(PAPER, STAGE)
+    build_graph.mark_stage_started(PAPER, STAGE, fingerprint, discard_artifact=False)
+    _write(STAGE["artifact"], 'partial')
+    assert build_graph.check_stage(PAPER, STAGE)[0] == 'resume'
+
+def test_artifact_without_build_record_resumes():
+    _write(STAGE["artifact"], 'from an older version')
+    assert build_graph.check_stage(PAPER, STAGE)[0] == 'resume'
+
+def test_changed_input_is_stale():
+    _build()
+    _write('input.txt', 'v2')
+    assert build_graph.check_stage(PAPER, STAGE)[0] == 'stale'
+
+def test_force_is_stale():
+    _build()
+    assert build_graph.check_stage(PAPER, STAGE, force=True)[0] == 'stale'
+
+def test_missing_extra_artifact_resumes():
+    stage = dict(STAGE, extra_artifacts=["summary.json"])
+    _build()
+    assert build_graph.check_stage(PAPER, stage)[0] == 'resume'
+
+def test_stale_artifact_is_discarded_on_start():
+    _build()
+    _write('input.txt', 'v2')
+    state, fingerprint = build_graph.check_stage(PAPER, STAGE)
+    build_graph.mark_stage_started(PAPER, STAGE, fingerprint, discard_artifact=state == 'stale')
+    assert not os.path.exists(os.path.join('output', PAPER, STAGE["artifact"]))
+    assert build_graph.check_stage(PAPER, STAGE)[0] == 'resume'
@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+
+from analyzers import llm_cache
+from analyzers.llm_cache import LLMCache, make_cache_key
+
+class _Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def _cache(tmp_path, monkeypatch, ttl_seconds=0, max_bytes=0):
+    clock = _Clock()
+    monkeypatch.setattr(llm_cache.time, 'time', clock)
+    return LLMCache(str(tmp_path), ttl_seconds=ttl_seconds, max_bytes=max_bytes), clock
+
+def test_miss_then_hit(tmp_path, monkeypatch):
+    cache, _ = _cache(tmp_path, monkeypatch)
+    assert cache.get('k') is None
+    cache.set('k', {"content": "answer"})
+    assert cache.get('k') == {"content": "answer"}
+
+def test_transport_arguments_do_not_change_the_key():
+    request = {"model": "m", "messages": [{"role": "user", "content": "hi"}]}
+    assert make_cache_key(request) == make_cache_key(dict(request, stream=True, stream_options={}))
+    assert make_cache_key(request) != make_cache_key(dict(request, model="other"))
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    cache, clock = _cache(tmp_path, monkeypatch, ttl_seconds=60)
+    cache.set('k', {"content": "answer"})
+    clock.now += 59
+    assert cache.get('k') is not None
+    clock.now += 2
+    assert cache.get('k') is None
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    value = {"content": "x" * 100}
+    cache, clock = _cache(tmp_path, monkeypatch, max_bytes=250)
+    cache.set('a', value)
+    clock.now += 1
+    cache.set('b', value)
+    clock.now += 1
+    assert cache.get('a') is not None  # a 最近被访问过，b 成为最久未使用的条目
+    clock.now += 1
+    cache.set('c', value)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+
+def test_delete_removes_entry(tmp_path, monkeypatch):
+    cache, _ = _cache(tmp_path, monkeypatch)
+    cache.set('k', {"content": "answer"})
+    cache.delete('k')
+    assert cache.get('k') is None
+
+class _FakeCompletions:
+    def __init__(self, finish_reason):
+        self.finish_reason = finish_reason
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        if kwargs.get('stream'):
+            return iter([
+                SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="ans"), finish_reason=None)]),
+                SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="wer"),
+                                                         finish_reason=self.finish_reason)]),
+            ])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="answer"),
+                                                        finish_reason=self.finish_reason)])
+
+def _call_twice(tmp_path, monkeypatch, finish_reason, stream):
+    cache, _ = _cache(tmp_path, monkeypatch)
+    completions = _FakeCompletions(finish_reason)
+    cached = llm_cache._CachedCompletions(completions, cache)
+    texts = []
+    for _ in range(2):
+        response = cached.create(model="m", messages=[], stream=stream)
+        if stream:
+            texts.append("".join(chunk.choices[0].delta.content or "" for chunk in response))
+        else:
+            texts.append(response.choices[0].message.content)
+    return completions.calls, texts
+
+def test_completed_responses_are_served_from_cache(tmp_path, monkeypatch):
+    for stream in (False, True):
+        calls, texts = _call_twice(tmp_path / str(stream), monkeypatch, "stop", stream)
+        assert calls == 1
+        assert texts == ["answer", "answer"]
+
+def test_truncated_responses_are_not_cached(tmp_path, monkeypatch):
+    for stream in (False, True):
+        calls, _ = _call_twice(tmp_path / str(stream), monkeypatch, "length", stream)
+        assert calls == 2
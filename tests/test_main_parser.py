@@ -0,0 +1,18 @@
+from pdf_preprocess.main_parser import find_captioned_images
+
+def _figures(content):
+    return [(figure['path'], figure['type'], figure['number'], figure['caption'])
+            for figure in find_captioned_images(content)]
+
+def test_captions_above_images_are_not_taken_by_the_previous_image():
+    content = "Figure 1: A\n\n![](a.jpg)\n\nFigure 2: B\n\n![](b.jpg)"
+    assert _figures(content) == [('a.jpg', 'Figure', '1', 'A'), ('b.jpg', 'Figure', '2', 'B')]
+
+def test_captions_below_images_separated_by_blank_lines():
+    content = "![](a.jpg)\n\nFigure 1: A\n\n![](b.jpg)\n\nFigure 2: B"
+    assert _figures(content) == [('a.jpg', 'Figure', '1', 'A'), ('b.jpg', 'Figure', '2', 'B')]
+
+def test_dotted_number_is_not_split_at_the_decimal_point():
+    assert _figures("![](a.jpg)\nFigure 3.1 Overview") == []
+    assert _figures("![](a.jpg)\nFigure 3.1: Overview") == [('a.jpg', 'Figure', '3.1', 'Overview')]
+    assert _figures("![](a.jpg)\nFig. 3. Overview") == [('a.jpg', 'Figure', '3', 'Overview')]
@@ -0,0 +1,12 @@
+from analyzers.section_index import strip_numbering
+
+def test_numbering_is_stripped():
+    assert strip_numbering('2.1 overview') == 'overview'
+    assert strip_numbering('3) results') == 'results'
+    assert strip_numbering('iv. experiments') == 'experiments'
+    assert strip_numbering('a. appendix') == 'appendix'
+
+def test_leading_words_are_kept():
+    assert strip_numbering('a survey of methods') == 'a survey of methods'
+    assert strip_numbering('civil rights') == 'civil rights'
+    assert strip_numbering('mix. results') == 'mix. results'